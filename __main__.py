@@ -4,23 +4,211 @@ Created on November 1 2021.
 @author: rhanes
 """
 import argparse
+import json
 import os
-import logging
+import sys
 import time
 
-from local_project import LocalProject
+from config import read_config
+from log_manager import setup_logging
 
 # set up arguments for command line running
 PARSER = argparse.ArgumentParser(description="Generate custom foreground database in Brightway")
-PARSER.add_argument("--data", help="Path to data directory.")
-PARSER.add_argument("--bwconfig", help="Name of local Brightway config file.")
-PARSER.add_argument("--caseconfig", help="Name of local case study config file.")
-
-# Set up logger
-logging.basicConfig(
-    filename=os.path.join(PARSER.parse_args().data, f"autobw-{time.time()}.log"),
-    level=logging.INFO,
+PARSER.add_argument("--data", required=True, help="Path to data directory.")
+PARSER.add_argument(
+    "--bwconfig", required=True, help="Name of local Brightway config file."
+)
+PARSER.add_argument(
+    "--caseconfig", required=True, help="Name of local case study config file."
+)
+PARSER.add_argument(
+    "--verbose",
+    action="store_true",
+    help="Log every processed row in addition to per-stage summaries.",
+)
+PARSER.add_argument(
+    "--serve",
+    action="store_true",
+    help="Keep the project open and accept jobs over HTTP on localhost.",
+)
+PARSER.add_argument(
+    "--snapshot",
+    action="store_true",
+    help="Write snapshots of the include_databases for faster copying, then exit.",
+)
+PARSER.add_argument(
+    "--plan",
+    action="store_true",
+    help="Assemble the foreground database without writing it and save the "
+    "planned changes to plan.json in the data directory.",
+)
+PARSER.add_argument(
+    "--watch",
+    action="store_true",
+    help="Rebuild the foreground database whenever the import file or config "
+    "files change, writing only the changed activities.",
+)
+PARSER.add_argument(
+    "--migrate",
+    metavar="MAPPING",
+    help="Excel file in the data directory with a Migration sheet. Rewrite the "
+    "import files and foreground databases to the new background keys it maps "
+    "to and save a report to migration.json in the data directory.",
+)
+PARSER.add_argument("--port", type=int, help="Port used with --serve (default 8765).")
+PARSER.add_argument(
+    "--processes",
+    type=int,
+    help="Worker processes used to build a list of foreground databases "
+    "(default: number of CPUs).",
 )
 
+
+def check_inputs(args, logging):
+    """
+    Check the config files and the import file before Brightway is imported.
+
+    Importing Brightway and the scientific stack takes several seconds, so
+    problems with the inputs are reported before paying for it. Errors are
+    logged and end the run.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Parsed command line arguments.
+
+    logging
+        logger object for writing status messages to file
+
+    Returns
+    -------
+    Tuple of the Brightway config and the case study config
+    """
+    _bwconfig = read_config(os.path.join(args.data, args.bwconfig), logging=logging)
+    _caseconfig = read_config(os.path.join(args.data, args.caseconfig), logging=logging)
+
+    _data_directory = (_bwconfig.get("fileIO") or {}).get("data_directory")
+    if not _data_directory or not os.path.isdir(_data_directory):
+        logging.error(
+            msg=f"autoBW: fileIO data_directory {_data_directory} is not a directory"
+        )
+        sys.exit('Error: Check log file')
+
+    if not (_caseconfig.get("project_parameters") or {}).get("name"):
+        logging.error(msg="autoBW: No project_parameters name in case study config")
+        sys.exit('Error: Check log file')
+
+    # The service builds foreground databases from its jobs, not its own config,
+    # and snapshots don't need them at all
+    if args.serve or args.snapshot:
+        return _bwconfig, _caseconfig
+
+    # foreground_db is either one foreground database or a list of them
+    _foregrounds = _caseconfig.get("foreground_db") or {}
+    if isinstance(_foregrounds, dict):
+        _foregrounds = [_foregrounds]
+
+    for _foreground in _foregrounds:
+        if not _foreground.get("name"):
+            logging.error(msg="autoBW: No foreground_db name in case study config")
+            sys.exit('Error: Check log file')
+
+        _import_file = os.path.join(
+            _data_directory, _foreground.get("fg_db_import") or ""
+        )
+        if not os.path.isfile(_import_file):
+            logging.error(msg=f"autoBW: {_import_file} is not a file")
+            sys.exit('Error: Check log file')
+
+    if args.migrate and not os.path.isfile(os.path.join(args.data, args.migrate)):
+        logging.error(
+            msg=f"autoBW: {os.path.join(args.data, args.migrate)} is not a file"
+        )
+        sys.exit("Error: Check log file")
+
+    return _bwconfig, _caseconfig
+
+
+def main():
+    """Check inputs, then build, plan, migrate, watch or serve foreground databases."""
+    _args = PARSER.parse_args()
+
+    if not os.path.isdir(_args.data):
+        PARSER.error(f"--data {_args.data} is not a directory")
+
+    # Set up logger
+    _logger = setup_logging(
+        fpath=os.path.join(_args.data, f"autobw-{time.time()}.log"),
+        verbose=_args.verbose,
+    )
+
+    # The configs are only read once; LocalProject reuses them
+    _configs = check_inputs(args=_args, logging=_logger)
+
+    # Brightway is only imported once the inputs are known to be usable
+    # pylint: disable=import-outside-toplevel
+    from local_project import LocalProject
+
+    if _args.plan:
+        _project = LocalProject(
+            parser=PARSER,
+            logging=_logger,
+            args=_args,
+            read_only=True,
+            configs=_configs,
+        )
+        _fpath = os.path.join(_project.file_io["data_directory"], "plan.json")
+        with open(_fpath, "w", encoding="utf-8") as _f:
+            json.dump(_project.plan(), _f, indent=1, default=str)
+        print(f"autoBW plan written to {_fpath}")
+    elif _args.migrate:
+        _project = LocalProject(
+            parser=PARSER, logging=_logger, build=False, args=_args, configs=_configs
+        )
+        _fpath = os.path.join(_project.file_io["data_directory"], "migration.json")
+        with open(_fpath, "w", encoding="utf-8") as _f:
+            json.dump(
+                _project.migrate(mapping=os.path.join(_args.data, _args.migrate)),
+                _f,
+                indent=1,
+                default=str,
+            )
+        print(f"autoBW migration report written to {_fpath}")
+    elif _args.snapshot:
+        LocalProject(
+            parser=PARSER, logging=_logger, build=False, args=_args, configs=_configs
+        ).export_snapshots()
+    elif _args.watch:
+        from watch import Watcher
+
+        Watcher(
+            project=LocalProject(
+                parser=PARSER,
+                logging=_logger,
+                build=False,
+                args=_args,
+                configs=_configs,
+            ),
+            args=_args,
+            logging=_logger,
+        ).run()
+    elif _args.serve:
+        from service import AutoBWService, DEFAULT_PORT
+
+        AutoBWService(
+            project=LocalProject(
+                parser=PARSER,
+                logging=_logger,
+                build=False,
+                args=_args,
+                configs=_configs,
+            ),
+            logging=_logger,
+            port=_args.port or DEFAULT_PORT,
+        ).serve_forever()
+    else:
+        LocalProject(parser=PARSER, logging=_logger, args=_args, configs=_configs)
+
+
 if __name__ == "__main__":
-    LocalProject(parser=PARSER, logging=logging)
+    main()
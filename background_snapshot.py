@@ -0,0 +1,365 @@
+"""
+Created on October 19 2026.
+
+Read-only, memory-mapped snapshots of background databases.
+
+Reading activities from a Brightway project goes through SQLite and unpickles
+every activity and exchange. A snapshot stores a background database once as
+columnar .npy arrays: an activity table, an exchange table, a sorted string
+dictionary that both tables refer to by integer id, and JSON blobs for the
+remaining fields. The arrays are memory-mapped when a snapshot is opened, so
+several autoBW processes reading the same snapshot share it through the OS
+page cache, and only the activities that are looked up are decoded.
+
+A snapshot records the modification time of the database it was taken from
+and is ignored once that database changes.
+
+@author: rhanes
+"""
+import bisect
+import json
+import os
+import shutil
+
+import numpy as np
+import brightway2 as bw
+
+SNAPSHOT_VERSION = 1
+
+MANIFEST = "manifest.json"
+
+# Fields stored as string dictionary ids; everything else goes in the JSON blobs
+ACTIVITY_FIELDS = ("name", "reference product", "unit", "location", "type")
+
+EXCHANGE_FIELDS = ("type",)
+
+MISSING = -1
+
+
+def snapshot_root(file_io):
+    """Return the directory holding all snapshots, given the fileIO config."""
+    return file_io.get("snapshot_directory") or os.path.join(
+        file_io["data_directory"], "snapshots"
+    )
+
+
+def snapshot_directory(root, project, database):
+    """Return the directory holding the snapshot of <database> in <project>."""
+    return os.path.join(root, project, database)
+
+
+def _to_json(value):
+    """Tag tuples, which JSON would otherwise turn into lists."""
+    if isinstance(value, tuple):
+        return {"__tuple__": [_to_json(_v) for _v in value]}
+    if isinstance(value, list):
+        return [_to_json(_v) for _v in value]
+    if isinstance(value, dict):
+        return {_k: _to_json(_v) for _k, _v in value.items()}
+    return value
+
+
+def _from_json(obj):
+    """Restore tuples tagged by _to_json."""
+    if len(obj) == 1 and "__tuple__" in obj:
+        return tuple(obj["__tuple__"])
+    return obj
+
+
+def _pack(chunks):
+    """Concatenate byte strings into one array with offsets."""
+    _offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    np.cumsum([len(_c) for _c in chunks], out=_offsets[1:])
+    return np.frombuffer(b"".join(chunks), dtype=np.uint8), _offsets
+
+
+class _Strings:
+    """Sequence view of the string dictionary, decoded on access."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i] : self.offsets[i + 1]]).decode("utf-8")
+
+    def find(self, value):
+        """Return the id of <value>, or MISSING."""
+        # Ids are assigned in sorted order, so the dictionary can be bisected
+        _i = bisect.bisect_left(self, value)
+        if _i < len(self) and self[_i] == value:
+            return _i
+        return MISSING
+
+
+def export_snapshot(database, root, project):
+    """
+    Write a snapshot of the Brightway database <database> in the current project.
+
+    The snapshot is written to a temporary directory and moved into place when
+    complete, so readers never see a partial snapshot.
+
+    Parameters
+    ----------
+    database : str
+        Name of the Brightway database.
+
+    root : path
+        Directory holding all snapshots.
+
+    project : str
+        Name of the Brightway project, used to separate snapshots of databases
+        with the same name in different projects.
+
+    Returns
+    -------
+    Dictionary with the snapshot manifest
+    """
+    _modified = bw.databases[database].get("modified")
+
+    # One pass through SQLite; the activities are sorted by code for lookups
+    _data = sorted(bw.Database(database).load().items(), key=lambda _i: _i[0][1])
+
+    _strings = set()
+    for (_, _code), _act in _data:
+        _strings.add(_code)
+        _strings.update(
+            _act[_f] for _f in ACTIVITY_FIELDS if isinstance(_act.get(_f), str)
+        )
+        for _ex in _act.get("exchanges", []):
+            _strings.update(_ex["input"])
+            _strings.update(
+                _ex[_f] for _f in EXCHANGE_FIELDS if isinstance(_ex.get(_f), str)
+            )
+    _strings = sorted(_strings)
+    _ids = {_s: _i for _i, _s in enumerate(_strings)}
+
+    def _column(rows, field):
+        return np.array(
+            [
+                _ids[_r[field]] if isinstance(_r.get(field), str) else MISSING
+                for _r in rows
+            ],
+            dtype=np.int32,
+        )
+
+    _acts = [_act for _, _act in _data]
+    _exchanges = [_ex for _act in _acts for _ex in _act.get("exchanges", [])]
+
+    _arrays = {
+        "activity_code": np.array(
+            [_ids[_code] for (_, _code), _ in _data], dtype=np.int32
+        ),
+        # Exchange rows of activity i run from activity_exchanges[i] to [i + 1]
+        "activity_exchanges": np.zeros(len(_acts) + 1, dtype=np.int64),
+        "exchange_input_database": np.array(
+            [_ids[_ex["input"][0]] for _ex in _exchanges], dtype=np.int32
+        ),
+        "exchange_input_code": np.array(
+            [_ids[_ex["input"][1]] for _ex in _exchanges], dtype=np.int32
+        ),
+        "exchange_amount": np.array(
+            [_ex.get("amount", np.nan) for _ex in _exchanges], dtype=np.float64
+        ),
+    }
+    np.cumsum(
+        [len(_act.get("exchanges", [])) for _act in _acts],
+        out=_arrays["activity_exchanges"][1:],
+    )
+    for _field in ACTIVITY_FIELDS:
+        _arrays[f"activity_{_field.replace(' ', '_')}"] = _column(_acts, _field)
+    for _field in EXCHANGE_FIELDS:
+        _arrays[f"exchange_{_field}"] = _column(_exchanges, _field)
+
+    # Fields that aren't columns are kept as JSON, decoded per activity
+    _arrays["activity_extra"], _arrays["activity_extra_offsets"] = _pack(
+        [
+            json.dumps(
+                _to_json(
+                    {
+                        _k: _v
+                        for _k, _v in _act.items()
+                        if _k not in ("exchanges", "database", "code")
+                        and not (_k in ACTIVITY_FIELDS and isinstance(_v, str))
+                    }
+                ),
+                default=str,
+            ).encode("utf-8")
+            for _act in _acts
+        ]
+    )
+    _arrays["exchange_extra"], _arrays["exchange_extra_offsets"] = _pack(
+        [
+            json.dumps(
+                _to_json(
+                    {
+                        _k: _v
+                        for _k, _v in _ex.items()
+                        if _k not in ("input", "output", "amount")
+                        and not (_k in EXCHANGE_FIELDS and isinstance(_v, str))
+                    }
+                ),
+                default=str,
+            ).encode("utf-8")
+            for _ex in _exchanges
+        ]
+    )
+    _arrays["strings"], _arrays["string_offsets"] = _pack(
+        [_s.encode("utf-8") for _s in _strings]
+    )
+
+    _manifest = {
+        "version": SNAPSHOT_VERSION,
+        "project": project,
+        "database": database,
+        "modified": _modified,
+        "activities": len(_acts),
+        "exchanges": len(_exchanges),
+        "strings": len(_strings),
+    }
+
+    _directory = snapshot_directory(root=root, project=project, database=database)
+    _tmp = f"{_directory}.tmp-{os.getpid()}"
+    shutil.rmtree(_tmp, ignore_errors=True)
+    os.makedirs(_tmp)
+
+    for _name, _array in _arrays.items():
+        np.save(os.path.join(_tmp, f"{_name}.npy"), _array)
+    with open(os.path.join(_tmp, MANIFEST), "w", encoding="utf-8") as _f:
+        json.dump(_manifest, _f, indent=1)
+
+    shutil.rmtree(_directory, ignore_errors=True)
+    os.replace(_tmp, _directory)
+
+    return _manifest
+
+
+class BackgroundSnapshot:
+    """
+    Memory-mapped snapshot of one background database.
+
+    Activities are returned in the same dictionary (pre-import) format as
+    Brightway's Database.load, with their exchanges.
+    """
+
+    def __init__(self, directory):
+        """
+        Map the snapshot arrays in <directory>.
+
+        Parameters
+        ----------
+        directory : path
+            Snapshot directory written by export_snapshot.
+        """
+        with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as _f:
+            self.manifest = json.load(_f)
+
+        if self.manifest.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"{directory}: snapshot version {self.manifest.get('version')} is "
+                f"not {SNAPSHOT_VERSION}"
+            )
+
+        self.database = self.manifest["database"]
+
+        self.arrays = {
+            _fname[:-4]: np.load(os.path.join(directory, _fname), mmap_mode="r")
+            for _fname in os.listdir(directory)
+            if _fname.endswith(".npy")
+        }
+        self.strings = _Strings(
+            data=self.arrays["strings"], offsets=self.arrays["string_offsets"]
+        )
+
+    def is_fresh(self):
+        """Return True if the database hasn't changed since the snapshot was taken."""
+        return (
+            self.database in bw.databases
+            and bw.databases[self.database].get("modified") == self.manifest["modified"]
+        )
+
+    def __len__(self):
+        return self.manifest["activities"]
+
+    def _row(self, code):
+        _id = self.strings.find(code)
+        if _id == MISSING:
+            return None
+
+        _codes = self.arrays["activity_code"]
+        _row = int(np.searchsorted(_codes, _id))
+        if _row < len(_codes) and _codes[_row] == _id:
+            return _row
+        return None
+
+    def __contains__(self, code):
+        return self._row(code) is not None
+
+    def _extra(self, table, row):
+        _offsets = self.arrays[f"{table}_extra_offsets"]
+        return json.loads(
+            bytes(self.arrays[f"{table}_extra"][_offsets[row] : _offsets[row + 1]]),
+            object_hook=_from_json,
+        )
+
+    def get(self, code):
+        """
+        Return the activity with <code> and its exchanges.
+
+        Parameters
+        ----------
+        code : str
+            Activity code in the snapshot database.
+
+        Returns
+        -------
+        Activity dictionary with an exchanges list. Raises KeyError if there is
+        no activity with <code>.
+        """
+        _row = self._row(code)
+        if _row is None:
+            raise KeyError(f"{code} is not in the {self.database} snapshot")
+
+        _activity = self._extra("activity", _row)
+        for _field in ACTIVITY_FIELDS:
+            _id = self.arrays[f"activity_{_field.replace(' ', '_')}"][_row]
+            if _id != MISSING:
+                _activity[_field] = self.strings[_id]
+        _activity["database"] = self.database
+        _activity["code"] = code
+
+        _start, _stop = self.arrays["activity_exchanges"][_row : _row + 2]
+        _activity["exchanges"] = []
+        for _i in range(_start, _stop):
+            _exchange = self._extra("exchange", _i)
+            _exchange["input"] = (
+                self.strings[self.arrays["exchange_input_database"][_i]],
+                self.strings[self.arrays["exchange_input_code"][_i]],
+            )
+            _exchange["output"] = (self.database, code)
+            _exchange["amount"] = float(self.arrays["exchange_amount"][_i])
+            for _field in EXCHANGE_FIELDS:
+                _id = self.arrays[f"exchange_{_field}"][_i]
+                if _id != MISSING:
+                    _exchange[_field] = self.strings[_id]
+            _activity["exchanges"].append(_exchange)
+
+        return _activity
+
+
+def open_snapshot(root, project, database):
+    """
+    Return the snapshot of <database> in <project>, or None if there isn't one.
+
+    Snapshots that can't be read, e.g. because they were written by another
+    version, are treated as missing. The caller checks freshness.
+    """
+    try:
+        return BackgroundSnapshot(
+            directory=snapshot_directory(root=root, project=project, database=database)
+        )
+    except (OSError, ValueError):
+        return None
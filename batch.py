@@ -0,0 +1,311 @@
+"""
+Created on October 19 2026.
+
+Build several foreground databases in one run.
+
+Foreground databases are read and assembled concurrently in worker processes,
+since that work is CPU-bound pandas and dictionary processing. Assembled
+databases are sent back to the parent process, which is the only process that
+writes to the project's SQLite database. A foreground database that depends on
+another one in the batch is only assembled once its dependencies are written.
+
+@author: rhanes
+"""
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+import brightway2 as bw
+
+from log_manager import LOGGER_NAME, forward_records, worker_logging
+from project_session import ProjectSession
+from shards import write_foreground
+
+
+def _init_worker(log_queue, level, project):
+    """Set up logging and the current Brightway project in a worker process."""
+    worker_logging(log_queue=log_queue, level=level)
+    bw.projects.set_current(project)
+
+
+def _assemble(prj_dict, fg_dict, file_io):
+    """
+    Assemble one foreground database in a worker process without writing it.
+
+    Returns
+    -------
+    Dictionary with the assembled database, the names of databases it refers to,
+    and an error message if the assembly stopped.
+    """
+    # pylint: disable=import-outside-toplevel
+    from foreground_database import ForegroundDatabase
+
+    _start = time.perf_counter()
+    _result = {"name": fg_dict.get("name"), "error": None}
+
+    try:
+        # Only the parent process sets the SQLite pragmas and writes
+        _fdb = ForegroundDatabase(
+            logging=logging.getLogger(LOGGER_NAME),
+            prj_dict=prj_dict,
+            fg_dict=fg_dict,
+            file_io=file_io,
+            write=False,
+            session=ProjectSession(
+                name=prj_dict.get("name"),
+                logging=logging.getLogger(LOGGER_NAME),
+                read_only=True,
+            ),
+        )
+    except SystemExit as _e:
+        # Errors are logged before ForegroundDatabase exits
+        _result["error"] = str(_e)
+    else:
+        _result["custom_db"] = _fdb.custom_db
+        _result["shards"] = _fdb.shards
+        _result["references"] = set(
+            _fdb.add_exchanges_data.exchange_database.dropna().unique()
+        ) | set(_fdb.copy_activities_data.source_database.dropna().unique())
+
+    _result["assemble"] = time.perf_counter() - _start
+
+    return _result
+
+
+class BatchBuild:
+    """
+    Build a list of foreground databases in parallel.
+
+    Each foreground database in the list has the same keys as a single
+    foreground_db in the case study config, plus an optional ``depends_on``
+    list of other foreground databases in the batch that it links to or copies
+    from. Those are written before it is assembled.
+    """
+
+    def __init__(self, project, foregrounds, logging, processes=None):
+        """
+        Check the batch for missing or circular dependencies.
+
+        Parameters
+        ----------
+        project : LocalProject
+            Opened project the foreground databases are written to.
+
+        foregrounds : list
+            List of foreground_db dictionaries.
+
+        logging
+            logger object for writing status messages to file
+
+        processes : int
+            Number of worker processes. Defaults to the number of CPUs.
+        """
+        self.project = project
+        self.logging = logging
+        self.processes = processes or os.cpu_count()
+
+        self.foregrounds = {_fg.get("name"): _fg for _fg in foregrounds}
+        if len(self.foregrounds) != len(foregrounds):
+            self.logging.error(
+                msg="BatchBuild: Foreground database names in the batch are not unique"
+            )
+            sys.exit("Error: Check log file")
+
+        self.depends_on = {
+            _name: set(_fg.get("depends_on") or [])
+            for _name, _fg in self.foregrounds.items()
+        }
+
+        # Dependencies outside the batch must already be in the project
+        _external = {
+            _dep
+            for _deps in self.depends_on.values()
+            for _dep in _deps
+            if _dep not in self.foregrounds
+        }
+        _missing = [_db for _db in _external if _db not in project.session.databases]
+        if _missing:
+            self.logging.error(
+                msg=f"BatchBuild: Dependencies {_missing} are not in the batch or "
+                f"the project"
+            )
+            sys.exit("Error: Check log file")
+
+        # Remove foreground databases without dependencies until none are left;
+        # anything remaining is part of a cycle
+        _remaining = {
+            _name: _deps & set(self.foregrounds)
+            for _name, _deps in self.depends_on.items()
+        }
+        while True:
+            _free = {_name for _name, _deps in _remaining.items() if not _deps}
+            if not _free:
+                break
+            _remaining = {
+                _name: _deps - _free
+                for _name, _deps in _remaining.items()
+                if _name not in _free
+            }
+        if _remaining:
+            self.logging.error(
+                msg=f"BatchBuild: Circular dependencies between {sorted(_remaining)}"
+            )
+            sys.exit("Error: Check log file")
+
+        self.summary = pd.DataFrame()
+
+    def run(self):
+        """
+        Assemble all foreground databases and write them one at a time.
+
+        A foreground database is skipped if one of its dependencies fails.
+        Failures are logged and recorded in the summary; they don't stop the
+        rest of the batch.
+
+        Returns
+        -------
+        DataFrame with one row per foreground database: status, timings,
+        activity and exchange counts, and error message.
+        """
+        _rows = {
+            _name: {
+                "database": _name,
+                "status": "pending",
+                "assemble": None,
+                "write": None,
+                "activities": None,
+                "exchanges": None,
+                "error": None,
+            }
+            for _name in self.foregrounds
+        }
+
+        _pending = dict(self.foregrounds)
+        _written = set()
+        _running = {}
+
+        def _fail(name, error):
+            _rows[name].update({"status": "failed", "error": error})
+            self.logging.error(msg=f"BatchBuild: {name} failed: {error}")
+
+        def _submit_ready(pool):
+            _changed = True
+            while _changed:
+                _changed = False
+                for _name in list(_pending):
+                    _deps = self.depends_on[_name] & set(self.foregrounds)
+                    _failed = [
+                        _dep for _dep in _deps if _rows[_dep]["status"] == "failed"
+                    ]
+                    if _failed:
+                        _fail(_name, f"dependencies {_failed} failed")
+                        del _pending[_name]
+                        _changed = True
+                    elif _deps <= _written:
+                        _fg = dict(_pending.pop(_name))
+                        # Saved copies would otherwise overwrite each other
+                        _fg.setdefault("save_prefix", f"{_name}_")
+                        _future = pool.submit(
+                            _assemble,
+                            prj_dict=self.project.proj_params,
+                            fg_dict=_fg,
+                            file_io=self.project.file_io,
+                        )
+                        _running[_future] = _name
+                        _rows[_name]["status"] = "running"
+
+        # Workers are started fresh rather than forked, so they don't share
+        # the parent's open SQLite connections
+        _context = multiprocessing.get_context("spawn")
+        _log_queue = _context.Queue()
+        _listener = forward_records(log_queue=_log_queue)
+
+        _start = time.perf_counter()
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(self.processes, len(self.foregrounds)),
+                mp_context=_context,
+                initializer=_init_worker,
+                initargs=(
+                    _log_queue,
+                    logging.getLogger().getEffectiveLevel(),
+                    self.project.proj_params.get("name"),
+                ),
+            ) as _pool:
+                _submit_ready(_pool)
+
+                while _running:
+                    _done, _ = wait(_running, return_when=FIRST_COMPLETED)
+                    for _future in _done:
+                        _name = _running.pop(_future)
+                        try:
+                            _result = _future.result()
+                        except Exception as _e:  # pylint: disable=broad-except
+                            _fail(_name, repr(_e))
+                            continue
+
+                        _rows[_name]["assemble"] = _result["assemble"]
+                        if _result["error"]:
+                            _fail(_name, _result["error"])
+                            continue
+
+                        _undeclared = (
+                            (_result["references"] & set(self.foregrounds))
+                            - self.depends_on[_name]
+                            - {_name}
+                        )
+                        if _undeclared:
+                            _fail(
+                                _name,
+                                f"refers to {sorted(_undeclared)}, which are not "
+                                f"listed in depends_on",
+                            )
+                            continue
+
+                        # Only this process writes to the project
+                        _write_start = time.perf_counter()
+                        try:
+                            write_foreground(
+                                session=self.project.session,
+                                name=_name,
+                                custom_db=_result["custom_db"],
+                                shards=_result["shards"],
+                                logging=self.logging,
+                            )
+                        except Exception as _e:  # pylint: disable=broad-except
+                            _fail(_name, repr(_e))
+                            continue
+
+                        _rows[_name].update(
+                            {
+                                "status": "written",
+                                "write": time.perf_counter() - _write_start,
+                                "activities": len(_result["custom_db"]),
+                                "exchanges": sum(
+                                    len(_act["exchanges"])
+                                    for _act in _result["custom_db"].values()
+                                ),
+                            }
+                        )
+                        _written.add(_name)
+
+                    _submit_ready(_pool)
+        finally:
+            _listener.stop()
+
+        self.summary = pd.DataFrame(list(_rows.values())).astype(
+            {"activities": "Int64", "exchanges": "Int64"}
+        )
+
+        self.logging.info(
+            msg=f"BatchBuild: {len(_written)} of {len(self.foregrounds)} foreground "
+            f"databases written in {time.perf_counter() - _start:.1f} s\n"
+            f"{self.summary.to_string(index=False)}"
+        )
+
+        return self.summary
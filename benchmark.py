@@ -0,0 +1,682 @@
+"""
+Created on October 19 2026.
+
+Benchmark suite for the autoBW pipeline.
+
+Generates synthetic import workbooks and a synthetic, offline Brightway project
+(fake biosphere and ecoinvent databases) of configurable size, times every
+pipeline stage at several scales and appends the results to a JSON lines file
+so that runs can be compared across commits.
+
+@author: rhanes
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_manager import CreateActivities, AddExchanges, CopyActivities, DeleteExchanges
+from log_manager import setup_logging
+
+# Names used for the synthetic databases. The background names match the
+# defaults in caseconfig.yaml so that generated workbooks look like real ones.
+FOREGROUND_NAME = "benchmark foreground"
+BIOSPHERE_NAME = "biosphere3"
+ECOINVENT_NAME = "ecoinvent 3.8 cut-off"
+
+# Pipeline stages timed on every run, in execution order
+STAGES = (
+    "load",
+    "copy_activities",
+    "delete_exchanges",
+    "add_exchanges",
+    "canonicalize_exchanges",
+    "validate",
+    "foreground_total",
+    "write",
+)
+
+# Command line start-up costs, timed in fresh interpreters
+STARTUP_STAGES = ("cli_help", "cli_bad_config", "import_local_project")
+
+# Directory holding __main__.py and the autoBW modules
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def generate_workbook(
+    fpath,
+    n_activities,
+    n_exchanges,
+    n_copies,
+    n_deletes,
+    n_background,
+    n_biosphere,
+    seed=0,
+):
+    """
+    Write a synthetic import workbook in the import_template.xlsx format.
+
+    Parameters
+    ----------
+    fpath : path
+        Location of the XLSX file to create.
+
+    n_activities : int
+        Number of rows in Create Activities.
+
+    n_exchanges : int
+        Number of exchanges added to each created activity, in addition to its
+        production exchange. Exchanges are split between foreground, background
+        technosphere and biosphere inputs.
+
+    n_copies : int
+        Number of background activities listed in Copy Activities.
+
+    n_deletes : int
+        Number of exchanges removed from copied activities in Delete Exchanges.
+
+    n_background : int
+        Number of activities in the synthetic ecoinvent database.
+
+    n_biosphere : int
+        Number of flows in the synthetic biosphere database.
+
+    seed : int
+        Seed for the random number generator.
+
+    Returns
+    -------
+    Dictionary of row counts per sheet.
+    """
+    _rng = np.random.default_rng(seed)
+
+    _codes = np.array([f"fg{_i:07d}" for _i in range(n_activities)])
+
+    # Activity database is left empty so that it is backfilled from the config,
+    # as it would be in a hand-made workbook.
+    _create = pd.DataFrame(
+        {
+            "activity_database": np.nan,
+            "activity_type": "process",
+            "activity": [f"synthetic activity {_i}" for _i in range(n_activities)],
+            "reference_product": [
+                f"synthetic product {_i}" for _i in range(n_activities)
+            ],
+            "reference_product_amount": 1.0,
+            "reference_product_unit": "kilogram",
+            "std_dev": np.nan,
+            "activity_location": "US",
+            "activity_version": 1.0,
+            "code": _codes,
+            "notes": "synthetic",
+        }
+    )
+
+    # Every created activity gets its own production exchange followed by
+    # n_exchanges inputs drawn from the foreground, ecoinvent and biosphere.
+    _out = np.repeat(np.arange(n_activities), n_exchanges + 1)
+    _kind = _rng.choice(
+        ["foreground", "technosphere", "biosphere"],
+        size=(n_activities, n_exchanges + 1),
+        p=[0.3, 0.4, 0.3],
+    )
+    _kind[:, 0] = "production"
+    _kind = _kind.ravel()
+
+    _fg_in = _rng.integers(0, n_activities, size=_out.size)
+    _ei_in = _rng.integers(0, n_background, size=_out.size)
+    _bio_in = _rng.integers(0, n_biosphere, size=_out.size)
+
+    _exchange_code = np.select(
+        [_kind == "production", _kind == "foreground", _kind == "technosphere"],
+        [_codes[_out], _codes[_fg_in], np.char.add("ei", _ei_in.astype(str))],
+        default=np.char.add("bio", _bio_in.astype(str)),
+    )
+    _exchange = np.select(
+        [_kind == "production", _kind == "foreground", _kind == "technosphere"],
+        [
+            np.char.add("synthetic product ", _out.astype(str)),
+            np.char.add("synthetic product ", _fg_in.astype(str)),
+            np.char.add("background product ", _ei_in.astype(str)),
+        ],
+        default=np.char.add("flow ", _bio_in.astype(str)),
+    )
+
+    _add = pd.DataFrame(
+        {
+            "activity_database": np.nan,
+            "exchange_database": np.select(
+                [_kind == "technosphere", _kind == "biosphere"],
+                [ECOINVENT_NAME, BIOSPHERE_NAME],
+                default="",
+            ),
+            "activity": np.char.add("synthetic activity ", _out.astype(str)),
+            "activity_code": _codes[_out],
+            "activity_location": "US",
+            "exchange": _exchange,
+            "amount": _rng.random(_out.size).round(6),
+            "unit": "kilogram",
+            "exchange_location": "US",
+            "exchange_type": np.where(_kind == "foreground", "technosphere", _kind),
+            "exchange_code": _exchange_code,
+        }
+    )
+    # Foreground exchange databases are backfilled from the config
+    _add.loc[_add.exchange_database == "", "exchange_database"] = np.nan
+
+    # Data.validate rejects empty sheets, so always keep at least one row
+    _copy_codes = _rng.choice(
+        n_background, size=max(1, min(n_copies, n_background)), replace=False
+    )
+    _copy = pd.DataFrame(
+        {
+            "source_database": ECOINVENT_NAME,
+            "activity": [f"background activity {_i}" for _i in _copy_codes],
+            "activity_code": [f"ei{_i}" for _i in _copy_codes],
+            "destination_database": FOREGROUND_NAME,
+        }
+    )
+
+    # Synthetic background activities always use the next activity as their
+    # first technosphere input, so deletions can be targeted without a lookup.
+    _del_codes = _copy_codes[: max(1, n_deletes)]
+    _delete = pd.DataFrame(
+        {
+            "activity_database": np.nan,
+            "activity": [f"background activity {_i}" for _i in _del_codes],
+            "activity_code": [f"ei{_i}" for _i in _del_codes],
+            "exchange_database": ECOINVENT_NAME,
+            "exchange": [
+                f"background product {(_i + 1) % n_background}" for _i in _del_codes
+            ],
+            "exchange_code": [f"ei{(_i + 1) % n_background}" for _i in _del_codes],
+            "notes": "synthetic",
+        }
+    )
+
+    # pylint: disable-next=abstract-class-instantiated
+    with pd.ExcelWriter(fpath) as _writer:
+        _create.to_excel(_writer, sheet_name="Create Activities", index=False)
+        _add.to_excel(_writer, sheet_name="Add Exchanges", index=False)
+        _copy.to_excel(_writer, sheet_name="Copy Activities", index=False)
+        _delete.to_excel(_writer, sheet_name="Delete Exchanges", index=False)
+
+    return {
+        "rows_create_activities": len(_create),
+        "rows_add_exchanges": len(_add),
+        "rows_copy_activities": len(_copy),
+        "rows_delete_exchanges": len(_delete),
+    }
+
+
+def generate_background(n_background, n_biosphere, n_exchanges, seed=0):
+    """
+    Write synthetic biosphere and ecoinvent databases to the current project.
+
+    Each background activity has a production exchange, a technosphere input
+    from the next activity and n_exchanges - 1 further inputs drawn at random
+    from the background and biosphere.
+
+    Parameters
+    ----------
+    n_background : int
+        Number of activities in the synthetic ecoinvent database.
+
+    n_biosphere : int
+        Number of flows in the synthetic biosphere database.
+
+    n_exchanges : int
+        Number of inputs per background activity.
+
+    seed : int
+        Seed for the random number generator.
+    """
+    import brightway2 as bw  # pylint: disable=import-outside-toplevel
+
+    _rng = np.random.default_rng(seed)
+
+    bw.Database(BIOSPHERE_NAME).write(
+        {
+            (BIOSPHERE_NAME, f"bio{_i}"): {
+                "name": f"flow {_i}",
+                "unit": "kilogram",
+                "categories": ("air",),
+                "type": "emission",
+            }
+            for _i in range(n_biosphere)
+        }
+    )
+
+    _ecoinvent = {}
+    for _i in range(n_background):
+        _key = (ECOINVENT_NAME, f"ei{_i}")
+        _exchanges = [
+            {"input": _key, "output": _key, "amount": 1.0, "type": "production"},
+            {
+                "input": (ECOINVENT_NAME, f"ei{(_i + 1) % n_background}"),
+                "output": _key,
+                "amount": float(_rng.random()),
+                "type": "technosphere",
+            },
+        ]
+        for _j in range(max(0, n_exchanges - 1)):
+            if _rng.random() < 0.5:
+                _input = (ECOINVENT_NAME, f"ei{_rng.integers(n_background)}")
+                _type = "technosphere"
+            else:
+                _input = (BIOSPHERE_NAME, f"bio{_rng.integers(n_biosphere)}")
+                _type = "biosphere"
+            _exchanges.append(
+                {
+                    "input": _input,
+                    "output": _key,
+                    "amount": float(_rng.random()),
+                    "type": _type,
+                }
+            )
+        _ecoinvent[_key] = {
+            "name": f"background activity {_i}",
+            "reference product": f"background product {_i}",
+            "unit": "kilogram",
+            "location": "GLO",
+            "exchanges": _exchanges,
+        }
+
+    bw.Database(ECOINVENT_NAME).write(_ecoinvent)
+
+
+def timed_foreground_database():
+    """
+    Return a ForegroundDatabase subclass that records the duration of each stage.
+
+    The subclass is built on demand because foreground_database imports
+    Brightway, which must not happen before BRIGHTWAY2_DIR is set.
+    """
+    # pylint: disable=import-outside-toplevel
+    from foreground_database import ForegroundDatabase
+
+    class TimedForegroundDatabase(ForegroundDatabase):
+        """ForegroundDatabase with per-stage wall clock timings."""
+
+        def __init__(self, *args, **kwargs):
+            """Run the pipeline and store stage timings in self.timings."""
+            self.timings = {}
+            _start = time.perf_counter()
+            super().__init__(*args, **kwargs)
+            self.timings["foreground_total"] = time.perf_counter() - _start
+
+        def _timed(self, stage, method, *args, **kwargs):
+            _start = time.perf_counter()
+            _out = method(*args, **kwargs)
+            self.timings[stage] = time.perf_counter() - _start
+            return _out
+
+        def copy_activities(self, to_db):
+            """Time ForegroundDatabase.copy_activities."""
+            return self._timed("copy_activities", super().copy_activities, to_db=to_db)
+
+        def delete_exchanges(self):
+            """Time ForegroundDatabase.delete_exchanges."""
+            return self._timed("delete_exchanges", super().delete_exchanges)
+
+        def add_exchanges(self):
+            """Time ForegroundDatabase.add_exchanges."""
+            return self._timed("add_exchanges", super().add_exchanges)
+
+        def canonicalize_exchanges(self):
+            """Time ForegroundDatabase.canonicalize_exchanges."""
+            return self._timed("canonicalize_exchanges", super().canonicalize_exchanges)
+
+        def validate(self):
+            """Time ForegroundDatabase.validate."""
+            return self._timed("validate", super().validate)
+
+        def write_foreground_db(self, name):
+            """Time ForegroundDatabase.write_foreground_db."""
+            return self._timed("write", super().write_foreground_db, name=name)
+
+    return TimedForegroundDatabase
+
+
+def run_scale(
+    logger, workdir, n_activities, n_exchanges, n_background, repeat=3, seed=0
+):
+    """
+    Time every pipeline stage for one synthetic workbook size.
+
+    Parameters
+    ----------
+    logger
+        Logger passed to ForegroundDatabase.
+
+    workdir : path
+        Directory holding the Brightway data directory, workbooks and log files.
+
+    n_activities : int
+        Number of activities created in the foreground database.
+
+    n_exchanges : int
+        Number of exchanges added to each created activity.
+
+    n_background : int
+        Number of activities in the synthetic ecoinvent database.
+
+    repeat : int
+        Number of timed repetitions. The median of each stage is reported.
+
+    seed : int
+        Seed for the random number generators.
+
+    Returns
+    -------
+    Dictionary of median stage timings in seconds, plus workload row counts.
+    """
+    import brightway2 as bw  # pylint: disable=import-outside-toplevel
+
+    _n_biosphere = max(10, n_background // 2)
+
+    # Background databases are reused between runs of the same size
+    bw.projects.set_current(f"autoBW benchmark {n_background}")
+    if not {BIOSPHERE_NAME, ECOINVENT_NAME}.issubset(bw.databases):
+        generate_background(
+            n_background=n_background,
+            n_biosphere=_n_biosphere,
+            n_exchanges=n_exchanges,
+            seed=seed,
+        )
+
+    _fpath = os.path.join(workdir, f"benchmark_{n_activities}x{n_exchanges}.xlsx")
+    _rows = generate_workbook(
+        fpath=_fpath,
+        n_activities=n_activities,
+        n_exchanges=n_exchanges,
+        n_copies=max(1, n_activities // 10),
+        n_deletes=max(1, n_activities // 20),
+        n_background=n_background,
+        n_biosphere=_n_biosphere,
+        seed=seed,
+    )
+
+    _foreground_class = timed_foreground_database()
+
+    _samples = {_stage: [] for _stage in STAGES}
+    for _ in range(repeat):
+        _start = time.perf_counter()
+        for _data in (CreateActivities, AddExchanges, CopyActivities, DeleteExchanges):
+            _data(fpath=_fpath, config={"name": FOREGROUND_NAME})
+        _samples["load"].append(time.perf_counter() - _start)
+
+        _fdb = _foreground_class(
+            logging=logger,
+            prj_dict={"name": bw.projects.current},
+            fg_dict={
+                "name": FOREGROUND_NAME,
+                "fg_db_import": os.path.basename(_fpath),
+                "generate_keys": False,
+                "save_db": False,
+            },
+            file_io={"data_directory": workdir},
+        )
+        for _stage, _seconds in _fdb.timings.items():
+            _samples[_stage].append(_seconds)
+
+    _result = {
+        _stage: statistics.median(_values)
+        for _stage, _values in _samples.items()
+        if _values
+    }
+    _result.update(_rows)
+
+    return _result
+
+
+def run_startup(workdir, repeat=3):
+    """
+    Time command line start-up in fresh interpreters.
+
+    Parameters
+    ----------
+    workdir : path
+        Directory used as the --data directory for the bad config run.
+
+    repeat : int
+        Number of timed repetitions. The median of each stage is reported.
+
+    Returns
+    -------
+    Dictionary of median wall clock timings in seconds for printing the help
+    message, failing on a missing config file, and importing local_project
+    (and with it Brightway and the scientific stack).
+    """
+    _commands = {
+        "cli_help": [sys.executable, PACKAGE_DIR, "--help"],
+        "cli_bad_config": [
+            sys.executable,
+            PACKAGE_DIR,
+            "--data",
+            workdir,
+            "--bwconfig",
+            "missing_bwconfig.yaml",
+            "--caseconfig",
+            "missing_caseconfig.yaml",
+        ],
+        "import_local_project": [sys.executable, "-c", "import local_project"],
+    }
+
+    _samples = {_stage: [] for _stage in STARTUP_STAGES}
+    for _ in range(repeat):
+        for _stage, _command in _commands.items():
+            _start = time.perf_counter()
+            subprocess.run(
+                _command,
+                cwd=PACKAGE_DIR,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=False,
+            )
+            _samples[_stage].append(time.perf_counter() - _start)
+
+    return {_stage: statistics.median(_values) for _stage, _values in _samples.items()}
+
+
+def git_revision():
+    """Return the short commit hash of the working tree, or 'unknown'."""
+    try:
+        _rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PACKAGE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        _dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=PACKAGE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+    return f"{_rev}-dirty" if _dirty else _rev
+
+
+def compare(results, last=5):
+    """
+    Tabulate stage timings for the most recent commits in a results file.
+
+    Parameters
+    ----------
+    results : path
+        JSON lines file written by the benchmark.
+
+    last : int
+        Number of most recent commits to include.
+
+    Returns
+    -------
+    DataFrame with one row per (scale, stage) and one column per commit.
+    Start-up timings are listed under a scale of 0 activities.
+    """
+    _df = pd.read_json(results, lines=True)
+
+    _commits = _df.drop_duplicates("commit", keep="last").commit.tolist()[-last:]
+    _df = _df.loc[_df.commit.isin(_commits)]
+
+    _long = _df.melt(
+        id_vars=["commit", "n_activities", "n_exchanges"],
+        value_vars=[_s for _s in STARTUP_STAGES + STAGES if _s in _df.columns],
+        var_name="stage",
+        value_name="seconds",
+    )
+
+    return _long.pivot_table(
+        index=["n_activities", "n_exchanges", "stage"],
+        columns="commit",
+        values="seconds",
+        aggfunc="median",
+    )[_commits]
+
+
+def main(argv=None):
+    """Run the benchmark suite from the command line."""
+    _parser = argparse.ArgumentParser(description="Benchmark the autoBW pipeline")
+    _parser.add_argument(
+        "--scales",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 10000],
+        help="Numbers of created activities to benchmark.",
+    )
+    _parser.add_argument(
+        "--exchanges", type=int, default=10, help="Exchanges per created activity."
+    )
+    _parser.add_argument(
+        "--background",
+        type=int,
+        default=None,
+        help="Activities in the synthetic ecoinvent database. Defaults to the "
+        "largest scale.",
+    )
+    _parser.add_argument(
+        "--repeat", type=int, default=3, help="Timed repetitions per scale."
+    )
+    _parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    _parser.add_argument(
+        "--skip-startup",
+        action="store_true",
+        help="Don't time command line start-up.",
+    )
+    _parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Benchmark with per-row trace logging enabled.",
+    )
+    _parser.add_argument(
+        "--workdir",
+        help="Directory for the synthetic Brightway project, workbooks and logs. "
+        "Defaults to a new temporary directory.",
+    )
+    _parser.add_argument(
+        "--results",
+        default="benchmark_results.jsonl",
+        help="JSON lines file to which results are appended.",
+    )
+    _parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Print a comparison of stored results across commits and exit.",
+    )
+    _args = _parser.parse_args(argv)
+
+    if _args.compare:
+        with pd.option_context("display.max_rows", None, "display.width", 200):
+            print(compare(_args.results))
+        return 0
+
+    _workdir = os.path.abspath(
+        _args.workdir or tempfile.mkdtemp(prefix="autobw-bench-")
+    )
+    _bwdir = os.path.join(_workdir, "brightway")
+    os.makedirs(_bwdir, exist_ok=True)
+
+    # Keep the synthetic project out of the user's Brightway data directory.
+    # This has to happen before Brightway is first imported.
+    os.environ["BRIGHTWAY2_DIR"] = _bwdir
+
+    _logger = setup_logging(
+        fpath=os.path.join(_workdir, f"autobw-benchmark-{time.time()}.log"),
+        verbose=_args.verbose,
+    )
+
+    _commit = git_revision()
+    _background = _args.background or max(_args.scales)
+
+    def _record(scale, exchanges, timings):
+        with open(_args.results, "a", encoding="utf-8") as _f:
+            _f.write(
+                json.dumps(
+                    {
+                        "commit": _commit,
+                        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "python": platform.python_version(),
+                        "pandas": pd.__version__,
+                        "n_activities": scale,
+                        "n_exchanges": exchanges,
+                        "n_background": _background,
+                        "repeat": _args.repeat,
+                        **timings,
+                    }
+                )
+                + "\n"
+            )
+
+        print(
+            f"{scale} activities: "
+            + ", ".join(
+                f"{_s} {timings[_s]:.3f}s"
+                for _s in STARTUP_STAGES + STAGES
+                if _s in timings
+            )
+        )
+
+    if not _args.skip_startup:
+        _record(
+            scale=0,
+            exchanges=0,
+            timings=run_startup(workdir=_workdir, repeat=_args.repeat),
+        )
+
+    for _scale in _args.scales:
+        # Data and Brightway both print progress; keep the terminal readable
+        with open(
+            os.devnull, "w", encoding="utf-8"
+        ) as _null, contextlib.redirect_stdout(_null):
+            _timings = run_scale(
+                logger=_logger,
+                workdir=_workdir,
+                n_activities=_scale,
+                n_exchanges=_args.exchanges,
+                n_background=_background,
+                repeat=_args.repeat,
+                seed=_args.seed,
+            )
+
+        _record(scale=_scale, exchanges=_args.exchanges, timings=_timings)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Created on October 19 2026.
+
+Canonical form of the exchanges of an assembled foreground database.
+
+Duplicate exchanges are merged, zero amounts dropped and the exchanges of each
+activity sorted, so that equivalent import files give the same stored
+database.
+
+@author: rhanes
+"""
+import pandas as pd
+
+# Exchange fields that describe an uncertainty distribution of the amount
+UNCERTAINTY_FIELDS = (
+    "uncertainty type",
+    "loc",
+    "scale",
+    "shape",
+    "minimum",
+    "maximum",
+    "negative",
+)
+
+
+def flat_exchanges(custom_db, keys):
+    """Return (position in <keys>, exchange) pairs for the exchanges of <keys>."""
+    return [
+        (_i, _ex)
+        for _i, _key in enumerate(keys)
+        for _ex in custom_db[_key]["exchanges"]
+    ]
+
+
+def canonicalize_exchanges(custom_db, log):
+    """
+    Merge duplicate exchanges, drop zero amounts and sort the exchanges.
+
+    Exchanges of an activity with the same input, type and unit are merged
+    into the first of them, with the amounts summed. Brightway sums
+    duplicates when it builds its matrices, so results don't change. Merged
+    exchanges lose their uncertainty distributions, which no longer
+    describe the summed amount. Duplicates with different units are kept
+    and logged as warnings. Exchanges that then have a zero amount are
+    dropped. Production exchanges and exchanges with a formula, whose
+    amounts depend on the parameters, are neither merged nor dropped.
+
+    Exchanges are then sorted with the production exchange first,
+    followed by type and input, so the stored database has a stable
+    layout.
+
+    Parameters
+    ----------
+    custom_db : dict
+        Database in dictionary format, whose exchange lists are replaced.
+
+    log : StageLog
+        Stage summary to count merged and dropped exchanges in.
+    """
+    _keys = list(custom_db)
+
+    _exchanges = flat_exchanges(custom_db=custom_db, keys=_keys)
+    _frame = pd.DataFrame(
+        {
+            "activity": [_i for _i, _ in _exchanges],
+            "input_database": [_ex["input"][0] for _, _ex in _exchanges],
+            "input_code": [_ex["input"][1] for _, _ex in _exchanges],
+            "type": [_ex.get("type") for _, _ex in _exchanges],
+            "unit": [_ex.get("unit") for _, _ex in _exchanges],
+            "amount": [_ex.get("amount") for _, _ex in _exchanges],
+            "formula": ["formula" in _ex for _, _ex in _exchanges],
+        }
+    )
+    _frame["unit"] = _frame.unit.fillna("").astype(str)
+    _frame["amount"] = pd.to_numeric(_frame.amount)
+    _frame["production"] = _frame.type == "production"
+    log.count("exchanges", len(_frame))
+
+    # Production exchanges define the reference flow, so they are kept as
+    # they are, like exchanges whose amounts depend on the parameters
+    _mergeable = _frame.loc[~_frame.formula & ~_frame.production]
+    _groups = _mergeable.groupby(
+        ["activity", "input_database", "input_code", "type"], sort=False
+    )
+    _size = _groups.amount.transform("size")
+    _units = _groups.unit.transform("nunique")
+    _merged = (_size > 1) & (_units == 1)
+
+    # The first exchange of each merged group keeps the summed amount
+    _first = _merged & (_groups.cumcount() == 0)
+    _frame["merged"] = _first.reindex(_frame.index, fill_value=False)
+    _frame.loc[_frame.merged, "amount"] = _groups.amount.transform("sum")[_first]
+
+    _keep = ~(_merged & ~_first).reindex(_frame.index, fill_value=False)
+    _zero = (_frame.amount == 0) & ~_frame.production & ~_frame.formula & _keep
+    _keep &= ~_zero
+
+    for _row in (
+        _frame.loc[(_units > 1).reindex(_frame.index, fill_value=False)]
+        .drop_duplicates(["activity", "input_database", "input_code", "type"])
+        .itertuples()
+    ):
+        log.warn(
+            "unit_conflicts",
+            f"{_keys[_row.activity]} <- {(_row.input_database, _row.input_code)}",
+        )
+
+    _order = (
+        _frame.loc[_keep]
+        .assign(production=lambda _f: ~_f.production)
+        .sort_values(
+            ["activity", "production", "type", "input_database", "input_code"],
+            kind="stable",
+        )
+    )
+
+    _new = {_i: [] for _i in range(len(_keys))}
+    for _row in _order.itertuples():
+        _ex = _exchanges[_row.Index][1]
+        if _row.merged:
+            if (_ex.get("uncertainty type") or 0) > 1:
+                log.count("uncertainty_dropped")
+            _ex = {_k: _v for _k, _v in _ex.items() if _k not in UNCERTAINTY_FIELDS}
+            _ex["amount"] = _row.amount
+        _new[_row.activity].append(_ex)
+
+    for _i, _key in enumerate(_keys):
+        custom_db[_key]["exchanges"] = _new[_i]
+
+    log.count("duplicates_merged", int((~_keep).sum() - _zero.sum()))
+    log.count("zero_amounts_dropped", int(_zero.sum()))
@@ -0,0 +1,100 @@
+"""
+Created on October 19 2026.
+
+Checkpoints that let an interrupted foreground build resume where it stopped.
+
+Copying activities from background databases is done in chunks of rows from
+the Copy Activities sheet. Each finished chunk is written to its own file in a
+checkpoint directory, so a run that is killed part way through reads the
+finished chunks back instead of looking their activities up again. A
+checkpoint is keyed on everything that determines the copied activities: the
+rows being copied, the chunk size, the foreground database name and the
+modification times of the source databases. Chunks written for a different
+key are discarded.
+
+@author: rhanes
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+
+MANIFEST = "checkpoint.json"
+
+# Rows of the Copy Activities sheet per chunk
+COPY_CHUNK_SIZE = 500
+
+
+def checkpoint_directory(file_io, fg_dict):
+    """Return the checkpoint directory of a foreground build, or None if it's off."""
+    if not fg_dict.get("checkpoint", True):
+        return None
+    return os.path.join(
+        file_io["data_directory"], f"{fg_dict.get('save_prefix', '')}copy_checkpoint"
+    )
+
+
+def checkpoint_key(*parts):
+    """Return a hash identifying the inputs that a checkpoint was written for."""
+    return hashlib.sha1(
+        pickle.dumps(parts, protocol=pickle.HIGHEST_PROTOCOL)
+    ).hexdigest()
+
+
+class Checkpoint:
+    """Directory of finished chunks, numbered from zero."""
+
+    def __init__(self, directory, key):
+        """
+        Open the checkpoint in <directory>, discarding it if it has another key.
+
+        Parameters
+        ----------
+        directory : path
+            Directory holding the chunk files. Created if it doesn't exist.
+
+        key : str
+            Hash of the inputs, from checkpoint_key.
+        """
+        self.directory = directory
+        self.key = key
+
+        try:
+            with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as _f:
+                _stale = json.load(_f).get("key") != key
+        except (OSError, ValueError):
+            _stale = True
+
+        if _stale:
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as _f:
+                json.dump({"key": key}, _f)
+
+    def _path(self, chunk):
+        return os.path.join(self.directory, f"chunk_{chunk:06d}.pkl")
+
+    def load(self, chunk):
+        """Return the data saved for <chunk>, or None if it isn't finished."""
+        try:
+            with open(self._path(chunk), "rb") as _f:
+                return pickle.load(_f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def save(self, chunk, data):
+        """
+        Save the data of a finished chunk.
+
+        The file is written under a temporary name and renamed, so a chunk is
+        either complete or absent.
+        """
+        _tmp = f"{self._path(chunk)}.tmp-{os.getpid()}"
+        with open(_tmp, "wb") as _f:
+            pickle.dump(data, _f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(_tmp, self._path(chunk))
+
+    def clear(self):
+        """Delete the checkpoint once the build it belongs to has finished."""
+        shutil.rmtree(self.directory, ignore_errors=True)
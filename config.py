@@ -0,0 +1,37 @@
+"""
+Created on October 19 2026.
+
+Reading of the YAML config files.
+
+This module doesn't import Brightway, so the command line can read and check
+the configs before paying for the scientific stack.
+
+@author: rhanes
+"""
+import sys
+
+import yaml
+
+
+def read_config(fpath, logging):
+    """
+    Read a YAML config file, logging an error and exiting if it can't be read.
+
+    Parameters
+    ----------
+    fpath : path
+        Config file to read.
+
+    logging
+        logger object for writing status messages to file
+
+    Returns
+    -------
+    Dictionary of config file contents; empty if the file is empty
+    """
+    try:
+        with open(fpath, "r", encoding="utf-8") as _f:
+            return yaml.load(_f, Loader=yaml.FullLoader) or {}
+    except (IOError, yaml.YAMLError) as err:
+        logging.error(msg=f"autoBW: {fpath} {err}")
+        sys.exit("Error: Check log file")
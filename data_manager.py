@@ -11,8 +11,18 @@ Unmodified FPEAM code is available at https://github.com/NREL/fpeam.
 @author: rhanes
 """
 import sys
+import logging
+from collections import namedtuple
+
 import pandas as pd
 
+LOGGER = logging.getLogger(__name__)
+
+# Backfill values in COLUMNS that are resolved when the data are read in: the
+# value of another column in the same row, or a value from the config file.
+FromColumn = namedtuple("FromColumn", ["name"])
+FromConfig = namedtuple("FromConfig", ["key"])
+
 
 class Data(pd.DataFrame):
     """
@@ -28,12 +38,16 @@ class Data(pd.DataFrame):
 
     INDEX_COLUMNS = []
 
+    # Attributes kept alongside the data; see pandas subclassing docs
+    _metadata = ["source", "backfilled"]
+
     def __init__(
         self,
         fpath=None,
         columns=None,
         sheet=None,
         backfill=True,
+        config=None,
     ):
         """
         Store file IO information into self.
@@ -51,11 +65,20 @@ class Data(pd.DataFrame):
 
         backfill
             Boolean flag: perform backfilling with datatype-specific value
+
+        config
+            Dictionary used to resolve FromConfig backfill values. If None,
+            columns with FromConfig backfills are not backfilled.
         """
         _df = (
             pd.DataFrame({})
             if fpath is None
-            else self.load(fpath=fpath, columns=columns, sheet=sheet)
+            else self.load(
+                fpath=fpath,
+                columns=columns,
+                sheet=sheet,
+                optional=[_c["name"] for _c in self.COLUMNS if _c.get("optional")],
+            )
         )
 
         super().__init__(data=_df)
@@ -68,16 +91,33 @@ class Data(pd.DataFrame):
             assert _valid is True
         except AssertionError:
             if fpath is not None:
-                print(f"{__name__} failed validation")
+                LOGGER.error("%s failed validation", type(self).__name__)
                 raise
 
+        self.backfilled = pd.Series(dtype=int)
+
         if backfill:
+            _values = {}
             for _column in self.COLUMNS:
-                if _column["backfill"] is not None:
-                    self.dmbackfill(column=_column["name"], value=_column["backfill"])
+                _value = _column["backfill"]
+                if isinstance(_value, FromConfig):
+                    if config is None:
+                        continue
+                    _value = config.get(_value.key)
+                    if not _value:
+                        LOGGER.error(
+                            "DataManager: No config value %s to backfill %s",
+                            _column["backfill"].key,
+                            _column["name"],
+                        )
+                        sys.exit(1)
+                if _value is not None:
+                    _values[_column["name"]] = _value
+
+            self.fill_missing(values=_values)
 
     @staticmethod
-    def load(fpath, columns, header=0, sheet=None):
+    def load(fpath, columns, header=0, sheet=None, optional=()):
         """
         Load data from a text file at <fpath>. Check and set column names.
 
@@ -98,6 +138,9 @@ class Data(pd.DataFrame):
             Specify the name of the sheet to be read in.
             If no sheet name is provided, the first sheet is read.
 
+        optional: [list]
+            Columns that may be missing from the file; they are added empty.
+
         Returns
         -------
         DataFrame
@@ -107,84 +150,113 @@ class Data(pd.DataFrame):
                 io=fpath,
                 sheet_name=sheet,
                 dtype=columns,
-                usecols=columns.keys(),
+                usecols=lambda _c: _c in columns,
                 header=header,
             )
-        except ValueError as _e:
-            print(f"{fpath}, {sheet}")
+            _missing = set(columns) - set(_df.columns) - set(optional)
+            if _missing:
+                raise ValueError(f"missing columns {sorted(_missing)}")
+        except ValueError:
+            LOGGER.error("DataManager: could not read %s, sheet %s", fpath, sheet)
             raise
 
         else:
-            return _df
+            return _df.reindex(columns=list(columns))
 
-    def dmbackfill(self, column, value=0):
+    def fill_missing(self, values):
         """
-        Replace NaNs in <column> with <value>.
+        Replace NaNs in several columns at once.
+
+        All columns are checked with a single NA mask and filled with a single
+        fillna call.
 
         Parameters
         ----------
-        column: [string]
-            Name of column with NaNs to be backfilled
-
-        value: [any]
-            Value for backfill
+        values: [dict]
+            {column: value, ...}. A value may be a FromColumn, in which case
+            NaNs are filled row by row from the named column (after that
+            column's own backfill, if any).
 
         Returns
         -------
-        DataFrame with [column] backfilled with [value]
+        Series with the number of values backfilled in each column
         """
         _dataset = str(type(self)).split("'")[1]
 
-        _backfilled = False
-
-        if not value:
-            print(f"DataManager: No backfill value provided for {column}")
-            sys.exit(1)
-
-        if isinstance(column, str):
-            if self[column].isna().any():
-                # count the missing values
-                _count_missing = sum(self[column].isna())
-                # count the total values
-                _count_total = self[column].__len__()
-
-                # fill the missing values with specified value
-                self[column].fillna(value, inplace=True)
+        _values = {_k: _v for _k, _v in values.items() if _k in self.columns}
+        if not _values:
+            return pd.Series(dtype=int)
+
+        _mask = self[list(_values)].isna()
+
+        _fill = {}
+        _counts = _mask.sum()
+        for _column, _value in _values.items():
+            if isinstance(_value, FromColumn):
+                _source = self[_value.name]
+                if _value.name in _values and not isinstance(
+                    _values[_value.name], FromColumn
+                ):
+                    _source = _source.fillna(_values[_value.name])
+                _counts[_column] = (_mask[_column] & _source.notna()).sum()
+                _fill[_column] = _source
+            else:
+                _fill[_column] = _value
+
+        # fill the missing values in place; a single call on the frame itself
+        # avoids chained assignment on column copies
+        if _counts.any():
+            self.fillna(value=_fill, inplace=True)
+
+        self.backfilled = _counts.add(self.backfilled, fill_value=0).astype(int)
+
+        # log the number of missing values once per dataset
+        if _counts.any():
+            LOGGER.info(
+                "%s: backfilled %s of %d rows",
+                _dataset,
+                ", ".join(f"{_c}={_n}" for _c, _n in _counts.items() if _n),
+                len(self),
+            )
+        LOGGER.debug(
+            "%s: no missing data values in %s",
+            _dataset,
+            [_c for _c, _n in _counts.items() if not _n],
+        )
 
-                # log a warning with the number of missing values
-                print(
-                    f"{_count_missing} of {_count_total} data values in"
-                    f" {_dataset}.{column} were backfilled as {value}"
-                )
+        return _counts
 
-                _backfilled = True
-            else:
-                # log if no values are missing
-                print(f"no missing data values in {_dataset}.{column}")
+    def dmbackfill(self, column, value=0):
+        """
+        Replace NaNs in <column> with <value>.
 
-        elif isinstance(column, list):
-            # if any values are missing,
-            for _c in column:
-                if self[_c].isna().any():
-                    # count the missing values
-                    _count_missing = sum(self[_c].isna())
-                    # count the total values
-                    _count_total = self[_c].__len__()
+        Parameters
+        ----------
+        column: [string, list or dict]
+            Name or list of names of columns with NaNs to be backfilled, or a
+            {column: value} mapping, in which case <value> is ignored
 
-                    # fill the missing values with specified value
-                    self[_c].fillna(value, inplace=True)
+        value: [any]
+            Value for backfill
 
-                    # log a warning with the number of missing values
-                    print(
-                        f"{_count_missing} of {_count_total} data values in"
-                        f" {_dataset}.{_c} were backfilled as {value}"
-                    )
+        Returns
+        -------
+        DataFrame with [column] backfilled with [value]. Per-column counts of
+        backfilled values are accumulated in self.backfilled.
+        """
+        if isinstance(column, dict):
+            _values = column
+        elif isinstance(column, str):
+            _values = {column: value}
+        else:
+            _values = dict.fromkeys(column, value)
 
-                    _backfilled = True
+        for _column, _value in _values.items():
+            if not _value:
+                LOGGER.error("DataManager: No backfill value provided for %s", _column)
+                sys.exit(1)
 
-                else:
-                    # log if no values are missing
-                    print(f"no missing data values in {_dataset}.{_c}")
+        self.fill_missing(values=_values)
 
         return self
 
@@ -202,13 +274,13 @@ class Data(pd.DataFrame):
 
         _valid = True
 
-        print(f"validating {_name}")
+        LOGGER.debug("validating %s", _name)
 
         if self.empty:
-            print(f"no data provided for {_name}")
+            LOGGER.warning("no data provided for %s", _name)
             _valid = False
 
-        print(f"validated {_name}")
+        LOGGER.debug("validated %s", _name)
 
         return _valid
 
@@ -220,7 +292,7 @@ class Data(pd.DataFrame):
         """Process exceptions."""
         # process exceptions
         if exc_type is not None:
-            print(f"{exc_type}\n{exc_val}\n{exc_tb}")
+            LOGGER.error("%s", exc_type, exc_info=(exc_type, exc_val, exc_tb))
             _out = False
         else:
             _out = self
@@ -236,7 +308,12 @@ class CreateActivities(Data):
     """
 
     COLUMNS = (
-        {"name": "activity_database", "type": str, "index": False, "backfill": None},
+        {
+            "name": "activity_database",
+            "type": str,
+            "index": False,
+            "backfill": FromConfig("name"),
+        },
         {"name": "activity_type", "type": str, "index": False, "backfill": None},
         {"name": "activity", "type": str, "index": False, "backfill": None},
         {"name": "reference_product", "type": str, "index": False, "backfill": None},
@@ -257,6 +334,14 @@ class CreateActivities(Data):
         {"name": "activity_version", "type": float, "index": False, "backfill": None},
         {"name": "code", "type": str, "index": False, "backfill": None},
         {"name": "notes", "type": str, "index": False, "backfill": None},
+        # Optional grouping used to split the foreground into shards
+        {
+            "name": "shard",
+            "type": str,
+            "index": False,
+            "backfill": None,
+            "optional": True,
+        },
     )
 
     def __init__(
@@ -264,6 +349,7 @@ class CreateActivities(Data):
         fpath=None,
         columns={d["name"]: d["type"] for d in COLUMNS},
         backfill=True,
+        config=None,
     ):
         """Initialize Create Activities data frame."""
         super().__init__(
@@ -271,6 +357,7 @@ class CreateActivities(Data):
             columns=columns,
             sheet="Create Activities",
             backfill=backfill,
+            config=config,
         )
 
 
@@ -282,8 +369,18 @@ class AddExchanges(Data):
     """
 
     COLUMNS = (
-        {"name": "activity_database", "type": str, "index": True, "backfill": None},
-        {"name": "exchange_database", "type": str, "index": False, "backfill": None},
+        {
+            "name": "activity_database",
+            "type": str,
+            "index": True,
+            "backfill": FromConfig("name"),
+        },
+        {
+            "name": "exchange_database",
+            "type": str,
+            "index": False,
+            "backfill": FromConfig("name"),
+        },
         {"name": "activity", "type": str, "index": False, "backfill": None},
         {"name": "activity_code", "type": str, "index": False, "backfill": None},
         {"name": "activity_location", "type": str, "index": False, "backfill": None},
@@ -293,6 +390,14 @@ class AddExchanges(Data):
         {"name": "exchange_location", "type": str, "index": False, "backfill": None},
         {"name": "exchange_type", "type": str, "index": False, "backfill": None},
         {"name": "exchange_code", "type": str, "index": False, "backfill": None},
+        # Optional formula over the Parameters sheet; replaces amount when set
+        {
+            "name": "formula",
+            "type": str,
+            "index": False,
+            "backfill": None,
+            "optional": True,
+        },
     )
 
     def __init__(
@@ -300,6 +405,7 @@ class AddExchanges(Data):
         fpath=None,
         columns={d["name"]: d["type"] for d in COLUMNS},
         backfill=True,
+        config=None,
     ):
         """Initialize Add Exchanges data frame."""
         super().__init__(
@@ -307,6 +413,7 @@ class AddExchanges(Data):
             columns=columns,
             sheet="Add Exchanges",
             backfill=backfill,
+            config=config,
         )
 
 
@@ -329,6 +436,7 @@ class CopyActivities(Data):
         fpath=None,
         columns={d["name"]: d["type"] for d in COLUMNS},
         backfill=True,
+        config=None,
     ):
         """Initialize Copy Activities data frame."""
         super().__init__(
@@ -336,6 +444,7 @@ class CopyActivities(Data):
             columns=columns,
             sheet="Copy Activities",
             backfill=backfill,
+            config=config,
         )
 
 
@@ -347,7 +456,12 @@ class DeleteExchanges(Data):
     """
 
     COLUMNS = (
-        {"name": "activity_database", "type": str, "index": True, "backfill": None},
+        {
+            "name": "activity_database",
+            "type": str,
+            "index": True,
+            "backfill": FromConfig("name"),
+        },
         {"name": "activity", "type": str, "index": False, "backfill": None},
         {"name": "activity_code", "type": str, "index": False, "backfill": None},
         {"name": "exchange_database", "type": str, "index": False, "backfill": None},
@@ -361,6 +475,7 @@ class DeleteExchanges(Data):
         fpath=None,
         columns={d["name"]: d["type"] for d in COLUMNS},
         backfill=True,
+        config=None,
     ):
         """Initialize Delete Exchanges data frame."""
         super().__init__(
@@ -368,4 +483,103 @@ class DeleteExchanges(Data):
             columns=columns,
             sheet="Delete Exchanges",
             backfill=backfill,
+            config=config,
+        )
+
+
+class Parameters(Data):
+    """
+    Read in and process the Parameters data table.
+
+    This data table defines named parameters that Add Exchanges formulas refer to.
+    Each parameter has a default amount or a formula over other parameters.
+    """
+
+    COLUMNS = (
+        {"name": "name", "type": str, "index": True, "backfill": None},
+        {"name": "amount", "type": float, "index": False, "backfill": None},
+        {
+            "name": "formula",
+            "type": str,
+            "index": False,
+            "backfill": None,
+            "optional": True,
+        },
+        {
+            "name": "unit",
+            "type": str,
+            "index": False,
+            "backfill": None,
+            "optional": True,
+        },
+        {
+            "name": "notes",
+            "type": str,
+            "index": False,
+            "backfill": None,
+            "optional": True,
+        },
+    )
+
+    def __init__(
+        self,
+        fpath=None,
+        columns={d["name"]: d["type"] for d in COLUMNS},
+        backfill=True,
+        config=None,
+    ):
+        """Initialize Parameters data frame."""
+        super().__init__(
+            fpath=fpath,
+            columns=columns,
+            sheet="Parameters",
+            backfill=backfill,
+            config=config,
+        )
+
+
+class MigrationMap(Data):
+    """
+    Read in and process the Migration data table.
+
+    This data table maps keys of a background database to the keys that replace
+    them in a new version. An old key may map to several new keys; share is the
+    fraction of the old exchange amount that goes to each.
+    """
+
+    COLUMNS = (
+        {"name": "old_database", "type": str, "index": True, "backfill": None},
+        {"name": "old_code", "type": str, "index": True, "backfill": None},
+        {"name": "new_database", "type": str, "index": False, "backfill": None},
+        {"name": "new_code", "type": str, "index": False, "backfill": None},
+        {
+            "name": "share",
+            "type": float,
+            "index": False,
+            "backfill": 1.0,
+            "optional": True,
+        },
+        {
+            "name": "notes",
+            "type": str,
+            "index": False,
+            "backfill": None,
+            "optional": True,
+        },
+    )
+
+    def __init__(
+        self,
+        fpath=None,
+        columns={d["name"]: d["type"] for d in COLUMNS},
+        backfill=True,
+        config=None,
+    ):
+        """Initialize Migration data frame."""
+        super().__init__(
+            fpath=fpath,
+            columns=columns,
+            sheet="Migration",
+            backfill=backfill,
+            config=config,
         )
@@ -16,7 +16,31 @@ import bw2data
 from bw2data.validate import db_validator
 from peewee import DoesNotExist
 
-from data_manager import CreateActivities, AddExchanges, CopyActivities, DeleteExchanges
+from data_manager import (
+    CreateActivities,
+    AddExchanges,
+    CopyActivities,
+    DeleteExchanges,
+    Parameters,
+)
+from background_snapshot import open_snapshot, snapshot_root
+from canonicalize import canonicalize_exchanges
+from checkpoint import COPY_CHUNK_SIZE, Checkpoint, checkpoint_directory, checkpoint_key
+from formulas import evaluate_exchanges, formula_rows, scenario_amounts
+from log_manager import StageLog
+from project_session import ProjectSession
+from shards import assign_shards, cross_shard_exchanges, split_shards, write_foreground
+from matrix_export import export_matrices
+from supply_graph import SupplyGraph
+
+# Sheets of the import file, in the order they are read
+SHEETS = (
+    "Create Activities",
+    "Copy Activities",
+    "Delete Exchanges",
+    "Add Exchanges",
+    "Parameters",
+)
 
 
 class ForegroundDatabase:
@@ -30,7 +54,17 @@ class ForegroundDatabase:
     the foreground database from ecoinvent and then edited.
     """
 
-    def __init__(self, logging, prj_dict, fg_dict, file_io):
+    def __init__(
+        self,
+        logging,
+        prj_dict,
+        fg_dict,
+        file_io,
+        background_cache=None,
+        write=True,
+        session=None,
+        frames=None,
+    ):
         """
         Assemble the foreground database as a dictionary.
 
@@ -61,6 +95,25 @@ class ForegroundDatabase:
                     file.
                 save_db : Boolean
                     Whether to save a copy of the database in two CSV files and one pickled object.
+                save_prefix : str
+                    Optional prefix for the names of the saved and exported files.
+                export_matrices : Boolean
+                    Whether to export the technosphere and biosphere matrices as
+                    sparse .npz files with an index file.
+                shard_by : str
+                    Optional Create Activities column, such as activity_location
+                    or shard, used to split the database into one Brightway
+                    database per value. See split_foreground.
+                checkpoint : Boolean
+                    Whether to save copied activities to a checkpoint directory
+                    in data_directory as they are read, so a restarted build
+                    resumes copying where it stopped. Defaults to True.
+                copy_chunk_size : int
+                    Number of Copy Activities rows per checkpointed chunk.
+                canonicalize : Boolean
+                    Whether to merge duplicate exchanges, drop exchanges with
+                    zero amounts and sort exchanges before validation. See
+                    canonicalize_exchanges. Defaults to True.
                 link_fg_to : dict
                     Dictionary of existing database names and columns to link on.
 
@@ -70,11 +123,53 @@ class ForegroundDatabase:
             Keys:
                 data_directory : path
                     Path to directory containing import file and other data.
+                snapshot_directory : path
+                    Optional directory of background database snapshots.
+                    Defaults to the snapshots folder in data_directory.
+
+        background_cache : dict
+            Optional dictionary, owned by the caller, in which copied background
+            activities are kept between runs. Entries for a source database are
+            discarded when that database is modified. If None, nothing is cached.
+
+        write : Boolean
+            Whether to write the assembled database to Brightway. If False, the
+            caller is responsible for calling write_foreground_db.
+
+        session : ProjectSession
+            Open session of the Brightway project. If None, one is opened.
+
+        frames : dict
+            Optional sheets of the import file already read by read_workbook,
+            by sheet name. They are copied, not changed. Sheets that aren't
+            given are read from the import file.
 
         """
         # Initialize empty dictionary to hold the assembled database
         self.custom_db = {}
 
+        # Supply-chain graph of the assembled database, built by validate
+        self.graph = None
+
+        # Summaries of the pipeline stages, keyed by stage name
+        self.stage_logs = {}
+
+        # Shard databases by name, if the database is split into shards
+        self.shards = None
+
+        # Compiled Add Exchanges formulas, set by evaluate_formulas
+        self.formulas = None
+
+        self.background_cache = background_cache
+
+        # Fresh background snapshots are read instead of the project database
+        self.snapshot_root = snapshot_root(file_io)
+
+        # Finished chunks of copied activities are kept until the build ends
+        self.checkpoint = None
+        self.checkpoint_directory = checkpoint_directory(file_io, fg_dict)
+        self.copy_chunk_size = fg_dict.get("copy_chunk_size", COPY_CHUNK_SIZE)
+
         # Get the path to the XLSX file with importable database information
         _import_template = os.path.join(file_io['data_directory'], fg_dict.get("fg_db_import"))
 
@@ -82,40 +177,25 @@ class ForegroundDatabase:
             logging.error(msg=f"{_import_template} is not a file")
             sys.exit('Error: Check log file')
 
-        # Table of empty activities to add to the database. Fill in the
-        # database columns with foreground database name from the config file.
-        self.create_activities_data = (
-            CreateActivities(fpath=_import_template)
-            .dmbackfill(column="activity_database", value=fg_dict.get("name"))
-            .apply(lambda x: x.str.strip() if x.dtype == "object" else x)
-        )
-
-        # Table of activities to copy to the foreground database from an
-        # existing database
-        self.copy_activities_data = CopyActivities(fpath=_import_template).apply(
-            lambda x: x.str.strip() if x.dtype == "object" else x
-        )
-
-        # Table of exchanges to remove from the database
-        self.delete_exchanges_data = (
-            DeleteExchanges(fpath=_import_template)
-            .dmbackfill(column="activity_database", value=fg_dict.get("name"))
-            .apply(lambda x: x.str.strip() if x.dtype == "object" else x)
-        )
-
-        # Table of exchanges to add to the database. Fill in the database
-        # columns with foreground database name from the config file.
-        self.add_exchanges_data = (
-            AddExchanges(fpath=_import_template)
-            .dmbackfill(
-                column=["activity_database", "exchange_database"],
-                value=fg_dict.get("name"),
+        frames = dict(frames or {})
+        _unread = [_sheet for _sheet in SHEETS if _sheet not in frames]
+        if _unread:
+            frames.update(
+                self.read_workbook(
+                    fpath=_import_template, fg_dict=fg_dict, sheets=_unread
+                )
             )
-            .apply(lambda x: x.str.strip() if x.dtype == "object" else x)
-        )
+
+        # Later stages edit these tables, so the given frames are copied
+        self.create_activities_data = frames["Create Activities"].copy()
+        self.copy_activities_data = frames["Copy Activities"].copy()
+        self.delete_exchanges_data = frames["Delete Exchanges"].copy()
+        self.add_exchanges_data = frames["Add Exchanges"].copy()
+        self.parameters_data = frames["Parameters"].copy()
 
         self.logging = logging
         self.project = prj_dict.get("name")
+        self.session = session or ProjectSession(name=self.project, logging=logging)
 
         # If activities listed under Add Exchanges are not also listed under
         # Create Activities, throw an error
@@ -138,6 +218,9 @@ class ForegroundDatabase:
             )
             sys.exit('Error: Check log file')
 
+        # Replace the amounts of exchanges given as formulas
+        self.evaluate_formulas()
+
         if fg_dict.get("generate_keys"):
             # Generate unique activity code with uuid.
             # The code is different from the "flows" value, which is a
@@ -190,12 +273,13 @@ class ForegroundDatabase:
 
         # Log the activities to be created and their newly assigned codes
         self.logging.info(
-            msg=f"ForegroundDatabase.__init__: Creating activities: "
-            f"{self.create_activities_data.activity.values.tolist()}"
+            "ForegroundDatabase.__init__: Creating %d activities",
+            len(self.create_activities_data),
         )
-        self.logging.info(
-            msg=f"ForegroundDatabase.__init__: Adding activity codes: "
-            f"{self.create_activities_data.code.values.tolist()}"
+        self.logging.debug(
+            "ForegroundDatabase.__init__: Creating activities %s with codes %s",
+            self.create_activities_data.activity.values,
+            self.create_activities_data.code.values,
         )
 
         # Create the import data dictionary structure and populate with
@@ -227,6 +311,10 @@ class ForegroundDatabase:
         # Add exchanges from foreground database and existing databases
         self.add_exchanges()
 
+        # Merge duplicate exchanges, drop zero amounts and sort the exchanges
+        if fg_dict.get("canonicalize", True):
+            self.canonicalize_exchanges()
+
         self.logging.info(msg="ForegroundDatabase.__init__: Custom database assembled")
 
         self.logging.info(
@@ -235,32 +323,99 @@ class ForegroundDatabase:
 
         self.validate()
 
+        if fg_dict.get("shard_by"):
+            self.shards = self.split_foreground(
+                name=fg_dict.get("name"), shard_by=fg_dict.get("shard_by")
+            )
+
         # Save a copy of the foreground database for future reference
         if fg_dict.get("save_db", True):
-            with open(
-                os.path.join(file_io.get("data_directory"), "imported_db.obj"), "wb"
-            ) as db_dump:
+            _prefix = os.path.join(
+                file_io.get("data_directory"), fg_dict.get("save_prefix", "")
+            )
+            with open(f"{_prefix}imported_db.obj", "wb") as db_dump:
                 pickle.dump(self.custom_db, db_dump)
                 db_dump.close()
             self.add_exchanges_data.to_csv(
-                os.path.join(file_io.get("data_directory"), "add_exchanges_data.csv"),
+                f"{_prefix}add_exchanges_data.csv",
                 index=False,
             )
             self.create_activities_data.to_csv(
-                os.path.join(
-                    file_io.get("data_directory"), "create_activities_data.csv"
-                ),
+                f"{_prefix}create_activities_data.csv",
                 index=False,
             )
 
+        # Export matrices for solvers outside Brightway
+        if fg_dict.get("export_matrices"):
+            self.export_matrices(
+                directory=file_io.get("data_directory"),
+                prefix=fg_dict.get("save_prefix", ""),
+            )
+
         # Write the foreground database so it's usable by Brightway
-        try:
-            bw.Database(fg_dict.get("name")).write(self.custom_db)
-        except KeyError as _e:
-            self.logging.warning(
-                msg=f"ForegroundDatabase.__init__: KeyError on database write: {_e}"
+        if write:
+            self.write_foreground_db(name=fg_dict.get("name"))
+
+        # The build finished, so there is nothing left to resume
+        if self.checkpoint is not None:
+            self.checkpoint.clear()
+
+    @staticmethod
+    def read_workbook(fpath, fg_dict, sheets=SHEETS):
+        """
+        Read sheets of an import file, with text columns stripped of spaces.
+
+        Parameters
+        ----------
+        fpath : path
+            Import file.
+
+        fg_dict : dict
+            Dictionary of database-level parameters, used for backfilling.
+
+        sheets : list
+            Names of the sheets to read; see SHEETS.
+
+        Returns
+        -------
+        Dictionary of DataFrames by sheet name
+        """
+        _frames = {}
+        for _sheet in sheets:
+            if _sheet == "Create Activities":
+                # Table of empty activities to add to the database. The database
+                # columns are backfilled with foreground database name from the
+                # config file.
+                _data = CreateActivities(fpath=fpath, config=fg_dict)
+            elif _sheet == "Copy Activities":
+                # Table of activities to copy to the foreground database from an
+                # existing database
+                _data = CopyActivities(fpath=fpath)
+            elif _sheet == "Delete Exchanges":
+                # Table of exchanges to remove from the database
+                _data = DeleteExchanges(fpath=fpath, config=fg_dict)
+            elif _sheet == "Add Exchanges":
+                # Table of exchanges to add to the database. The database columns
+                # are backfilled with foreground database name from the config
+                # file.
+                _data = AddExchanges(fpath=fpath, config=fg_dict)
+            else:
+                # Table of named parameters used in Add Exchanges formulas.
+                # Workbooks without parameters may leave out the sheet.
+                with pd.ExcelFile(fpath) as _workbook:
+                    _has_parameters = "Parameters" in _workbook.sheet_names
+                _data = (
+                    Parameters(fpath=fpath)
+                    if _has_parameters
+                    else pd.DataFrame(columns=[_c["name"] for _c in Parameters.COLUMNS])
+                )
+
+            _frames[_sheet] = _data.apply(
+                lambda x: x.str.strip() if x.dtype == "object" else x
             )
 
+        return _frames
+
     def copy_activities(self, to_db: str):
         """
         Copy activities and exchanges from an existing database to the foreground database.
@@ -271,6 +426,11 @@ class ForegroundDatabase:
         data to the foreground database. Any activities that are listed for copying
         but don't exist in the source database are skipped with a warning.
 
+        Rows are copied in chunks of copy_chunk_size. If checkpointing is on,
+        each finished chunk is saved, and chunks saved by an interrupted run
+        with the same rows and unchanged source databases are read back
+        instead of being copied again.
+
         Parameters
         ----------
         to_db : str
@@ -282,13 +442,16 @@ class ForegroundDatabase:
             )
             return None
 
-        _dblen = len(self.custom_db)
-
-        bw.projects.set_current(self.project)
+        _log = StageLog(
+            logger=self.logging,
+            stage="ForegroundDatabase.copy_activities",
+            record=self.stage_logs,
+        )
 
         # Check that all source_databases exist in our project
+        _bwdbs, _caches, _snapshots = {}, {}, {}
         for _sdb in self.copy_activities_data.source_database.unique():
-            if _sdb not in [key for key, value in bw.databases.items()]:
+            if _sdb not in self.session.databases:
                 self.logging.error(
                     msg=f"ForegroundDatabase.copy_activities: Source database "
                     f"{_sdb} is not in Brightway project {self.project} "
@@ -298,41 +461,164 @@ class ForegroundDatabase:
 
             # Use the source_database column to set the Brightway database being
             # searched
-            _bwdb = bw.Database(_sdb)
-
-            # Use the activity_code to search the database
-            for _row in (
-                self.copy_activities_data[["activity_code", "activity"]]
-                .loc[self.copy_activities_data.source_database == _sdb]
-                .iterrows()
-            ):
-                try:
-                    _act = _bwdb.get(_row[1]["activity_code"])
-
-                    # If the activity exists, use a separate method to
-                    # format the ecoinvent information for addition to the
-                    # foreground database.
-                    _act_to_add = self.ecoinvent_translator(activity=_act, to_db=to_db)
-
-                    self.custom_db[_act_to_add[0]] = _act_to_add[1]
-
-                except DoesNotExist:
-                    # Log a warning if the activity_code doesn't exist, but
-                    # proceed with processing the rest of the activities to
-                    # copy
-                    self.logging.warning(
-                        msg=f"ForegroundDatabase.copy_activities: {_row[1]['activity']} "
-                        f"({_row[1]['activity_code']}) not found in {_sdb}"
-                    )
-                    _act = None
+            _bwdbs[_sdb] = bw.Database(_sdb)
 
-        self.logging.info(
-            msg=f"ForegroundDatabase.copy_activities: {len(self.custom_db) - _dblen} activities "
-            f"copied to foreground database"
+            # Previously copied activities, if a background cache is in use
+            _caches[_sdb] = self.cached_activities(source_db=_sdb)
+
+            # Snapshot of the source database, if there is a fresh one
+            _snapshots[_sdb] = self.open_snapshot(source_db=_sdb)
+
+        _rows = self.copy_activities_data[
+            ["source_database", "activity_code", "activity"]
+        ]
+
+        if self.checkpoint_directory is not None:
+            self.checkpoint = Checkpoint(
+                directory=self.checkpoint_directory,
+                key=checkpoint_key(
+                    to_db,
+                    self.copy_chunk_size,
+                    _rows.to_records(index=False).tolist(),
+                    {_sdb: bw.databases[_sdb].get("modified") for _sdb in _bwdbs},
+                ),
+            )
+
+        for _start in range(0, len(_rows), self.copy_chunk_size):
+            _chunk = _start // self.copy_chunk_size
+            _done = (
+                self.checkpoint.load(_chunk) if self.checkpoint is not None else None
+            )
+
+            if _done is None:
+                _done = {"activities": {}, "not_found": []}
+
+                # Use the activity_code to search the database
+                for _row in _rows.iloc[
+                    _start : _start + self.copy_chunk_size
+                ].itertuples(index=False):
+                    _sdb, _code = _row.source_database, _row.activity_code
+                    _cached = _caches[_sdb]
+                    _snapshot = _snapshots[_sdb]
+                    _act_to_add = None
+                    if _cached is not None and _code in _cached:
+                        _act_to_add = (
+                            (to_db, _code),
+                            self.copy_activity_dict(_cached[_code]),
+                        )
+                        _log.count("cache_hits")
+                    elif _snapshot is not None:
+                        if _code in _snapshot:
+                            _act_to_add = ((to_db, _code), _snapshot.get(_code))
+                            _log.count("snapshot_reads")
+                    else:
+                        try:
+                            _act = _bwdbs[_sdb].get(_code)
+                        except DoesNotExist:
+                            _act = None
+
+                        # If the activity exists, use a separate method to
+                        # format the ecoinvent information for addition to
+                        # the foreground database.
+                        if _act is not None:
+                            _act_to_add = self.ecoinvent_translator(
+                                activity=_act, to_db=to_db
+                            )
+
+                    if _act_to_add is None:
+                        # Record a warning if the activity_code doesn't exist, but
+                        # proceed with processing the rest of the activities to
+                        # copy
+                        _done["not_found"].append(
+                            f"{_row.activity} ({_code}) in {_sdb}"
+                        )
+                        continue
+
+                    if _cached is not None and _code not in _cached:
+                        _cached[_code] = self.copy_activity_dict(_act_to_add[1])
+
+                    _done["activities"][_act_to_add[0]] = _act_to_add[1]
+
+                if self.checkpoint is not None:
+                    self.checkpoint.save(_chunk, _done)
+                    _log.count("chunks_saved")
+            else:
+                _log.count("chunks_resumed")
+
+            self.custom_db.update(_done["activities"])
+
+            _log.count("activities_copied", len(_done["activities"]))
+            _log.count(
+                "exchanges_copied",
+                sum(len(_act["exchanges"]) for _act in _done["activities"].values()),
+            )
+            for _missing in _done["not_found"]:
+                _log.warn("activities_not_found", _missing)
+
+        _log.summary()
+
+        return None
+
+    def cached_activities(self, source_db: str):
+        """
+        Return the cached activities copied from <source_db>, keyed by activity code.
+
+        The cache entry is reset if the source database has been modified since
+        it was filled. Returns None if no background cache is in use.
+
+        Parameters
+        ----------
+        source_db : str
+            Name of the Brightway database activities are copied from.
+        """
+        if self.background_cache is None:
+            return None
+
+        _modified = bw.databases[source_db].get("modified")
+        _entry = self.background_cache.get(source_db)
+        if _entry is None or _entry["modified"] != _modified:
+            _entry = {"modified": _modified, "activities": {}}
+            self.background_cache[source_db] = _entry
+
+        return _entry["activities"]
+
+    def open_snapshot(self, source_db: str):
+        """
+        Return the snapshot of <source_db>, or None if there is no fresh snapshot.
+
+        Snapshots are written with the --snapshot command line option. A
+        snapshot taken before the source database was last modified is not used.
+
+        Parameters
+        ----------
+        source_db : str
+            Name of the Brightway database activities are copied from.
+        """
+        _snapshot = open_snapshot(
+            root=self.snapshot_root, project=self.project, database=source_db
         )
+        if _snapshot is None or _snapshot.is_fresh():
+            return _snapshot
 
+        self.logging.warning(
+            "ForegroundDatabase.open_snapshot: Snapshot of %s is out of date; "
+            "reading from the project instead",
+            source_db,
+        )
         return None
 
+    @staticmethod
+    def copy_activity_dict(activity: dict):
+        """
+        Copy an activity dictionary deeply enough to edit its exchanges.
+
+        Later pipeline stages add, remove and edit exchanges, so the exchange
+        list and each exchange dictionary are copied; other values are shared.
+        """
+        _copy = dict(activity)
+        _copy["exchanges"] = [dict(_ex) for _ex in activity["exchanges"]]
+        return _copy
+
     def ecoinvent_translator(
         self, activity: bw2data.backends.peewee.proxies.Activity, to_db: str
     ):
@@ -360,9 +646,9 @@ class ForegroundDatabase:
         # Create the activity dictionary structure without exchange information
         _value = activity.as_dict()
         _value["exchanges"] = []
-        self.logging.info(
-            msg=f"ForegroundDatabase.ecoinvent_translator: Copying"
-            f" {activity['name']} to database"
+        self.logging.debug(
+            "ForegroundDatabase.ecoinvent_translator: Copying %s to database",
+            _value["name"],
         )
 
         # Append exchanges, if there are any, to the activity dictionary
@@ -374,6 +660,12 @@ class ForegroundDatabase:
 
     def delete_exchanges(self):
         """Remove exchanges from the foreground database."""
+        _log = StageLog(
+            logger=self.logging,
+            stage="ForegroundDatabase.delete_exchanges",
+            record=self.stage_logs,
+        )
+
         if not self.custom_db:
             self.logging.warning(
                 msg="ForegroundDatabase.delete_exchanges: No exchanges in "
@@ -408,14 +700,12 @@ class ForegroundDatabase:
                     (_line[1].activity_database, _line[1].activity_code.strip())
                 ]["exchanges"].pop(_del_ind)
                 # Record the exchange that was removed
-                self.logging.info(
-                    msg="ForegroundDatabase.delete_exchanges: Removed "
-                    f"{_line[1].exchange} from {_line[1].activity}"
-                )
+                _log.count("exchanges_removed")
+                _log.trace("Removed %s from %s", _line[1].exchange, _line[1].activity)
             except ValueError as _e:
-                # If the exchanges does not exist, log a warning that includes information on
-                # the missing exchange
-                self.logging.warning(msg=f"ForegroundDatabase.delete_exchanges: {_e}")
+                # If the exchanges does not exist, record a warning that includes
+                # information on the missing exchange
+                _log.warn("exchanges_not_found", _e)
                 _del_ind = None
 
         # If any activity has its own reference product as an input, remove that exchange.
@@ -433,6 +723,9 @@ class ForegroundDatabase:
                 ].index(True)
                 # Then use .pop to remove it from the activity's exchanges list
                 _act[1]["exchanges"].pop(_pop_ind)
+                _log.count("self_loops_removed")
+
+        _log.summary()
 
     def add_exchanges(self):
         """
@@ -441,41 +734,120 @@ class ForegroundDatabase:
         Append the exchange data to the "exchanges" list of dicts under the
         relevant activity.
         """
+        _log = StageLog(
+            logger=self.logging,
+            stage="ForegroundDatabase.add_exchanges",
+            record=self.stage_logs,
+        )
+
+        _formula = self.add_exchanges_data.formula
+
         for i in self.add_exchanges_data.index:
+            _exchange = {
+                "amount": self.add_exchanges_data.amount[i],
+                "input": (
+                    self.add_exchanges_data.exchange_database[i],
+                    self.add_exchanges_data.exchange_code[i],
+                ),
+                "output": (
+                    self.add_exchanges_data.activity_database[i],
+                    self.add_exchanges_data.activity_code[i],
+                ),
+                "unit": self.add_exchanges_data.unit[i],
+                "type": self.add_exchanges_data.exchange_type[i],
+            }
+            # Kept so the exchange records where its amount came from
+            if self.parameterized[i]:
+                _exchange["formula"] = _formula[i]
+
             try:
                 self.custom_db[
                     (
                         self.add_exchanges_data.activity_database[i],
                         self.add_exchanges_data.activity_code[i],
                     )
-                ]["exchanges"].append(
-                    {
-                        "amount": self.add_exchanges_data.amount[i],
-                        "input": (
-                            self.add_exchanges_data.exchange_database[i],
-                            self.add_exchanges_data.exchange_code[i],
-                        ),
-                        "output": (
-                            self.add_exchanges_data.activity_database[i],
-                            self.add_exchanges_data.activity_code[i],
-                        ),
-                        "unit": self.add_exchanges_data.unit[i],
-                        "type": self.add_exchanges_data.exchange_type[i],
-                    }
-                )
-                self.logging.info(
-                    msg=f"ForegroundDatabase.add_exchanges: Added "
-                    f"{self.add_exchanges_data.exchange[i]} to"
-                    f" {self.add_exchanges_data.activity[i]}"
+                ]["exchanges"].append(_exchange)
+                _log.count("exchanges_added")
+                _log.trace(
+                    "Added %s to %s",
+                    self.add_exchanges_data.exchange[i],
+                    self.add_exchanges_data.activity[i],
                 )
             except KeyError:
-                self.logging.warning(
-                    msg=f"ForegroundDatabase.add_exchanges: {self.add_exchanges_data.activity[i]} "
+                _log.warn(
+                    "activities_not_found",
+                    f"{self.add_exchanges_data.activity[i]} "
                     f"({self.add_exchanges_data.activity_database[i]}, "
-                    f" {self.add_exchanges_data.activity_code[i]}) "
-                    "not found in database"
+                    f"{self.add_exchanges_data.activity_code[i]})",
                 )
 
+        _log.summary()
+
+    def canonicalize_exchanges(self):
+        """
+        Merge duplicate exchanges, drop zero amounts and sort the exchanges.
+
+        See canonicalize.canonicalize_exchanges for the rules.
+        """
+        with StageLog(
+            logger=self.logging,
+            stage="ForegroundDatabase.canonicalize_exchanges",
+            record=self.stage_logs,
+        ) as _log:
+            canonicalize_exchanges(custom_db=self.custom_db, log=_log)
+
+    def evaluate_formulas(self):
+        """
+        Calculate the amounts of Add Exchanges rows that have a formula.
+
+        The compiled formulas are kept in self.formulas for exchange_amounts.
+        See formulas.evaluate_exchanges; errors are logged.
+        """
+        self.parameterized = formula_rows(self.add_exchanges_data)
+
+        if not self.parameterized.any() and self.parameters_data.empty:
+            return None
+
+        with StageLog(
+            logger=self.logging,
+            stage="ForegroundDatabase.evaluate_formulas",
+            record=self.stage_logs,
+        ) as _log:
+            try:
+                self.formulas = evaluate_exchanges(
+                    exchanges=self.add_exchanges_data,
+                    rows=self.parameterized,
+                    parameters=self.parameters_data,
+                    log=_log,
+                )
+            except ValueError as _e:
+                self.logging.error(msg=f"ForegroundDatabase.evaluate_formulas: {_e}")
+                sys.exit('Error: Check log file')
+
+        return None
+
+    def exchange_amounts(self, scenarios):
+        """
+        Evaluate the Add Exchanges formulas for several parameter sets at once.
+
+        See formulas.scenario_amounts for the parameters and the result.
+        """
+        if self.formulas is None:
+            self.logging.error(
+                msg="ForegroundDatabase.exchange_amounts: No exchanges have formulas"
+            )
+            sys.exit('Error: Check log file')
+
+        try:
+            return scenario_amounts(
+                model=self.formulas,
+                exchanges=self.add_exchanges_data.loc[self.parameterized],
+                scenarios=scenarios,
+            )
+        except ValueError as _e:
+            self.logging.error(msg=f"ForegroundDatabase.exchange_amounts: {_e}")
+            sys.exit('Error: Check log file')
+
     def validate(self):
         """
         Use built-in Brightway method to validate the foreground database before linking.
@@ -484,6 +856,10 @@ class ForegroundDatabase:
         case the code fails as well and the Exception is written to the log
         file. If db_validator just returns a copy of the dictionary, then the
         database validated successfully and no value is returned.
+
+        The supply-chain graph of the database is then built and stored in
+        self.graph. Cycles between foreground activities and inputs that refer
+        to missing foreground activities are logged as warnings.
         """
         validate = db_validator(self.custom_db)
         if not isinstance(validate, dict):
@@ -497,6 +873,127 @@ class ForegroundDatabase:
                 msg="ForegroundDatabase.validate: Custom database is valid"
             )
 
-    def write_foreground_db(self):
-        """Use SQL backend to write the foreground database to file."""
-        raise NotImplementedError
+        with StageLog(
+            logger=self.logging,
+            stage="ForegroundDatabase.validate",
+            record=self.stage_logs,
+        ) as _log:
+            self.graph = SupplyGraph(custom_db=self.custom_db)
+
+            _log.count("activities", len(self.graph.keys))
+            _log.count("foreground_links", self.graph.links)
+            _log.count("external_links", self.graph.external_links)
+
+            for _cycle in self.graph.cycles():
+                _log.warn("cycles", _cycle)
+            for _activity, _input in self.graph.dangling:
+                _log.warn("dangling_inputs", f"{_activity} <- {_input}")
+
+    def export_matrices(self, directory, prefix=""):
+        """
+        Write the assembled database as sparse technosphere and biosphere matrices.
+
+        See matrix_export for the matrix layout and file names.
+
+        Parameters
+        ----------
+        directory : path
+            Directory to write the matrices and their index file to.
+
+        prefix : str
+            Prefix for the file names.
+        """
+        with StageLog(
+            logger=self.logging,
+            stage="ForegroundDatabase.export_matrices",
+            record=self.stage_logs,
+        ) as _log:
+            for _event, _value in export_matrices(
+                custom_db=self.custom_db, directory=directory, prefix=prefix
+            ).items():
+                if isinstance(_value, int):
+                    _log.count(_event, _value)
+                else:
+                    _log.trace("%s %s", _event, _value)
+
+    def split_foreground(self, name: str, shard_by: str):
+        """
+        Split the assembled database into shards by a Create Activities column.
+
+        Created activities go to the shard named after their value in
+        <shard_by>. Copied activities go to the shard of their location if
+        <shard_by> is activity_location. Activities without a value stay in
+        database <name>. Exchanges between shards are pointed at the shard of
+        their input.
+
+        Parameters
+        ----------
+        name : str
+            Name of the foreground database.
+
+        shard_by : str
+            Create Activities column to split on.
+
+        Returns
+        -------
+        Dictionary of shard databases in dictionary format, by database name
+        """
+        if shard_by not in self.create_activities_data.columns:
+            self.logging.error(
+                msg=f"ForegroundDatabase.split_foreground: {shard_by} is not a "
+                f"Create Activities column"
+            )
+            sys.exit('Error: Check log file')
+
+        _values = dict(
+            zip(
+                zip(
+                    self.create_activities_data.activity_database,
+                    self.create_activities_data.code,
+                ),
+                self.create_activities_data[shard_by],
+            )
+        )
+
+        _shard_of = assign_shards(
+            custom_db=self.custom_db,
+            name=name,
+            values=_values,
+            by_location=shard_by == "activity_location",
+        )
+
+        with StageLog(
+            logger=self.logging,
+            stage="ForegroundDatabase.split_foreground",
+            record=self.stage_logs,
+        ) as _log:
+            _shards = split_shards(custom_db=self.custom_db, shard_of=_shard_of)
+            _log.count("shards", len(set(_shards) - {name}))
+            _log.count("cross_shard_exchanges", cross_shard_exchanges(_shards))
+
+        return _shards
+
+    def write_foreground_db(self, name: str):
+        """
+        Use SQL backend to write the foreground database to file.
+
+        Any existing database <name> is replaced in the same SQLite transaction.
+        A sharded database is written as its shards, skipping unchanged ones.
+
+        Parameters
+        ----------
+        name : str
+            Name of the Brightway database to write.
+        """
+        try:
+            write_foreground(
+                session=self.session,
+                name=name,
+                custom_db=self.custom_db,
+                shards=self.shards,
+                logging=self.logging,
+            )
+        except KeyError as _e:
+            self.logging.warning(
+                msg=f"ForegroundDatabase.write_foreground_db: KeyError on database write: {_e}"
+            )
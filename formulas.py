@@ -0,0 +1,380 @@
+"""
+Created on October 19 2026.
+
+Named parameters and exchange amount formulas, evaluated with NumPy.
+
+Formulas are Python expressions over parameter names, numbers, arithmetic and
+comparison operators and the functions in FUNCTIONS. Each distinct formula is
+parsed, checked and compiled once. Evaluation binds every parameter to an
+array with one value per parameter set, so one pass over the compiled
+formulas gives the amounts of all exchanges in all parameter sets.
+
+@author: rhanes
+"""
+import ast
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# Functions and constants available in formulas; all of them act elementwise
+FUNCTIONS = {
+    "abs": np.abs,
+    "exp": np.exp,
+    "log": np.log,
+    "log10": np.log10,
+    "sqrt": np.sqrt,
+    "min": np.minimum,
+    "max": np.maximum,
+    "where": np.where,
+}
+
+CONSTANTS = {"pi": np.pi, "e": np.e}
+
+# Number of arguments each function takes
+ARITY = {
+    "abs": 1,
+    "exp": 1,
+    "log": 1,
+    "log10": 1,
+    "sqrt": 1,
+    "min": 2,
+    "max": 2,
+    "where": 3,
+}
+
+_NODES = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.Compare,
+    ast.Call,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.FloorDiv,
+    ast.Mod,
+    ast.Pow,
+    ast.USub,
+    ast.UAdd,
+    ast.Lt,
+    ast.LtE,
+    ast.Gt,
+    ast.GtE,
+    ast.Eq,
+    ast.NotEq,
+)
+
+
+def compile_formula(formula, parameters=()):
+    """
+    Parse and compile one formula.
+
+    Parameters
+    ----------
+    formula : str
+        Python expression.
+
+    parameters : set
+        Names of the defined parameters. A parameter with the name of one of
+        the CONSTANTS replaces the constant.
+
+    Returns
+    -------
+    Tuple of the compiled code and the set of parameter names it uses. Raises
+    ValueError if the formula isn't a valid expression, uses anything other
+    than numbers, operators, names and the functions in FUNCTIONS, or calls a
+    function with the wrong number of arguments.
+    """
+    try:
+        _tree = ast.parse(str(formula).strip(), mode="eval")
+    except SyntaxError as _e:
+        raise ValueError(f"Formula {formula!r} is not valid: {_e.msg}") from None
+
+    _names = set()
+    for _node in ast.walk(_tree):
+        if not isinstance(_node, _NODES):
+            raise ValueError(
+                f"Formula {formula!r} uses {type(_node).__name__}, which isn't allowed"
+            )
+        if isinstance(_node, ast.Constant) and not isinstance(
+            _node.value, (int, float)
+        ):
+            raise ValueError(f"Formula {formula!r} uses non-numeric {_node.value!r}")
+        if isinstance(_node, ast.Call) and not (
+            isinstance(_node.func, ast.Name)
+            and _node.func.id in FUNCTIONS
+            and not _node.keywords
+        ):
+            raise ValueError(f"Formula {formula!r} calls an unknown function")
+        if isinstance(_node, ast.Call) and len(_node.args) != ARITY[_node.func.id]:
+            raise ValueError(
+                f"Formula {formula!r}: {_node.func.id} takes "
+                f"{ARITY[_node.func.id]} arguments, not {len(_node.args)}"
+            )
+        if isinstance(_node, ast.Name) and _node.id not in FUNCTIONS:
+            _names.add(_node.id)
+
+    return compile(_tree, "<formula>", "eval"), _names - (
+        set(CONSTANTS) - set(parameters)
+    )
+
+
+def _evaluate(code, label, functions, values):
+    """Evaluate compiled formula <code>, raising ValueError if it fails."""
+    try:
+        # code is compiled from an expression checked by compile_formula
+        return eval(code, functions, values)  # pylint: disable=eval-used
+    except (TypeError, ArithmeticError) as _e:
+        raise ValueError(f"{label} can't be evaluated: {_e}") from None
+
+
+def topological_order(depends):
+    """
+    Order names so that each comes after the names it depends on.
+
+    Parameters
+    ----------
+    depends : dict
+        Set of names that each name depends on. Every name in the sets must
+        also be a key.
+
+    Returns
+    -------
+    List of names. Raises ValueError, listing the names that are left, if
+    some names depend on each other in a cycle.
+    """
+    _waiting = {_name: len(_uses) for _name, _uses in depends.items()}
+    _users = {_name: [] for _name in depends}
+    for _name, _uses in depends.items():
+        for _use in _uses:
+            _users[_use].append(_name)
+
+    _ready = deque(_name for _name, _n in _waiting.items() if not _n)
+    _order = []
+    while _ready:
+        _name = _ready.popleft()
+        _order.append(_name)
+        for _user in _users[_name]:
+            _waiting[_user] -= 1
+            if not _waiting[_user]:
+                _ready.append(_user)
+
+    if len(_order) < len(depends):
+        raise ValueError(
+            "Parameters depend on each other: " f"{sorted(set(depends) - set(_order))}"
+        )
+
+    return _order
+
+
+class FormulaModel:
+    """Parameters and a list of formulas, compiled for repeated evaluation."""
+
+    def __init__(self, parameters, formulas):
+        """
+        Compile <formulas> and the formulas of <parameters>.
+
+        Parameters
+        ----------
+        parameters : DataFrame
+            Parameters sheet, with name, amount and formula columns. A
+            parameter with a formula is calculated from other parameters;
+            otherwise amount is its default value.
+
+        formulas : list
+            Formulas to evaluate, such as exchange amounts. Repeated formulas
+            are compiled and evaluated once.
+
+        Raises
+        ------
+        ValueError
+            If a formula is invalid or uses an undefined parameter, a
+            parameter has neither an amount nor a formula or is defined twice,
+            or parameters depend on each other in a cycle.
+        """
+        _duplicated = parameters.name[parameters.name.duplicated()].unique()
+        if len(_duplicated):
+            raise ValueError(
+                f"Parameters {list(_duplicated)} are defined more than once"
+            )
+
+        self.amounts = {}
+        self.compiled = {}
+        _depends = {}
+        _defined = set(parameters.name)
+        for _row in parameters.itertuples(index=False):
+            if pd.notna(_row.formula) and str(_row.formula).strip():
+                self.compiled[_row.name], _depends[_row.name] = compile_formula(
+                    _row.formula, parameters=_defined
+                )
+            elif pd.notna(_row.amount):
+                self.amounts[_row.name] = float(_row.amount)
+                _depends[_row.name] = set()
+            else:
+                raise ValueError(f"Parameter {_row.name} has no amount or formula")
+
+        self.parameters = list(_depends)
+
+        # Formulas as indices into the distinct formulas
+        self.formulas, _inverse = np.unique(
+            np.asarray([str(_f).strip() for _f in formulas], dtype=object),
+            return_inverse=True,
+        )
+        self.inverse = _inverse.reshape(-1)
+        self.code = []
+        _uses = dict(_depends)
+        for _formula in self.formulas:
+            _code, _uses[f"formula {_formula}"] = compile_formula(
+                _formula, parameters=_defined
+            )
+            self.code.append(_code)
+
+        _undefined = {
+            _name: sorted(_names - set(self.parameters))
+            for _name, _names in _uses.items()
+            if _names - set(self.parameters)
+        }
+        if _undefined:
+            raise ValueError(f"Undefined parameters in {_undefined}")
+
+        # Parameters are calculated after the parameters their formulas use
+        self.order = topological_order(_depends)
+
+    def evaluate(self, scenarios=None):
+        """
+        Evaluate all formulas in every parameter set.
+
+        Parameters
+        ----------
+        scenarios : DataFrame
+            Optional parameter sets, one per row, with a column for each
+            parameter that is changed from its default. A column may also
+            replace a parameter's formula. If None, the defaults are used.
+
+        Returns
+        -------
+        Array with one row per formula and one column per parameter set.
+        Raises ValueError if a formula can't be evaluated, e.g. because it
+        divides by a literal zero.
+        """
+        if scenarios is None:
+            scenarios = pd.DataFrame(index=[0])
+
+        _unknown = set(scenarios.columns) - set(self.parameters)
+        if _unknown:
+            raise ValueError(f"Scenarios set unknown parameters {sorted(_unknown)}")
+
+        _n = len(scenarios)
+        _globals = dict(FUNCTIONS, __builtins__={})
+        _values = dict(CONSTANTS)
+        for _name in self.order:
+            if _name in scenarios.columns:
+                _values[_name] = scenarios[_name].to_numpy(dtype=float)
+            elif _name in self.amounts:
+                _values[_name] = np.full(_n, self.amounts[_name])
+            else:
+                _values[_name] = np.broadcast_to(
+                    _evaluate(
+                        self.compiled[_name], f"Parameter {_name}", _globals, _values
+                    ),
+                    (_n,),
+                )
+
+        _results = np.empty((len(self.code), _n))
+        for _i, _code in enumerate(self.code):
+            _results[_i] = _evaluate(
+                _code, f"Formula {self.formulas[_i]!r}", _globals, _values
+            )
+
+        return _results[self.inverse]
+
+
+def formula_rows(exchanges):
+    """Return a mask of the Add Exchanges rows whose amount is given by a formula."""
+    return exchanges.formula.fillna("").astype(str).str.strip() != ""
+
+
+def evaluate_exchanges(exchanges, rows, parameters, log):
+    """
+    Calculate the amounts of Add Exchanges rows that have a formula.
+
+    Formulas may use the parameters in the Parameters sheet. They are compiled
+    once, with the parameter formulas, into a FormulaModel that can be reused
+    to evaluate other parameter sets.
+
+    Parameters
+    ----------
+    exchanges : DataFrame
+        Add Exchanges sheet, whose amount column is updated.
+
+    rows : Series
+        Mask of the rows with a formula, from formula_rows.
+
+    parameters : DataFrame
+        Parameters sheet.
+
+    log : StageLog
+        Stage summary to count parameters and formulas in.
+
+    Returns
+    -------
+    FormulaModel of the formulas. Raises ValueError for invalid formulas,
+    undefined parameters and parameters that depend on each other in a cycle.
+    """
+    _model = FormulaModel(
+        parameters=parameters.reindex(columns=["name", "amount", "formula"]),
+        formulas=exchanges.formula[rows],
+    )
+    _amounts = _model.evaluate()[:, 0]
+    exchanges.loc[rows, "amount"] = _amounts
+
+    log.count("parameters", len(_model.parameters))
+    log.count("formulas", len(_model.code))
+    log.count("exchanges_parameterized", int(rows.sum()))
+    for _i in np.flatnonzero(~np.isfinite(_amounts)):
+        log.warn("amounts_not_finite", exchanges.formula[rows].iloc[_i])
+
+    return _model
+
+
+def scenario_amounts(model, exchanges, scenarios):
+    """
+    Evaluate exchange formulas for several parameter sets at once.
+
+    Parameters
+    ----------
+    model : FormulaModel
+        Compiled formulas of <exchanges>, from evaluate_exchanges.
+
+    exchanges : DataFrame
+        Add Exchanges rows with a formula.
+
+    scenarios : DataFrame
+        One parameter set per row, with a column for each parameter that
+        differs from its value in the Parameters sheet.
+
+    Returns
+    -------
+    DataFrame with the activity and exchange keys of each exchange, and its
+    amount under each parameter set in columns labelled with the scenarios
+    index. Raises ValueError if a formula can't be evaluated.
+    """
+    return pd.concat(
+        [
+            exchanges[
+                [
+                    "activity_database",
+                    "activity_code",
+                    "exchange_database",
+                    "exchange_code",
+                ]
+            ].reset_index(drop=True),
+            pd.DataFrame(model.evaluate(scenarios=scenarios), columns=scenarios.index),
+        ],
+        axis=1,
+    )
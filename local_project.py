@@ -5,17 +5,29 @@ Created on January 26 2022.
 """
 import sys
 import os
-import yaml
+import time
 
+import pandas as pd
 import brightway2 as bw
 
+from background_snapshot import export_snapshot, snapshot_root
+from config import read_config
+from data_manager import MigrationMap
 from foreground_database import ForegroundDatabase
+from migration import SHEET_KEYS, Migration, migrate_database, migrate_sheets
+from plan import build_plan
+from results_store import ResultsStore, file_hash
+from project_session import ProjectSession
+from shards import planned_databases
+from batch import BatchBuild
 
 
 class LocalProject:
     """Create and set up a local Brightway project."""
 
-    def __init__(self, parser, logging):
+    def __init__(  # pylint: disable=too-many-arguments
+        self, parser, logging, build=True, args=None, read_only=False, *, configs=None
+    ):
         """
         Initialize the project.
 
@@ -28,58 +40,133 @@ class LocalProject:
         logging
             logger object for writing status messages to file
 
+        build : Boolean
+            Whether to build the foreground database from the case study config.
+            If False, the project is only opened and checked, and foreground
+            databases can be built later with build_foreground.
+
+        args : argparse.Namespace
+            Already parsed command line arguments. If None, parser is used to
+            parse them.
+
+        read_only : Boolean
+            Open an existing project without changing it, e.g. to plan a build.
+            Implies build=False.
+
+        configs : tuple
+            Brightway config and case study config, if already read from the
+            files named in args. If None, the files are read here.
+
         """
+        self.logging = logging
+
+        if args is None:
+            args = parser.parse_args()
+
         # read in config (YAML) file with error handling; get variable groups
-        bwconfig_filename = os.path.join(
-            parser.parse_args().data, parser.parse_args().bwconfig
-        )
-        caseconfig_filename = os.path.join(
-            parser.parse_args().data, parser.parse_args().caseconfig
+        if configs is None:
+            configs = (
+                self.read_config(os.path.join(args.data, args.bwconfig), logging),
+                self.read_config(os.path.join(args.data, args.caseconfig), logging),
+            )
+        _bwconfig, _caseconfig = configs
+
+        self.bwconfig = _bwconfig
+        _flags = _bwconfig.get("flags", {})
+        self.file_io = _bwconfig.get("fileIO")
+
+        foreground = _caseconfig.get("foreground_db", {})
+        self.foreground = foreground
+        # calcs = caseconfig.get("calculations", {})
+        self.proj_params = _caseconfig.get("project_parameters", {})
+
+        self.open_project(
+            create_new_project=_flags.get("create_new_project"), read_only=read_only
         )
 
-        try:
-            with open(bwconfig_filename, "r", encoding="utf-8") as _f:
-                _bwconfig = yaml.load(_f, Loader=yaml.FullLoader)
-                _flags = _bwconfig.get("flags", {})
-        except IOError as err:
-            logging.error(msg=f"LocalProject: {bwconfig_filename} {err}")
-            sys.exit('Error: Check log file')
+        if read_only:
+            return
 
-        try:
-            with open(caseconfig_filename, "r", encoding="utf-8") as _f:
-                _caseconfig = yaml.load(_f, Loader=yaml.FullLoader)
-                foreground = _caseconfig.get("foreground_db", {})
-                # calcs = caseconfig.get("calculations", {})
-                proj_params = _caseconfig.get("project_parameters", {})
-        except IOError as err:
-            logging.error(msg=f"LocalProject: {caseconfig_filename} {err}")
+        if build and isinstance(foreground, list):
+            # Several foreground databases: assemble them in parallel
+            self.build_batch(
+                foregrounds=foreground, processes=getattr(args, "processes", None)
+            )
+        elif build:
+            # Assemble database for import, validate the database, and optionally
+            # save a copy for later use
+            self.build_foreground(foreground=foreground)
+
+    @staticmethod
+    def read_config(fpath, logging):
+        """
+        Read a YAML config file, logging an error and exiting if it can't be read.
+
+        Parameters
+        ----------
+        fpath : path
+            Config file to read.
+
+        logging
+            logger object for writing status messages to file
+
+        Returns
+        -------
+        Dictionary of config file contents; empty if the file is empty
+        """
+        return read_config(fpath, logging=logging)
+
+    def open_project(self, create_new_project=False, read_only=False):
+        """
+        Set the Brightway project as current and check its background databases.
+
+        Parameters
+        ----------
+        create_new_project : Boolean
+            If True, exit with an error if the project already exists.
+
+        read_only : Boolean
+            If True, exit with an error if the project doesn't exist, and don't
+            set up the biosphere database.
+        """
+        proj_params = self.proj_params
+
+        if read_only and proj_params.get("name") not in bw.projects:
+            self.logging.error(
+                msg=f"LocalProject: Project {proj_params.get('name')} does not exist."
+            )
             sys.exit('Error: Check log file')
 
         # If the project already exists, throw an error.
-        if _flags.get("create_new_project") and proj_params.get("name") in [
+        if create_new_project and proj_params.get("name") in [
             i[0] for i in bw.projects.report()
         ]:
-            logging.error(
+            self.logging.error(
                 msg=f"LocalProject: Project {proj_params.get('name')} already exists."
             )
             sys.exit('Error: Check log file')
 
-        # Instantiate the new project
-        bw.projects.set_current(proj_params.get("name"))
+        # Instantiate the new project; the session keeps it open for the run
+        self.session = ProjectSession(
+            name=proj_params.get("name"), logging=self.logging, read_only=read_only
+        )
 
         # Log current project name and directory
-        logging.info(msg=f"LocalProject: Current project name is {bw.projects.current}")
-        logging.info(
+        self.logging.info(
+            msg=f"LocalProject: Current project name is {bw.projects.current}"
+        )
+        self.logging.info(
             msg=f"LocalProject: Current project directory is {bw.projects.dir}"
         )
 
         # Default setup step for biosphere database
         # This will only execute if the project is brand new
-        bw.bw2setup()
+        if not read_only:
+            bw.bw2setup()
 
         # Previously imported database check
-        _bw_db_list = [key for key, value in bw.databases.items()]
-        logging.info(
+        _bw_db_list = sorted(self.session.databases)
+        self.logging.info(
             msg=f"LocalProject: {proj_params.get('name')} databases are {_bw_db_list}"
         )
 
@@ -93,42 +180,384 @@ class LocalProject:
                     _missing.append(proj_params.get("include_databases")[_i])
 
             if _missing:
-                logging.error(
+                self.logging.error(
                     msg=f"LocalProject: {_missing} must be imported before proceeding"
                 )
                 sys.exit('Error: Check log file')
 
         else:
-            logging.info(
+            self.logging.info(
                 msg=f"LocalProject: No databases specified: using {_bw_db_list}"
             )
 
-        # Find and delete any foreground databases with the same name as the one being
-        # created.
-        if foreground.get("name") in _bw_db_list:
-            logging.warning(
-                msg=f"LocalProject: Deleting existing foreground database {foreground.get('name')}"
+    def build_foreground(self, foreground, background_cache=None):
+        """
+        Replace the foreground database with one assembled from its import file.
+
+        The existing foreground database is only replaced once the new one has
+        been assembled and validated.
+
+        Parameters
+        ----------
+        foreground : dict
+            The foreground_db section of the case study config.
+
+        background_cache : dict
+            Optional cache of copied background activities, kept between builds
+            by long-running processes. See ForegroundDatabase.
+
+        Returns
+        -------
+        ForegroundDatabase
+        """
+        return ForegroundDatabase(
+            logging=self.logging,
+            prj_dict=self.proj_params,
+            fg_dict=foreground,
+            file_io=self.file_io,
+            background_cache=background_cache,
+            session=self.session,
+        )
+
+    def build_batch(self, foregrounds, processes=None):
+        """
+        Build several foreground databases, assembling them in parallel.
+
+        Parameters
+        ----------
+        foregrounds : list
+            List of foreground_db dictionaries from the case study config. See
+            BatchBuild for the optional depends_on key.
+
+        processes : int
+            Number of worker processes. Defaults to the number of CPUs.
+
+        Returns
+        -------
+        DataFrame summarising the status and timings of each foreground database
+        """
+        return BatchBuild(
+            project=self,
+            foregrounds=foregrounds,
+            logging=self.logging,
+            processes=processes,
+        ).run()
+
+    def plan(self, foregrounds=None):
+        """
+        Assemble foreground databases without writing them and describe the changes.
+
+        Nothing is written to the project or saved to the data directory. In a
+        list of foreground databases, each one is compared with the version
+        currently in the project, including databases it depends on. Sharded
+        databases are compared shard by shard.
+
+        Parameters
+        ----------
+        foregrounds : dict or list
+            The foreground_db section of the case study config. Defaults to the
+            one read from the config file.
+
+        Returns
+        -------
+        List with one plan dictionary per foreground database; see plan.build_plan
+        """
+        if foregrounds is None:
+            foregrounds = self.foreground
+        if isinstance(foregrounds, dict):
+            foregrounds = [foregrounds]
+
+        _plans = []
+        for _foreground in foregrounds:
+            _name = _foreground.get("name")
+            _start = time.perf_counter()
+            try:
+                _fdb = ForegroundDatabase(
+                    logging=self.logging,
+                    prj_dict=self.proj_params,
+                    fg_dict=dict(
+                        _foreground,
+                        save_db=False,
+                        export_matrices=False,
+                        checkpoint=False,
+                    ),
+                    file_io=self.file_io,
+                    write=False,
+                    session=self.session,
+                )
+            except SystemExit as _e:
+                # Errors are logged before ForegroundDatabase exits
+                _plans.append({"database": _name, "error": str(_e)})
+                continue
+
+            # A sharded database is compared shard by shard
+            _databases, _written, _current = planned_databases(
+                session=self.session,
+                name=_name,
+                custom_db=_fdb.custom_db,
+                shards=_fdb.shards,
             )
-            del bw.databases[foreground.get("name")]
+            _plan = {"database": _name, "error": None}
+            _plan.update(
+                build_plan(
+                    fdb=_fdb,
+                    existing={_db: bw.Database(_db).load() for _db in _current},
+                    databases=_databases,
+                    written=_written,
+                )
+            )
+            _plan["elapsed"] = time.perf_counter() - _start
+            _plans.append(_plan)
 
-        # Create a new blank database to hold the one being created
-        bw.Database(foreground.get("name")).write(data={})
+            self.logging.info(
+                "LocalProject.plan: %s would write %d activities (%d created, %d "
+                "deleted, %d changed) and %d exchanges",
+                _name,
+                _plan["cost"]["write_activities"],
+                len(_plan["diff"]["activities"]["created"]),
+                len(_plan["diff"]["activities"]["deleted"]),
+                len(_plan["diff"]["activities"]["changed"]),
+                _plan["cost"]["write_exchanges"],
+            )
 
-        # Log the updated list of databases in this Brightway project
-        _bw_db_list = [key for key, value in bw.databases.items()]
-        logging.info(
-            msg=f"LocalProject: {proj_params.get('name')} databases are {_bw_db_list}"
+        return _plans
+
+    def export_snapshots(self, databases=None):
+        """
+        Write memory-mapped snapshots of background databases.
+
+        ForegroundDatabase.copy_activities reads from a snapshot instead of the
+        project while the database is unchanged.
+
+        Parameters
+        ----------
+        databases : list
+            Names of the databases to snapshot. Defaults to include_databases.
+        """
+        _root = snapshot_root(self.file_io)
+
+        for _db in databases or self.proj_params.get("include_databases") or []:
+            _manifest = export_snapshot(
+                database=_db, root=_root, project=self.proj_params.get("name")
+            )
+            self.logging.info(
+                "LocalProject.export_snapshots: Wrote snapshot of %s with %d "
+                "activities and %d exchanges to %s",
+                _db,
+                _manifest["activities"],
+                _manifest["exchanges"],
+                _root,
+            )
+
+    def results_store(self):
+        """
+        Open the store of LCIA results.
+
+        The store is the results_store file in the fileIO config, by default
+        results.sqlite in the data directory.
+
+        Returns
+        -------
+        ResultsStore, to be closed by the caller
+        """
+        return ResultsStore(
+            fpath=self.file_io.get("results_store")
+            or os.path.join(self.file_io["data_directory"], "results.sqlite")
         )
 
-        # Assemble database for import, validate the database, and optionally save a copy for
-        # later use
-        ForegroundDatabase(
-            logging=logging,
-            prj_dict=proj_params,
-            fg_dict=foreground,
-            file_io=_bwconfig.get("fileIO"),
+    def store_results(self, results, foreground=None, scenario=None, metadata=None):
+        """
+        Record the LCIA results of one run of a foreground database.
+
+        Parameters
+        ----------
+        results : DataFrame
+            Scores with activity_database, activity_code, method and score
+            columns.
+
+        foreground : dict
+            Foreground database config the results were calculated for.
+            Defaults to the case study foreground database.
+
+        scenario : str
+            Optional name of the scenario or parameter set.
+
+        metadata : dict
+            Optional information about the run.
+
+        Returns
+        -------
+        Run id of the results in the store
+        """
+        foreground = foreground or self.foreground
+        _workbook = os.path.join(
+            self.file_io["data_directory"], foreground.get("fg_db_import")
+        )
+
+        with self.results_store() as _store:
+            _run = _store.start_run(
+                project=self.proj_params.get("name"),
+                database=foreground.get("name"),
+                workbook_hash=file_hash(_workbook),
+                scenario=scenario,
+                metadata=metadata,
+            )
+            _store.append(run_id=_run, results=results)
+
+        self.logging.info(
+            "LocalProject.store_results: Stored %d scores for %s as run %d",
+            len(results),
+            foreground.get("name"),
+            _run,
         )
 
+        return _run
+
+    def migrate(self, mapping, foregrounds=None):
+        """
+        Move foreground databases to a new version of their background databases.
+
+        The Migration sheet of <mapping> maps old background keys to new ones;
+        see data_manager.MigrationMap. Each import file is rewritten to a new
+        file with _migrated added to its name, so the original is kept. A
+        foreground database already in the project is rewritten in place.
+
+        Parameters
+        ----------
+        mapping : path
+            Excel file with a Migration sheet.
+
+        foregrounds : dict or list
+            The foreground_db section of the case study config. Defaults to the
+            one read from the config file.
+
+        Returns
+        -------
+        List with one report per foreground database, giving the migrated
+        import file, the keys rewritten and unmapped keys in each sheet, and
+        the same for the database in the project if there is one. A foreground
+        database in which several copied activities would be renamed to the
+        same key is not migrated; its report lists them under collisions.
+        """
+        if foregrounds is None:
+            foregrounds = self.foreground
+        if isinstance(foregrounds, dict):
+            foregrounds = [foregrounds]
+
+        try:
+            _mapping = MigrationMap(fpath=mapping)
+        except (OSError, ValueError, AssertionError) as err:
+            self.logging.error(msg=f"LocalProject.migrate: {mapping} {err}")
+            sys.exit("Error: Check log file")
+
+        _start = time.perf_counter()
+        _migration = Migration(_mapping)
+
+        _missing = set(_mapping.new_database) - set(self.session.databases)
+        if _missing:
+            self.logging.error(
+                msg=f"LocalProject.migrate: Databases {sorted(_missing)} are not "
+                f"in project {self.proj_params.get('name')}"
+            )
+            sys.exit("Error: Check log file")
+
+        if _migration.bad_shares:
+            self.logging.warning(
+                "LocalProject.migrate: Shares of %d keys don't sum to 1, e.g. %s",
+                len(_migration.bad_shares),
+                _migration.bad_shares[:5],
+            )
+
+        # Keys are read as text so codes that look like numbers keep their form
+        _text = {
+            _c: str for _keys in SHEET_KEYS.values() for _pair in _keys for _c in _pair
+        }
+
+        _reports = []
+        for _foreground in foregrounds:
+            _name = _foreground.get("name")
+            _workbook = os.path.join(
+                self.file_io["data_directory"], _foreground.get("fg_db_import")
+            )
+            _migrated = f"{os.path.splitext(_workbook)[0]}_migrated.xlsx"
+
+            _sheets, _report = migrate_sheets(
+                sheets=pd.read_excel(_workbook, sheet_name=None, dtype=_text),
+                migration=_migration,
+                foreground=_name,
+            )
+            _report = {"database": _name, "workbook": None, "sheets": _report}
+
+            # Sharded databases refer to each other, so they are rebuilt instead
+            _data = None
+            _sharded = _name in self.session.databases and bw.databases[_name].get(
+                "shards"
+            )
+            if _name in self.session.databases and not _sharded:
+                _data, _report["project"] = migrate_database(
+                    custom_db=bw.Database(_name).load(), migration=_migration
+                )
+
+            # Nothing is written if activities would be merged under one key
+            _collisions = _report["sheets"].get("collisions") or _report.get(
+                "project", {}
+            ).get("collisions")
+            if _collisions:
+                self.logging.error(
+                    msg=f"LocalProject.migrate: {_name} was not migrated; "
+                    f"{len(_collisions)} new keys would each be shared by several "
+                    f"copied activities, e.g. {_collisions[:5]}"
+                )
+                _report["error"] = "collisions"
+                _reports.append(_report)
+                continue
+
+            # pylint: disable-next=abstract-class-instantiated
+            with pd.ExcelWriter(_migrated) as _writer:
+                for _sheet, _frame in _sheets.items():
+                    _frame.to_excel(_writer, sheet_name=_sheet, index=False)
+            _report["workbook"] = _migrated
+
+            if _sharded:
+                self.logging.warning(
+                    "LocalProject.migrate: %s is sharded; build it from %s to "
+                    "migrate it",
+                    _name,
+                    _migrated,
+                )
+            elif _data is not None:
+                self.session.replace_database(name=_name, data=_data)
+
+            for _part, _counts in list(_report["sheets"].items()) + [
+                ("project database", _report.get("project"))
+            ]:
+                if _counts and _counts["unmapped"]:
+                    self.logging.warning(
+                        "LocalProject.migrate: %d keys in %s of %s are not in the "
+                        "mapping, e.g. %s",
+                        len(_counts["unmapped"]),
+                        _part,
+                        _name,
+                        _counts["unmapped"][:5],
+                    )
+
+            self.logging.info(
+                "LocalProject.migrate: Wrote %s (%s)%s in %.3f s",
+                _migrated,
+                ", ".join(
+                    f"{_sheet}: {_counts['keys_rewritten']} keys"
+                    for _sheet, _counts in _report["sheets"].items()
+                ),
+                f" and migrated {_name} ({_report['project']['exchanges_rewritten']} "
+                "exchanges)"
+                if "project" in _report
+                else "",
+                time.perf_counter() - _start,
+            )
+            _reports.append(_report)
+
+        return _reports
+
     @staticmethod
     def calculations():
         """Perform standard LCIA calculations."""
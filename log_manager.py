@@ -0,0 +1,221 @@
+"""
+Created on October 19 2026.
+
+Logging setup and per-stage log summaries for autoBW.
+
+Log records are handed to a queue and written to file by a background thread,
+so the pipeline never blocks on disk IO. Pipeline stages aggregate their
+per-row events into counts and emit one summary record when they finish;
+per-row tracing is only formatted when the logger is set to DEBUG.
+
+@author: rhanes
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import time
+from collections import Counter
+
+LOGGER_NAME = "autobw"
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Maximum number of example items listed in an aggregated warning
+MAX_EXAMPLES = 20
+
+
+def setup_logging(fpath, verbose=False):
+    """
+    Route all log records through a queue to a file written on a background thread.
+
+    Parameters
+    ----------
+    fpath : path
+        Log file to write.
+
+    verbose : Boolean
+        Log per-row trace messages (DEBUG level) in addition to stage summaries.
+
+    Returns
+    -------
+    Logger to pass through LocalProject and ForegroundDatabase.
+    """
+    _queue = queue.SimpleQueue()
+
+    _file_handler = logging.FileHandler(fpath, encoding="utf-8")
+    _file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    _listener = logging.handlers.QueueListener(_queue, _file_handler)
+
+    # Replace any existing handlers so that records are only written once
+    _root = logging.getLogger()
+    for _handler in _root.handlers[:]:
+        _root.removeHandler(_handler)
+    _root.addHandler(logging.handlers.QueueHandler(_queue))
+    _root.setLevel(logging.DEBUG if verbose else logging.INFO)
+
+    _listener.start()
+    # Flush the queue on exit, including after sys.exit on errors
+    atexit.register(_listener.stop)
+
+    return logging.getLogger(LOGGER_NAME)
+
+
+def worker_logging(log_queue, level=logging.INFO):
+    """
+    Send this process's log records to <log_queue>.
+
+    Used as the initializer of worker processes, whose records are written to
+    the parent's log file by forward_records.
+
+    Parameters
+    ----------
+    log_queue : multiprocessing.Queue
+        Queue shared with the parent process.
+
+    level : int
+        Logging level of the parent process.
+    """
+    _root = logging.getLogger()
+    for _handler in _root.handlers[:]:
+        _root.removeHandler(_handler)
+    _root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _root.setLevel(level)
+
+
+class _ForwardHandler(logging.Handler):
+    """Re-emit records received from worker processes through local loggers."""
+
+    def emit(self, record):
+        """Pass <record> to the logger it was created by."""
+        logging.getLogger(record.name).handle(record)
+
+
+def forward_records(log_queue):
+    """
+    Write log records sent by worker processes to this process's log handlers.
+
+    Parameters
+    ----------
+    log_queue : multiprocessing.Queue
+        Queue passed to worker_logging in the worker processes.
+
+    Returns
+    -------
+    Started QueueListener; stop it once the workers have finished.
+    """
+    _listener = logging.handlers.QueueListener(log_queue, _ForwardHandler())
+    _listener.start()
+
+    return _listener
+
+
+def as_logger(logger):
+    """
+    Return a Logger for <logger>, which may also be the logging module itself.
+
+    Callers have historically passed the logging module around; its module-level
+    functions write to the root logger.
+    """
+    if isinstance(logger, logging.Logger):
+        return logger
+
+    return logging.getLogger()
+
+
+class StageLog:
+    """
+    Aggregate the per-row events of one pipeline stage into summary records.
+
+    Use as a context manager around the stage. On exit, one INFO record with
+    event counts and elapsed time is logged, followed by one WARNING record per
+    warning event listing up to MAX_EXAMPLES of the affected items.
+    """
+
+    def __init__(self, logger, stage, record=None):
+        """
+        Initialize an empty stage summary.
+
+        Parameters
+        ----------
+        logger
+            Logger (or the logging module) to write the summary to.
+
+        stage : str
+            Name of the stage, used as the message prefix.
+
+        record : dict
+            Optional dictionary in which the summary is also kept, under
+            <stage>, for callers that report on a run.
+        """
+        self.logger = as_logger(logger)
+        self.stage = stage
+        self.record = record
+        self.counts = Counter()
+        self.examples = {}
+        self.verbose = self.logger.isEnabledFor(logging.DEBUG)
+        self._start = time.perf_counter()
+
+    def __enter__(self):
+        """Start timing the stage."""
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Log the stage summary unless the stage raised."""
+        if exc_type is None:
+            self.summary()
+
+        return False
+
+    def count(self, event, number=1):
+        """Add <number> occurrences of <event> to the summary."""
+        self.counts[event] += number
+
+    def warn(self, event, item):
+        """Count a warning <event> and keep <item> as an example of it."""
+        self.counts[event] += 1
+        _examples = self.examples.setdefault(event, [])
+        if len(_examples) < MAX_EXAMPLES:
+            _examples.append(item)
+        self.trace("%s: %s", event, item)
+
+    def trace(self, msg, *args):
+        """Log a per-row message at DEBUG level; skipped entirely otherwise."""
+        if self.verbose:
+            self.logger.debug("%s: " + msg, self.stage, *args)
+
+    def summary(self):
+        """Log the aggregated counts and elapsed time, then any warnings."""
+        _elapsed = time.perf_counter() - self._start
+
+        self.logger.info(
+            "%s: %s in %.3f s",
+            self.stage,
+            " ".join(f"{_k}={_v}" for _k, _v in self.counts.items()) or "no events",
+            _elapsed,
+            extra={
+                "stage": self.stage,
+                "counts": dict(self.counts),
+                "elapsed": _elapsed,
+            },
+        )
+
+        if self.record is not None:
+            self.record[self.stage] = {
+                "counts": dict(self.counts),
+                "examples": {_k: list(_v) for _k, _v in self.examples.items()},
+                "elapsed": _elapsed,
+            }
+
+        for _event, _examples in self.examples.items():
+            _more = self.counts[_event] - len(_examples)
+            self.logger.warning(
+                "%s: %d %s: %s%s",
+                self.stage,
+                self.counts[_event],
+                _event.replace("_", " "),
+                "; ".join(str(_e) for _e in _examples),
+                f" and {_more} more" if _more > 0 else "",
+            )
@@ -0,0 +1,236 @@
+"""
+Created on October 19 2026.
+
+Export an assembled foreground database as sparse matrices.
+
+The technosphere and biosphere matrices are written as uncompressed SciPy CSR
+.npz files, with a JSON index mapping matrix rows and columns to Brightway
+activity keys. Because the .npz files are not compressed, load_matrices can
+memory-map their arrays instead of reading them into memory.
+
+Matrix layout follows Brightway: one column per foreground activity;
+technosphere rows are the foreground activities' products, in the same order
+as the columns, followed by products of other databases that the foreground
+uses; production and substitution amounts are positive and technosphere
+inputs are negative. Activities without a production exchange get an implicit
+production amount of 1.
+
+@author: rhanes
+"""
+import json
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Exchange types in the technosphere matrix and the sign of their amounts
+TECHNOSPHERE_SIGNS = {"production": 1.0, "substitution": 1.0, "technosphere": -1.0}
+
+BIOSPHERE_TYPES = ("biosphere",)
+
+MATRIX_FILES = {
+    "technosphere": "technosphere.npz",
+    "biosphere": "biosphere.npz",
+    "index": "matrix_index.json",
+}
+
+
+def _key_index(keys):
+    """Return an Index of (database, code) tuples that isn't a MultiIndex."""
+    return pd.Index(keys, dtype=object, tupleize_cols=False)
+
+
+def build_matrices(custom_db):
+    """
+    Build technosphere and biosphere CSR matrices from a database dictionary.
+
+    Parameters
+    ----------
+    custom_db : dict
+        Database in Brightway dictionary (pre-import) format.
+
+    Returns
+    -------
+    Technosphere matrix, biosphere matrix, index dictionary, and a dictionary of
+    counts of exchanges by how they were used.
+    """
+    _activities = _key_index(list(custom_db))
+
+    # Flatten every exchange in one pass; everything after this is vectorized
+    _exchanges = [
+        (_col, _ex.get("input"), _ex.get("amount"), _ex.get("type"))
+        for _col, _act in enumerate(custom_db.values())
+        for _ex in _act.get("exchanges", [])
+    ]
+    _cols = np.fromiter((_e[0] for _e in _exchanges), dtype=np.int64)
+    _inputs = _key_index([_e[1] for _e in _exchanges])
+    _amounts = np.array([_e[2] for _e in _exchanges], dtype=np.float64)
+    _types = pd.Series([_e[3] for _e in _exchanges], dtype=object)
+
+    _signs = _types.map(TECHNOSPHERE_SIGNS).to_numpy(dtype=np.float64)
+    _tech = ~np.isnan(_signs)
+    _bio = _types.isin(BIOSPHERE_TYPES).to_numpy()
+
+    # Technosphere rows: foreground products first, then external products
+    _tech_rows = _activities.get_indexer(_inputs[_tech])
+    _external = _tech_rows == -1
+    _external_codes, _external_keys = pd.factorize(
+        pd.Series(_inputs[_tech][_external], dtype=object)
+    )
+    _tech_rows[_external] = len(_activities) + _external_codes
+
+    # Implicit production for activities without a production exchange
+    _has_production = np.zeros(len(_activities), dtype=bool)
+    _has_production[_cols[(_types == "production").to_numpy()]] = True
+    _implicit = np.flatnonzero(~_has_production)
+
+    _technosphere = sparse.coo_matrix(
+        (
+            np.concatenate([_amounts[_tech] * _signs[_tech], np.ones(len(_implicit))]),
+            (
+                np.concatenate([_tech_rows, _implicit]),
+                np.concatenate([_cols[_tech], _implicit]),
+            ),
+        ),
+        shape=(len(_activities) + len(_external_keys), len(_activities)),
+    ).tocsr()
+
+    _bio_codes, _bio_keys = pd.factorize(pd.Series(_inputs[_bio], dtype=object))
+    _biosphere = sparse.coo_matrix(
+        (_amounts[_bio], (_bio_codes, _cols[_bio])),
+        shape=(len(_bio_keys), len(_activities)),
+    ).tocsr()
+
+    _index = {
+        "activities": [list(_k) for _k in _activities],
+        "external_products": [list(_k) for _k in _external_keys],
+        "biosphere": [list(_k) for _k in _bio_keys],
+    }
+
+    _counts = {
+        "technosphere_exchanges": int(_tech.sum()),
+        "biosphere_exchanges": int(_bio.sum()),
+        "other_exchanges": int((~_tech & ~_bio).sum()),
+        "implicit_production": len(_implicit),
+    }
+
+    return _technosphere, _biosphere, _index, _counts
+
+
+def export_matrices(custom_db, directory, prefix=""):
+    """
+    Write the technosphere and biosphere matrices and their index to <directory>.
+
+    Parameters
+    ----------
+    custom_db : dict
+        Database in Brightway dictionary (pre-import) format.
+
+    directory : path
+        Directory to write to.
+
+    prefix : str
+        Prefix for the file names.
+
+    Returns
+    -------
+    Dictionary of counts of exchanges by how they were used, and matrix shapes
+    """
+    _technosphere, _biosphere, _index, _counts = build_matrices(custom_db)
+
+    for _name, _matrix in (("technosphere", _technosphere), ("biosphere", _biosphere)):
+        # Uncompressed so that load_matrices can memory-map the arrays
+        sparse.save_npz(
+            os.path.join(directory, prefix + MATRIX_FILES[_name]),
+            _matrix,
+            compressed=False,
+        )
+
+    with open(
+        os.path.join(directory, prefix + MATRIX_FILES["index"]), "w", encoding="utf-8"
+    ) as _f:
+        json.dump(_index, _f, separators=(",", ":"))
+
+    _counts["technosphere_shape"] = list(_technosphere.shape)
+    _counts["biosphere_shape"] = list(_biosphere.shape)
+
+    return _counts
+
+
+def _mmap_npz_member(fpath, member):
+    """Memory-map one uncompressed .npy member of an .npz file."""
+    with zipfile.ZipFile(fpath) as _zip:
+        _info = _zip.getinfo(member)
+        if _info.compress_type != zipfile.ZIP_STORED:
+            raise ValueError(f"{fpath}: {member} is compressed and can't be mapped")
+
+    with open(fpath, "rb") as _f:
+        # Skip the zip local file header to reach the .npy data
+        _f.seek(_info.header_offset + 26)
+        _name_length, _extra_length = np.frombuffer(_f.read(4), dtype="<u2")
+        _f.seek(_info.header_offset + 30 + _name_length + _extra_length)
+
+        if np.lib.format.read_magic(_f) == (1, 0):
+            _shape, _fortran, _dtype = np.lib.format.read_array_header_1_0(_f)
+        else:
+            _shape, _fortran, _dtype = np.lib.format.read_array_header_2_0(_f)
+        _offset = _f.tell()
+
+    return np.memmap(
+        fpath,
+        dtype=_dtype,
+        mode="r",
+        offset=_offset,
+        shape=_shape,
+        order="F" if _fortran else "C",
+    )
+
+
+def load_matrices(directory, prefix="", mmap=True):
+    """
+    Read matrices written by export_matrices.
+
+    Parameters
+    ----------
+    directory : path
+        Directory the matrices were written to.
+
+    prefix : str
+        Prefix of the file names.
+
+    mmap : Boolean
+        Memory-map the matrix arrays instead of reading them into memory.
+
+    Returns
+    -------
+    Technosphere CSR matrix, biosphere CSR matrix, and index dictionary
+    """
+    _matrices = []
+    for _name in ("technosphere", "biosphere"):
+        _fpath = os.path.join(directory, prefix + MATRIX_FILES[_name])
+        if not mmap:
+            _matrices.append(sparse.load_npz(_fpath))
+            continue
+
+        with np.load(_fpath) as _npz:
+            _shape = _npz["shape"]
+        _matrices.append(
+            sparse.csr_matrix(
+                (
+                    _mmap_npz_member(_fpath, "data.npy"),
+                    _mmap_npz_member(_fpath, "indices.npy"),
+                    _mmap_npz_member(_fpath, "indptr.npy"),
+                ),
+                shape=tuple(_shape),
+                copy=False,
+            )
+        )
+
+    with open(
+        os.path.join(directory, prefix + MATRIX_FILES["index"]), "r", encoding="utf-8"
+    ) as _f:
+        _index = {_k: [tuple(_key) for _key in _v] for _k, _v in json.load(_f).items()}
+
+    return _matrices[0], _matrices[1], _index
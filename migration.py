@@ -0,0 +1,413 @@
+"""
+Created on October 19 2026.
+
+Move foreground databases to a new version of a background database.
+
+A migration table maps keys of the old background database to keys of the
+new one. An old key may map to several new keys, each with a share of the
+amount. The table is indexed once, and every sheet column or database that
+refers to background keys is rewritten in one vectorized pass: rows that map
+to several keys are repeated, with their amounts multiplied by the shares.
+Keys of the old background databases that aren't in the table are reported.
+
+Copied activities keep their background code in the foreground database, so
+migrating a copied activity also renames it, and the foreground exchanges
+that refer to it are rewritten too.
+
+@author: rhanes
+"""
+import numpy as np
+import pandas as pd
+
+from canonicalize import UNCERTAINTY_FIELDS, flat_exchanges
+
+# Sheet columns holding a (database, code) key, by sheet
+SHEET_KEYS = {
+    "Copy Activities": [("source_database", "activity_code")],
+    "Add Exchanges": [
+        ("activity_database", "activity_code"),
+        ("exchange_database", "exchange_code"),
+    ],
+    "Delete Exchanges": [
+        ("activity_database", "activity_code"),
+        ("exchange_database", "exchange_code"),
+    ],
+}
+
+# Shares of an old key that don't sum to one within this tolerance are reported
+SHARE_TOLERANCE = 1e-6
+
+
+class Migration:
+    """Index of a migration table, for rewriting keys in bulk."""
+
+    def __init__(self, mapping):
+        """
+        Index the migration table.
+
+        Parameters
+        ----------
+        mapping : DataFrame
+            Table with old_database, old_code, new_database, new_code and
+            share columns. Missing shares are 1.
+        """
+        _mapping = (
+            mapping.assign(share=mapping.share.fillna(1.0).astype(float))
+            .sort_values(["old_database", "old_code"], kind="stable")
+            .reset_index(drop=True)
+        )
+
+        # Rows of the table for old key i run from starts[i] to starts[i] + counts[i]
+        _old = pd.MultiIndex.from_arrays([_mapping.old_database, _mapping.old_code])
+        self.keys = _old.unique()
+        _groups = self.keys.get_indexer(_old)
+        self.counts = np.bincount(_groups, minlength=len(self.keys))
+        self.starts = np.cumsum(self.counts) - self.counts
+
+        # Row with the largest share, used where a key can only have one target
+        self.new_database = _mapping.new_database.to_numpy(dtype=object)
+        self.new_code = _mapping.new_code.to_numpy(dtype=object)
+        self.share = _mapping.share.to_numpy()
+        self.primary = np.lexsort((-self.share, _groups))[self.starts]
+
+        # Background databases being replaced
+        self.databases = set(_mapping.old_database)
+
+        _sums = np.bincount(_groups, weights=self.share, minlength=len(self.keys))
+        self.bad_shares = [
+            tuple(self.keys[_i])
+            for _i in np.flatnonzero(np.abs(_sums - 1) > SHARE_TOLERANCE)
+        ]
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Return a one-to-one migration from a list of (old key, new key) pairs."""
+        return cls(
+            pd.DataFrame(
+                [(*_old, *_new) for _old, _new in pairs],
+                columns=["old_database", "old_code", "new_database", "new_code"],
+            ).assign(share=1.0)
+        )
+
+    def rewrite(
+        self,
+        frame,
+        database,
+        code,
+        default_database=None,
+        amount=None,
+        formula=None,
+        one_to_one=False,
+    ):
+        """
+        Rewrite the keys in columns <database> and <code> of <frame>.
+
+        Parameters
+        ----------
+        frame : DataFrame
+            Rows to rewrite; not changed.
+
+        database, code : str
+            Columns of <frame> holding the keys.
+
+        default_database : str
+            Database of rows with no <database> value, as backfilled when the
+            sheet is read. Such rows keep an empty value unless their database
+            changes.
+
+        amount : str
+            Optional column multiplied by the shares.
+
+        formula : str
+            Optional column of formulas, which are multiplied by the shares
+            where they are given.
+
+        one_to_one : Boolean
+            Map every key to its largest share only, without repeating rows
+            or scaling amounts.
+
+        Returns
+        -------
+        Tuple of the rewritten DataFrame, the number of rows whose key was
+        rewritten and the keys in the old databases that aren't in the table
+        """
+        if self.keys.empty:
+            return frame.copy(), 0, []
+
+        _databases = frame[database]
+        if default_database is not None:
+            _databases = _databases.fillna(default_database)
+        _group = self.keys.get_indexer(
+            pd.MultiIndex.from_arrays([_databases, frame[code]])
+        )
+        _mapped = _group != -1
+
+        _unmapped = sorted(
+            set(
+                zip(
+                    _databases[~_mapped & _databases.isin(self.databases)],
+                    frame[code][~_mapped & _databases.isin(self.databases)],
+                )
+            ),
+            key=str,
+        )
+
+        _repeat = np.where(_mapped & (not one_to_one), self.counts[_group], 1)
+        _out = frame.iloc[np.repeat(np.arange(len(frame)), _repeat)].reset_index(
+            drop=True
+        )
+        _out_group = np.repeat(_group, _repeat)
+        _out_mapped = _out_group != -1
+
+        # Table row of each output row: the group start plus its place in the group
+        _offset = np.arange(len(_out)) - np.repeat(
+            np.cumsum(_repeat) - _repeat, _repeat
+        )
+        _row = np.where(
+            _out_mapped,
+            self.primary[_out_group]
+            if one_to_one
+            else self.starts[_out_group] + _offset,
+            0,
+        )
+
+        _old_databases = np.repeat(_databases.to_numpy(dtype=object), _repeat)
+        _new_databases = self.new_database[_row]
+        _out[database] = np.where(
+            _out_mapped & (_new_databases != _old_databases),
+            _new_databases,
+            _out[database].to_numpy(dtype=object),
+        )
+        _out[code] = np.where(
+            _out_mapped, self.new_code[_row], _out[code].to_numpy(dtype=object)
+        )
+
+        if not one_to_one:
+            _share = np.where(_out_mapped, self.share[_row], 1.0)
+            if amount is not None:
+                _out[amount] = _out[amount] * _share
+            if formula is not None:
+                _scaled = _out[formula].notna() & (_share != 1)
+                _out.loc[_scaled, formula] = (
+                    "("
+                    + _out.loc[_scaled, formula].astype(str)
+                    + ") * "
+                    + pd.Series(
+                        _share[_scaled.to_numpy()], index=_out.index[_scaled]
+                    ).astype(str)
+                )
+
+        return _out, int(_mapped.sum()), _unmapped
+
+
+def rename_collisions(keys, renames):
+    """
+    Find activities that renaming would give the same key.
+
+    Several copied activities may be replaced by one new activity, or by an
+    activity that is already in the foreground database. They can't all keep
+    their own attributes and exchanges under one key, so they are reported
+    instead of being merged silently.
+
+    Parameters
+    ----------
+    keys : list
+        Keys of the activities in the foreground database.
+
+    renames : dict
+        New key by old key, for the activities being renamed.
+
+    Returns
+    -------
+    List of dictionaries with the shared new key and the activities that
+    would have it
+    """
+    _activities = {}
+    for _key in dict.fromkeys(keys):
+        _activities.setdefault(renames.get(_key, _key), []).append(_key)
+
+    return [
+        {"key": _new, "activities": _old}
+        for _new, _old in _activities.items()
+        if len(_old) > 1 and any(_key in renames for _key in _old)
+    ]
+
+
+def migrate_sheets(sheets, migration, foreground):
+    """
+    Rewrite the background keys in the sheets of an import file.
+
+    Parameters
+    ----------
+    sheets : dict
+        DataFrames by sheet name, as read from the import file without
+        backfilling. Sheets without background keys are returned unchanged.
+
+    migration : Migration
+        Indexed migration table.
+
+    foreground : str
+        Name of the foreground database, which rows without a database refer to.
+
+    Returns
+    -------
+    Tuple of the rewritten sheets and a report of the keys rewritten and the
+    unmapped keys, by sheet. If copied activities would share a key, the
+    sheets are None and the report lists the activities under collisions;
+    see rename_collisions.
+    """
+    sheets = dict(sheets)
+    _report = {}
+
+    # Copied activities take their code from the background, so they are
+    # renamed along with it; each can only be copied from one new activity
+    _renames = Migration.from_pairs([])
+    if "Copy Activities" in sheets:
+        _copy = sheets["Copy Activities"]
+        _copied, _n, _unmapped = migration.rewrite(
+            frame=_copy,
+            database="source_database",
+            code="activity_code",
+            one_to_one=True,
+        )
+        _pairs = {
+            (foreground, _old): (foreground, _new)
+            for _old, _new in zip(_copy.activity_code, _copied.activity_code)
+            if _old != _new
+        }
+
+        _codes = list(_copy.activity_code)
+        if "Create Activities" in sheets and "code" in sheets["Create Activities"]:
+            _codes += list(sheets["Create Activities"].code.dropna())
+        _collisions = rename_collisions(
+            keys=[(foreground, _code) for _code in _codes], renames=_pairs
+        )
+        if _collisions:
+            return None, {"collisions": _collisions}
+
+        _renames = Migration.from_pairs(list(_pairs.items()))
+        sheets["Copy Activities"] = _copied
+        _report["Copy Activities"] = {"keys_rewritten": _n, "unmapped": _unmapped}
+
+    for _sheet in ("Add Exchanges", "Delete Exchanges"):
+        if _sheet not in sheets:
+            continue
+
+        _frame = sheets[_sheet]
+        _rows = 0
+        _unmapped = []
+        for _database, _code in SHEET_KEYS[_sheet]:
+            _frame, _n, _ = _renames.rewrite(
+                frame=_frame,
+                database=_database,
+                code=_code,
+                default_database=foreground,
+            )
+            _rows += _n
+
+        # Exchanges are split between the new keys in proportion to the shares
+        _frame, _n, _unmapped = migration.rewrite(
+            frame=_frame,
+            database="exchange_database",
+            code="exchange_code",
+            default_database=foreground,
+            amount="amount" if "amount" in _frame else None,
+            formula="formula" if "formula" in _frame else None,
+        )
+
+        sheets[_sheet] = _frame
+        _report[_sheet] = {"keys_rewritten": _rows + _n, "unmapped": _unmapped}
+
+    return sheets, _report
+
+
+def migrate_database(custom_db, migration):
+    """
+    Rewrite the background keys in a foreground database.
+
+    Activities whose code is an old background code are copied activities,
+    and are renamed to the new code with the largest share. Exchanges are
+    split between the new keys in proportion to the shares; split exchanges
+    lose their uncertainty distributions.
+
+    Parameters
+    ----------
+    custom_db : dict
+        Database in Brightway dictionary (pre-import) format; not changed.
+
+    migration : Migration
+        Indexed migration table.
+
+    Returns
+    -------
+    Tuple of the rewritten database and a report of the activities renamed,
+    exchanges rewritten and unmapped keys. If copied activities would share
+    a key, the database is None and the report lists the activities under
+    collisions; see rename_collisions.
+    """
+    _keys = list(custom_db)
+
+    # Copied activities keep the code of the background activity
+    _groups = pd.Series(
+        np.arange(len(migration.keys)), index=migration.keys.get_level_values(1)
+    )
+    _groups = _groups[~_groups.index.duplicated()]
+    _renames = {
+        _key: (_key[0], migration.new_code[migration.primary[int(_group)]])
+        for _key, _group in zip(
+            _keys, _groups.reindex([_key[1] for _key in _keys]).to_numpy()
+        )
+        if not np.isnan(_group)
+    }
+    _renames = {_old: _new for _old, _new in _renames.items() if _old != _new}
+
+    _collisions = rename_collisions(keys=_keys, renames=_renames)
+    if _collisions:
+        return None, {"collisions": _collisions}
+
+    _foreground = Migration.from_pairs(list(_renames.items()))
+
+    _exchanges = flat_exchanges(custom_db=custom_db, keys=_keys)
+    _frame = pd.DataFrame(
+        {
+            "position": np.arange(len(_exchanges)),
+            "activity": [_i for _i, _ in _exchanges],
+            "input_database": [_ex["input"][0] for _, _ex in _exchanges],
+            "input_code": [_ex["input"][1] for _, _ex in _exchanges],
+            "amount": [_ex.get("amount") for _, _ex in _exchanges],
+        },
+        columns=["position", "activity", "input_database", "input_code", "amount"],
+    )
+    _frame, _renamed, _ = _foreground.rewrite(
+        frame=_frame, database="input_database", code="input_code"
+    )
+    _frame, _rewritten, _unmapped = migration.rewrite(
+        frame=_frame, database="input_database", code="input_code", amount="amount"
+    )
+
+    _migrated = {}
+    for _key in _keys:
+        _new = _renames.get(_key, _key)
+        _migrated[_new] = dict(custom_db[_key], exchanges=[])
+        if "code" in _migrated[_new]:
+            _migrated[_new]["code"] = _new[1]
+    _split = _frame.position.duplicated(keep=False).to_numpy()
+    for _row, _is_split in zip(_frame.itertuples(index=False), _split):
+        _ex = dict(
+            _exchanges[_row.position][1],
+            input=(_row.input_database, _row.input_code),
+            amount=_row.amount,
+        )
+        _output = _renames.get(_keys[_row.activity], _keys[_row.activity])
+        if "output" in _ex:
+            _ex["output"] = _output
+        if _is_split:
+            for _field in UNCERTAINTY_FIELDS:
+                _ex.pop(_field, None)
+        _migrated[_output]["exchanges"].append(_ex)
+
+    return _migrated, {
+        "activities_renamed": len(_renames),
+        "exchanges_rewritten": _renamed + _rewritten,
+        "unmapped": _unmapped,
+    }
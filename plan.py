@@ -0,0 +1,208 @@
+"""
+Created on October 19 2026.
+
+Plan a foreground database build without writing it.
+
+A plan compares an assembled foreground database with the version currently
+in the project and estimates the cost of writing it: the rows read from the
+import file, the changes to activities and exchanges, what could not be
+resolved, the activities that would be looked up in background databases, and
+the number and size of the rows that would be written.
+
+@author: rhanes
+"""
+import pickle
+from collections import Counter
+
+# Stage events that mean part of the import file could not be resolved
+UNRESOLVED_EVENTS = (
+    "activities_not_found",
+    "exchanges_not_found",
+    "dangling_inputs",
+    "cycles",
+)
+
+
+def _fields(activity):
+    """Return the activity fields that are written, apart from the exchanges."""
+    return {
+        _k: _v
+        for _k, _v in activity.items()
+        if _k not in ("exchanges", "database", "code")
+    }
+
+
+def _exchanges(activity):
+    """Return the exchanges of <activity> as a multiset of (input, type, amount)."""
+    return Counter(
+        (tuple(_ex.get("input")), _ex.get("type"), _ex.get("amount"))
+        for _ex in activity.get("exchanges", [])
+    )
+
+
+def diff_databases(old, new):
+    """
+    Compare two databases in dictionary (pre-import) format.
+
+    Activities are matched on their keys, so activities given new codes with
+    generate_keys are reported as deleted and created.
+
+    Parameters
+    ----------
+    old : dict
+        Database currently in the project.
+
+    new : dict
+        Assembled database.
+
+    Returns
+    -------
+    Dictionary with the created, deleted and changed activity keys, and the
+    number of exchanges added and removed
+    """
+    _created = [_key for _key in new if _key not in old]
+    _deleted = [_key for _key in old if _key not in new]
+
+    _changed = []
+    _added = Counter()
+    _removed = Counter()
+    for _key in new:
+        _new_exchanges = _exchanges(new[_key])
+        _old_exchanges = _exchanges(old[_key]) if _key in old else Counter()
+        _added.update(_new_exchanges - _old_exchanges)
+        _removed.update(_old_exchanges - _new_exchanges)
+
+        if _key in old and (
+            _fields(old[_key]) != _fields(new[_key]) or _old_exchanges != _new_exchanges
+        ):
+            _changed.append(_key)
+
+    for _key in _deleted:
+        _removed.update(_exchanges(old[_key]))
+
+    return {
+        "activities": {
+            "created": _created,
+            "deleted": _deleted,
+            "changed": _changed,
+            "unchanged": len(new) - len(_created) - len(_changed),
+        },
+        "exchanges": {
+            "added": sum(_added.values()),
+            "removed": sum(_removed.values()),
+        },
+    }
+
+
+def diff_foreground(existing, databases):
+    """
+    Compare the databases a foreground database is written as with the project.
+
+    Each database, e.g. each shard, is compared with its current version, so
+    activities that move to another shard are reported as deleted and created.
+
+    Parameters
+    ----------
+    existing : dict
+        Databases currently in the project, in dictionary format by name.
+
+    databases : dict
+        Databases that would be written, in dictionary format by name.
+
+    Returns
+    -------
+    Dictionary like diff_databases, summed over the databases
+    """
+    _diff = {
+        "activities": {"created": [], "deleted": [], "changed": [], "unchanged": 0},
+        "exchanges": {"added": 0, "removed": 0},
+    }
+    for _database in sorted(set(existing) | set(databases)):
+        _part = diff_databases(
+            old=existing.get(_database, {}), new=databases.get(_database, {})
+        )
+        for _change in ("created", "deleted", "changed"):
+            _diff["activities"][_change].extend(_part["activities"][_change])
+        _diff["activities"]["unchanged"] += _part["activities"]["unchanged"]
+        for _change in ("added", "removed"):
+            _diff["exchanges"][_change] += _part["exchanges"][_change]
+
+    return _diff
+
+
+def build_plan(fdb, existing, databases, written):
+    """
+    Describe what writing an assembled foreground database would change.
+
+    Parameters
+    ----------
+    fdb : ForegroundDatabase
+        Foreground database assembled with write=False.
+
+    existing : dict
+        Current contents of the foreground database and its shards in the
+        project, in dictionary format by database name; empty if it doesn't
+        exist yet.
+
+    databases : dict
+        Databases the foreground database would be written as, in dictionary
+        format by name: the database itself and its shards, if any.
+
+    written : list
+        Names of the databases in <databases> that would be written. Unchanged
+        shards aren't written again, so they add nothing to the write cost.
+
+    Returns
+    -------
+    Dictionary that can be serialized as JSON
+    """
+    _counts = Counter()
+    _examples = {}
+    for _stage in fdb.stage_logs.values():
+        _counts.update(_stage["counts"])
+        for _event, _items in _stage["examples"].items():
+            _examples.setdefault(_event, []).extend(_items)
+
+    _diff = diff_foreground(existing=existing, databases=databases)
+    _activities = [
+        _act for _database in written for _act in databases[_database].values()
+    ]
+    for _change in ("created", "deleted", "changed"):
+        _diff["activities"][_change] = [
+            list(_key) for _key in _diff["activities"][_change]
+        ]
+
+    return {
+        "rows": {
+            "create_activities": len(fdb.create_activities_data),
+            "copy_activities": len(fdb.copy_activities_data),
+            "delete_exchanges": len(fdb.delete_exchanges_data),
+            "add_exchanges": len(fdb.add_exchanges_data),
+        },
+        "stages": {_name: _stage["counts"] for _name, _stage in fdb.stage_logs.items()},
+        "unresolved": {
+            _event: {"count": _counts[_event], "examples": _examples.get(_event, [])}
+            for _event in UNRESOLVED_EVENTS
+            if _counts[_event]
+        },
+        "diff": _diff,
+        "cost": {
+            # Copies not served by the background cache or a snapshot
+            "copy_queries": _counts["activities_copied"]
+            + _counts["activities_not_found"]
+            - _counts["cache_hits"]
+            - _counts["snapshot_reads"],
+            "write_databases": sorted(written),
+            "write_activities": len(_activities),
+            "write_exchanges": sum(len(_act["exchanges"]) for _act in _activities),
+            # Brightway stores every activity and exchange as a pickle
+            "write_bytes": sum(
+                len(pickle.dumps(_fields(_act), protocol=pickle.HIGHEST_PROTOCOL))
+                + sum(
+                    len(pickle.dumps(_ex, protocol=pickle.HIGHEST_PROTOCOL))
+                    for _ex in _act["exchanges"]
+                )
+                for _act in _activities
+            ),
+        },
+    }
@@ -0,0 +1,377 @@
+"""
+Created on October 19 2026.
+
+One open Brightway project shared by the whole pipeline.
+
+ProjectSession sets the project as current once, tunes its SQLite connection,
+and keeps the list of registered databases in memory. Replacing a database
+deletes its old activities and exchanges and writes the new ones in a single
+SQLite transaction, so an interrupted run leaves the previous version of the
+database in place instead of an empty or partly written one.
+
+@author: rhanes
+"""
+import hashlib
+import io
+import pickle
+
+import brightway2 as bw
+from bw2data import geomapping, mapping, preferences
+from bw2data.backends.peewee import ActivityDataset, ExchangeDataset, sqlite3_lci_db
+from bw2data.backends.peewee.utils import (
+    dict_as_activitydataset,
+    dict_as_exchangedataset,
+)
+from bw2data.errors import InvalidExchange, UntypedExchange, WrongDatabase
+from bw2data.search import IndexManager
+from bw2data.parameters import (
+    ActivityParameter,
+    DatabaseParameter,
+    ParameterizedExchange,
+    parameters,
+)
+
+# WAL lets readers continue while a database is written and needs fewer fsyncs
+SQLITE_PRAGMAS = (
+    ("journal_mode", "wal"),
+    ("synchronous", "normal"),
+    ("temp_store", "memory"),
+    ("cache_size", -64000),
+)
+
+# Rows per INSERT; SQLite allows at most 999 variables in one statement
+INSERT_BATCH = 125
+
+
+def content_hash(data):
+    """Return a hash of a database dictionary's contents."""
+    _buffer = io.BytesIO()
+    _pickler = pickle.Pickler(_buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    # Without the memo, objects shared within <data> don't change the hash
+    _pickler.fast = True
+    _pickler.dump(data)
+    return hashlib.sha1(_buffer.getvalue()).hexdigest()
+
+
+class ProjectSession:
+    """Open a Brightway project once and write databases transactionally."""
+
+    def __init__(self, name, logging, read_only=False):
+        """
+        Set project <name> as current and tune its SQLite connection.
+
+        Parameters
+        ----------
+        name : str
+            Name of the Brightway project.
+
+        logging
+            logger object for writing status messages to file
+
+        read_only : Boolean
+            Open the project without changing it. Writing databases raises
+            PermissionError, and Brightway refuses writes to the project.
+        """
+        self.name = name
+        self.logging = logging
+        self.read_only = read_only
+
+        if read_only:
+            bw.projects.set_current(name, writable=False)
+            # Brightway only enforces this for lockable projects by default
+            bw.projects.read_only = True
+        else:
+            if bw.projects.current != name:
+                bw.projects.set_current(name)
+
+            for _pragma, _value in SQLITE_PRAGMAS:
+                sqlite3_lci_db.execute_sql(f"PRAGMA {_pragma} = {_value}")
+
+        self._databases = None
+
+    @property
+    def databases(self):
+        """Names of the databases in the project, read from the registry once."""
+        if self._databases is None:
+            self._databases = set(bw.databases)
+        return self._databases
+
+    def _check_writable(self):
+        if self.read_only:
+            raise PermissionError(f"Project {self.name} is open read-only")
+
+    def refresh(self):
+        """Re-read the database registry, e.g. after another process changed it."""
+        self._databases = None
+
+    def replace_database(self, name, data, process=True, metadata=None):
+        """
+        Replace the contents of database <name> with <data>.
+
+        The old activities and exchanges are deleted and the new ones written in
+        one SQLite transaction. The database is registered if it is new.
+
+        Parameters
+        ----------
+        name : str
+            Name of the Brightway database.
+
+        data : dict
+            Database in Brightway dictionary (pre-import) format.
+
+        process : Boolean
+            Whether to process the database into matrix arrays after writing.
+
+        metadata : dict
+            Optional entries to add to the database's registry entry.
+        """
+        self._check_writable()
+
+        _hash = content_hash(data)
+
+        _activities, _exchanges = self._rows(name=name, data=data)
+
+        _db = bw.Database(name)
+        _new = name not in self.databases
+
+        with sqlite3_lci_db.atomic():
+            ActivityDataset.delete().where(ActivityDataset.database == name).execute()
+            ExchangeDataset.delete().where(
+                ExchangeDataset.output_database == name
+            ).execute()
+
+            # peewee's insert_many is a classmethod wrapped in a decorator that
+            # pylint reads as an unbound method missing its database argument
+            for _i in range(0, len(_activities), INSERT_BATCH):
+                ActivityDataset.insert_many(  # pylint: disable=no-value-for-parameter
+                    _activities[_i : _i + INSERT_BATCH]
+                ).execute()
+            for _i in range(0, len(_exchanges), INSERT_BATCH):
+                ExchangeDataset.insert_many(  # pylint: disable=no-value-for-parameter
+                    _exchanges[_i : _i + INSERT_BATCH]
+                ).execute()
+
+        # Parameters live in their own SQLite database
+        if not _new:
+            with parameters.db.atomic():
+                _groups = tuple(
+                    {
+                        _o[0]
+                        for _o in ActivityParameter.select(ActivityParameter.group)
+                        .where(ActivityParameter.database == name)
+                        .tuples()
+                    }
+                )
+                ParameterizedExchange.delete().where(
+                    ParameterizedExchange.group << _groups
+                ).execute()
+                ActivityParameter.delete().where(
+                    ActivityParameter.database == name
+                ).execute()
+                DatabaseParameter.delete().where(
+                    DatabaseParameter.database == name
+                ).execute()
+
+        # Registry and mappings, as Brightway's Database.write updates them
+        if _new:
+            _db.register()
+            self.databases.add(name)
+        bw.databases[name].update(metadata or {})
+        self._register(name=name, data=data, number=len(data), content=_hash)
+
+        _db.make_searchable(reset=True)
+        if process:
+            _db.process()
+
+        self.logging.info(
+            "ProjectSession.replace_database: Wrote %d activities and %d exchanges "
+            "to %s",
+            len(_activities),
+            len(_exchanges),
+            name,
+        )
+
+    def update_database(self, name, data, previous, process=True):
+        """
+        Write the activities of <data> that differ from <previous>.
+
+        Changed and deleted activities are removed and changed and new ones
+        written in one SQLite transaction, and only they are updated in the
+        search index. Use this instead of replace_database when database
+        <name> is known to hold <previous>, e.g. when rebuilding it repeatedly.
+
+        Parameters
+        ----------
+        name : str
+            Name of the Brightway database.
+
+        data : dict
+            New contents, in Brightway dictionary (pre-import) format.
+
+        previous : dict
+            Contents last written to database <name>.
+
+        process : Boolean
+            Whether to process the database into matrix arrays after writing.
+
+        Returns
+        -------
+        Dictionary of the created, deleted and changed activity keys
+        """
+        self._check_writable()
+
+        _hash = content_hash(data)
+        _diff = {
+            "created": [_key for _key in data if _key not in previous],
+            "deleted": [_key for _key in previous if _key not in data],
+            # Pickles compare NaNs equal, unlike the dictionaries themselves
+            "changed": [
+                _key
+                for _key in data
+                if _key in previous
+                and content_hash(data[_key]) != content_hash(previous[_key])
+            ],
+        }
+
+        _write = _diff["created"] + _diff["changed"]
+        _remove = _diff["deleted"] + _diff["changed"]
+        _activities, _exchanges = self._rows(
+            name=name, data={_key: data[_key] for _key in _write}
+        )
+
+        with sqlite3_lci_db.atomic():
+            for _i in range(0, len(_remove), INSERT_BATCH):
+                _codes = [_key[1] for _key in _remove[_i : _i + INSERT_BATCH]]
+                ActivityDataset.delete().where(
+                    (ActivityDataset.database == name)
+                    & (ActivityDataset.code << _codes)
+                ).execute()
+                ExchangeDataset.delete().where(
+                    (ExchangeDataset.output_database == name)
+                    & (ExchangeDataset.output_code << _codes)
+                ).execute()
+
+            # peewee's insert_many is a classmethod wrapped in a decorator that
+            # pylint reads as an unbound method missing its database argument
+            for _i in range(0, len(_activities), INSERT_BATCH):
+                ActivityDataset.insert_many(  # pylint: disable=no-value-for-parameter
+                    _activities[_i : _i + INSERT_BATCH]
+                ).execute()
+            for _i in range(0, len(_exchanges), INSERT_BATCH):
+                ExchangeDataset.insert_many(  # pylint: disable=no-value-for-parameter
+                    _exchanges[_i : _i + INSERT_BATCH]
+                ).execute()
+
+        _db = bw.Database(name)
+        self._register(
+            name=name,
+            data={_key: data[_key] for _key in _write},
+            number=len(data),
+            content=_hash,
+        )
+
+        if bw.databases[name].get("searchable"):
+            _index = IndexManager(_db.filename)
+            _writer = _index.get().writer()
+            for _key in _diff["deleted"]:
+                _writer.delete_by_term("code", _key[1])
+            for _key in _write:
+                _writer.update_document(
+                    # pylint: disable=protected-access
+                    **_index._format_dataset(
+                        dict(data[_key], database=name, code=_key[1])
+                    )
+                )
+            _writer.commit()
+
+        if process:
+            _db.process()
+
+        self.logging.info(
+            "ProjectSession.update_database: Wrote %d activities and %d exchanges "
+            "to %s (%d created, %d changed, %d deleted)",
+            len(_activities),
+            len(_exchanges),
+            name,
+            len(_diff["created"]),
+            len(_diff["changed"]),
+            len(_diff["deleted"]),
+        )
+
+        return _diff
+
+    @staticmethod
+    def _rows(name, data):
+        """Return the activity and exchange rows of <data> as written to SQLite."""
+        _wrong = {_key[0] for _key in data} - {name}
+        if _wrong:
+            raise WrongDatabase(
+                f"Can't write activities in databases {_wrong} to database {name}"
+            )
+
+        _activities, _exchanges = [], []
+        for _key, _ds in data.items():
+            for _ex in _ds.get("exchanges", []):
+                if "input" not in _ex or "amount" not in _ex:
+                    raise InvalidExchange
+                if "type" not in _ex:
+                    raise UntypedExchange
+                # <data> isn't changed, so it can be compared with the next build
+                _exchanges.append(dict_as_exchangedataset(dict(_ex, output=_key)))
+
+            _act = {_k: _v for _k, _v in _ds.items() if _k != "exchanges"}
+            _act["database"], _act["code"] = _key
+            _activities.append(dict_as_activitydataset(_act))
+
+        return _activities, _exchanges
+
+    @staticmethod
+    def _register(name, data, number, content):
+        """Update the registry entry and mappings of database <name> after a write."""
+        bw.databases[name]["number"] = number
+        bw.databases[name]["content_hash"] = content
+        bw.databases.set_modified(name)
+        # Exchange outputs are the activity keys
+        mapping.add(data.keys())
+        if preferences.get("allow incomplete imports"):
+            mapping.add(
+                {
+                    _ex["input"]
+                    for _ds in data.values()
+                    for _ex in _ds.get("exchanges", [])
+                }
+            )
+        geomapping.add(
+            {_ds["location"] for _ds in data.values() if _ds.get("location")}
+        )
+
+    def unchanged(self, name, data):
+        """
+        Return True if database <name> was last written with the same <data>.
+
+        Parameters
+        ----------
+        name : str
+            Name of the Brightway database.
+
+        data : dict
+            Database in Brightway dictionary (pre-import) format.
+        """
+        return name in self.databases and bw.databases[name].get(
+            "content_hash"
+        ) == content_hash(data)
+
+    def delete_database(self, name):
+        """
+        Delete database <name> and its registry entry, if it exists.
+
+        Parameters
+        ----------
+        name : str
+            Name of the Brightway database.
+        """
+        self._check_writable()
+
+        if name in self.databases:
+            del bw.databases[name]
+            self.databases.discard(name)
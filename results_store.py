@@ -0,0 +1,353 @@
+"""
+Created on October 19 2026.
+
+Local store of LCIA results across runs.
+
+Results are kept in one SQLite file with a row per run, activity and impact
+assessment method. Runs record the project, foreground database, scenario and
+a hash of the import workbook they were built from. Activities and methods are
+stored once in their own tables and referred to by integer id, which keeps the
+results table small. Results are only ever appended, in batches of one
+transaction each, and the indexes cover lookups by run, by activity and by
+method, so comparisons across many runs are read without loading the whole
+store.
+
+@author: rhanes
+"""
+import hashlib
+import json
+import sqlite3
+import time
+
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    project TEXT,
+    database TEXT,
+    workbook_hash TEXT,
+    scenario TEXT,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_workbook ON runs (workbook_hash);
+CREATE TABLE IF NOT EXISTS activities (
+    activity_id INTEGER PRIMARY KEY,
+    activity_database TEXT NOT NULL,
+    activity_code TEXT NOT NULL,
+    UNIQUE (activity_database, activity_code)
+);
+CREATE INDEX IF NOT EXISTS activities_code ON activities (activity_code);
+CREATE TABLE IF NOT EXISTS methods (
+    method_id INTEGER PRIMARY KEY,
+    method TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    method_id INTEGER NOT NULL REFERENCES methods (method_id),
+    activity_id INTEGER NOT NULL REFERENCES activities (activity_id),
+    score REAL,
+    PRIMARY KEY (run_id, method_id, activity_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_activity ON results (activity_id, method_id);
+CREATE INDEX IF NOT EXISTS results_method ON results (method_id, run_id);
+"""
+
+# Joins the results with the keys they refer to
+_SELECT = """
+SELECT r.run_id, runs.workbook_hash, runs.scenario, a.activity_database,
+    a.activity_code, m.method, r.score
+FROM results r
+JOIN runs ON runs.run_id = r.run_id
+JOIN activities a ON a.activity_id = r.activity_id
+JOIN methods m ON m.method_id = r.method_id
+"""
+
+
+def file_hash(fpath):
+    """Return a hash of the contents of the file at <fpath>."""
+    _hash = hashlib.sha1()
+    with open(fpath, "rb") as _f:
+        for _block in iter(lambda: _f.read(1 << 20), b""):
+            _hash.update(_block)
+    return _hash.hexdigest()
+
+
+def _method_text(method):
+    """Return a Brightway method tuple as the text stored in the methods table."""
+    return json.dumps(list(method) if isinstance(method, (tuple, list)) else [method])
+
+
+def _method_tuple(text):
+    return tuple(json.loads(text))
+
+
+class ResultsStore:
+    """
+    SQLite file of LCIA scores by run, activity and method.
+
+    Can be used as a context manager, which closes the connection on exit.
+    """
+
+    def __init__(self, fpath):
+        """
+        Open the store at <fpath>, creating it if it doesn't exist.
+
+        Parameters
+        ----------
+        fpath : path
+            SQLite file holding the results.
+        """
+        self.fpath = fpath
+        self.connection = sqlite3.connect(fpath)
+        self.connection.execute("PRAGMA journal_mode = wal")
+        self.connection.execute("PRAGMA synchronous = normal")
+        self.connection.executescript(SCHEMA)
+
+        # Ids of the activities and methods already in the store
+        self._activity_ids = {}
+        self._method_ids = {}
+
+    def __enter__(self):
+        """Return self."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Close the connection."""
+        self.close()
+
+    def close(self):
+        """Close the connection to the store."""
+        self.connection.close()
+
+    def start_run(
+        self, project, database, workbook_hash=None, scenario=None, metadata=None
+    ):
+        """
+        Record a new run and return its id.
+
+        Parameters
+        ----------
+        project : str
+            Name of the Brightway project.
+
+        database : str
+            Name of the foreground database.
+
+        workbook_hash : str
+            Hash of the import workbook, from file_hash.
+
+        scenario : str
+            Optional name of the scenario or parameter set.
+
+        metadata : dict
+            Optional information about the run, stored as JSON.
+
+        Returns
+        -------
+        Integer run id
+        """
+        with self.connection:
+            _cursor = self.connection.execute(
+                "INSERT INTO runs (created, project, database, workbook_hash, "
+                "scenario, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(),
+                    project,
+                    database,
+                    workbook_hash,
+                    scenario,
+                    json.dumps(metadata, default=str) if metadata else None,
+                ),
+            )
+        return _cursor.lastrowid
+
+    def _ids(self, table, columns, cache, values):
+        """
+        Return the ids of <values> in <table>, adding the ones that are new.
+
+        Values are tuples of the <columns> of <table>; its id column is the
+        first column.
+        """
+        _new = [_v for _v in dict.fromkeys(values) if _v not in cache]
+        if _new:
+            self.connection.executemany(
+                f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})",
+                _new,
+            )
+            _match = " AND ".join(f"{_c} = ?" for _c in columns)
+            for _value in _new:
+                cache[_value] = self.connection.execute(
+                    f"SELECT * FROM {table} WHERE {_match}", _value
+                ).fetchone()[0]
+        return [cache[_v] for _v in values]
+
+    def append(self, run_id, results):
+        """
+        Add the scores of run <run_id> in one transaction.
+
+        Parameters
+        ----------
+        run_id : int
+            Run id from start_run.
+
+        results : DataFrame
+            Scores with activity_database, activity_code, method and score
+            columns. Methods are Brightway method tuples.
+
+        Returns
+        -------
+        Number of rows added. Adding a score that the run already has raises
+        sqlite3.IntegrityError, and none of <results> are added.
+        """
+        try:
+            with self.connection:
+                _activities = self._ids(
+                    table="activities",
+                    columns=("activity_database", "activity_code"),
+                    cache=self._activity_ids,
+                    values=list(zip(results.activity_database, results.activity_code)),
+                )
+                _methods = self._ids(
+                    table="methods",
+                    columns=("method",),
+                    cache=self._method_ids,
+                    values=[(_method_text(_m),) for _m in results.method],
+                )
+                self.connection.executemany(
+                    "INSERT INTO results (run_id, method_id, activity_id, score) "
+                    "VALUES (?, ?, ?, ?)",
+                    zip(
+                        [run_id] * len(results),
+                        _methods,
+                        _activities,
+                        results.score.astype(float),
+                    ),
+                )
+        except sqlite3.Error:
+            # Ids added in the failed transaction were rolled back with it
+            self._activity_ids.clear()
+            self._method_ids.clear()
+            raise
+
+        return len(results)
+
+    def runs(self, workbook_hash=None, project=None, database=None):
+        """
+        Return the runs in the store, optionally filtered.
+
+        Returns
+        -------
+        DataFrame with one row per run
+        """
+        _where, _params = [], []
+        for _column, _value in (
+            ("workbook_hash", workbook_hash),
+            ("project", project),
+            ("database", database),
+        ):
+            if _value is not None:
+                _where.append(f"{_column} = ?")
+                _params.append(_value)
+
+        return pd.read_sql_query(
+            "SELECT * FROM runs"
+            + (f" WHERE {' AND '.join(_where)}" if _where else "")
+            + " ORDER BY run_id",
+            self.connection,
+            params=_params,
+        )
+
+    def query(
+        self,
+        runs=None,
+        activity_codes=None,
+        methods=None,
+        workbook_hash=None,
+        chunksize=None,
+    ):
+        """
+        Return scores, filtered by any combination of keys.
+
+        Parameters
+        ----------
+        runs : list
+            Run ids to include.
+
+        activity_codes : list
+            Activity codes to include.
+
+        methods : list
+            Brightway method tuples to include.
+
+        workbook_hash : str
+            Only include runs built from this workbook.
+
+        chunksize : int
+            If set, return an iterator of DataFrames with at most this many
+            rows each instead of one DataFrame.
+
+        Returns
+        -------
+        DataFrame, or iterator of DataFrames, with run_id, workbook_hash,
+        scenario, activity_database, activity_code, method and score columns
+        """
+        _where, _params = [], []
+        # Lists are passed as one JSON parameter, so their length isn't limited
+        for _column, _values in (
+            ("r.run_id", runs),
+            ("a.activity_code", activity_codes),
+            ("m.method", None if methods is None else map(_method_text, methods)),
+        ):
+            if _values is not None:
+                _where.append(f"{_column} IN (SELECT value FROM json_each(?))")
+                _params.append(json.dumps(list(_values)))
+        if workbook_hash is not None:
+            _where.append("runs.workbook_hash = ?")
+            _params.append(workbook_hash)
+
+        _results = pd.read_sql_query(
+            _SELECT + (f" WHERE {' AND '.join(_where)}" if _where else ""),
+            self.connection,
+            params=_params,
+            chunksize=chunksize,
+        )
+
+        if chunksize is None:
+            _results["method"] = _results.method.map(_method_tuple)
+            return _results
+
+        return (
+            _chunk.assign(method=_chunk.method.map(_method_tuple))
+            for _chunk in _results
+        )
+
+    def compare(self, method, runs=None, activity_codes=None):
+        """
+        Compare the scores of activities across runs for one method.
+
+        Parameters
+        ----------
+        method : tuple
+            Brightway method.
+
+        runs : list
+            Run ids to compare. Defaults to all runs with results for <method>.
+
+        activity_codes : list
+            Activity codes to include. Defaults to all.
+
+        Returns
+        -------
+        DataFrame indexed by activity database and code with one column of
+        scores per run
+        """
+        return self.query(
+            runs=runs, activity_codes=activity_codes, methods=[method]
+        ).pivot(
+            index=["activity_database", "activity_code"],
+            columns="run_id",
+            values="score",
+        )
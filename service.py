@@ -0,0 +1,280 @@
+"""
+Created on October 19 2026.
+
+Long-running autoBW service.
+
+Opens a Brightway project once and accepts build and calculate jobs over HTTP on
+localhost, so that repeated runs don't pay for interpreter start-up, importing
+Brightway and opening the project. Activities copied from background databases
+are cached between jobs. Jobs run one at a time.
+
+@author: rhanes
+"""
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from local_project import LocalProject
+
+DEFAULT_PORT = 8765
+
+ACTIONS = ("build", "calculate")
+
+
+class AutoBWService:
+    """
+    Keep a Brightway project open and run jobs against it.
+
+    Jobs are JSON objects POSTed to /jobs::
+
+        {"action": "build", "caseconfig": "caseconfig.yaml", "workbook": "model.xlsx"}
+
+    ``caseconfig`` is the case study config for the job; relative paths are
+    resolved against the data directory. ``workbook`` optionally replaces the
+    config's fg_db_import and, like it, is relative to the data directory; it
+    is ignored if the config lists several foreground databases, which are
+    built as a batch. The job's project must be the project the service was
+    started with. GET /status reports on the service.
+    """
+
+    def __init__(self, project, logging, host="127.0.0.1", port=DEFAULT_PORT):
+        """
+        Open the HTTP server.
+
+        Parameters
+        ----------
+        project : LocalProject
+            Project opened with build=False.
+
+        logging
+            logger object for writing status messages to file
+
+        host : str
+            Address to listen on. The service has no authentication and should
+            only listen on the loopback interface.
+
+        port : int
+            Port to listen on.
+        """
+        self.project = project
+        self.logging = logging
+
+        # Copied background activities, kept between jobs
+        self.background_cache = {}
+
+        self.jobs = Counter()
+        self._started = time.time()
+
+        # Brightway and SQLite writes are not safe to run concurrently
+        self._lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer((host, port), _JobHandler)
+        self.server.service = self
+
+    def run_job(self, job):
+        """
+        Run one build or calculate job.
+
+        Parameters
+        ----------
+        job : dict
+            Job description; see the class docstring.
+
+        Returns
+        -------
+        Dictionary describing the result
+        """
+        _action = job.get("action", "build")
+        if _action not in ACTIONS:
+            raise ValueError(f"Unknown action {_action}; expected one of {ACTIONS}")
+
+        if not job.get("caseconfig"):
+            raise ValueError("Job has no caseconfig")
+
+        _caseconfig = LocalProject.read_config(
+            os.path.join(self.project.file_io["data_directory"], job["caseconfig"]),
+            logging=self.logging,
+        )
+        _proj_params = _caseconfig.get("project_parameters", {})
+
+        if _proj_params.get("name") != self.project.proj_params.get("name"):
+            raise ValueError(
+                f"Job project {_proj_params.get('name')} is not the service project "
+                f"{self.project.proj_params.get('name')}"
+            )
+
+        _start = time.perf_counter()
+
+        with self._lock:
+            # Databases may have been imported since the last job
+            self.project.session.refresh()
+            _missing = [
+                _db
+                for _db in _proj_params.get("include_databases") or []
+                if _db not in self.project.session.databases
+            ]
+            if _missing:
+                raise ValueError(f"{_missing} must be imported before proceeding")
+
+            if _action == "build" and isinstance(
+                _caseconfig.get("foreground_db"), list
+            ):
+                _summary = self.project.build_batch(
+                    foregrounds=_caseconfig["foreground_db"]
+                )
+                _result = {"databases": _summary.to_dict(orient="records")}
+            elif _action == "build":
+                _foreground = dict(_caseconfig.get("foreground_db", {}))
+                if job.get("workbook"):
+                    _foreground["fg_db_import"] = job["workbook"]
+
+                _fdb = self.project.build_foreground(
+                    foreground=_foreground, background_cache=self.background_cache
+                )
+                _result = {
+                    "database": _foreground.get("name"),
+                    "activities": len(_fdb.custom_db),
+                    "exchanges": sum(
+                        len(_act["exchanges"]) for _act in _fdb.custom_db.values()
+                    ),
+                }
+            else:
+                _result = {"results": self.project.calculations()}
+
+            self.jobs[_action] += 1
+
+        _result.update(
+            {
+                "status": "ok",
+                "action": _action,
+                "elapsed": time.perf_counter() - _start,
+            }
+        )
+        self.logging.info(
+            "AutoBWService.run_job: %s job finished in %.3f s",
+            _action,
+            _result["elapsed"],
+        )
+
+        return _result
+
+    def status(self):
+        """Return a dictionary describing the service."""
+        return {
+            "status": "ok",
+            "project": self.project.proj_params.get("name"),
+            "uptime": time.time() - self._started,
+            "jobs": dict(self.jobs),
+            "busy": self._lock.locked(),
+            "cached_activities": {
+                _db: len(_entry["activities"])
+                for _db, _entry in self.background_cache.items()
+            },
+        }
+
+    def serve_forever(self):
+        """Serve jobs until interrupted."""
+        _host, _port = self.server.server_address[:2]
+        self.logging.info(
+            "AutoBWService: serving project %s on http://%s:%d",
+            self.project.proj_params.get("name"),
+            _host,
+            _port,
+        )
+        print(f"autoBW service listening on http://{_host}:{_port}")
+
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
+            self.logging.info("AutoBWService: stopped")
+
+
+class _JobHandler(BaseHTTPRequestHandler):
+    """Translate HTTP requests into AutoBWService calls."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Report service status."""
+        if self.path.rstrip("/") != "/status":
+            self._reply(404, {"status": "error", "error": "not found"})
+            return
+
+        self._reply(200, self.server.service.status())
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Run a job."""
+        if self.path.rstrip("/") != "/jobs":
+            self._reply(404, {"status": "error", "error": "not found"})
+            return
+
+        _service = self.server.service
+
+        try:
+            _length = int(self.headers.get("Content-Length", 0))
+            _job = json.loads(self.rfile.read(_length) or b"{}")
+            self._reply(200, _service.run_job(_job))
+        except (ValueError, KeyError) as _e:
+            _service.logging.error("AutoBWService: rejected job: %s", _e)
+            self._reply(400, {"status": "error", "error": str(_e)})
+        except SystemExit as _e:
+            # Pipeline errors exit after logging; keep the service running
+            _service.logging.error("AutoBWService: job failed: %s", _e)
+            self._reply(422, {"status": "error", "error": str(_e)})
+        except Exception as _e:  # pylint: disable=broad-except
+            _service.logging.exception("AutoBWService: job failed")
+            self._reply(500, {"status": "error", "error": repr(_e)})
+
+    def _reply(self, code, body):
+        _body = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(_body)))
+        self.end_headers()
+        self.wfile.write(_body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Write request lines to the log file instead of stderr."""
+        self.server.service.logging.debug("AutoBWService: " + format, *args)
+
+
+def submit_job(job, host="127.0.0.1", port=DEFAULT_PORT, timeout=None):
+    """
+    Submit a job to a running service and wait for the result.
+
+    Parameters
+    ----------
+    job : dict
+        Job description; see AutoBWService.
+
+    host : str
+        Address the service is listening on.
+
+    port : int
+        Port the service is listening on.
+
+    timeout : float
+        Seconds to wait for the result. Waits indefinitely if None.
+
+    Returns
+    -------
+    Dictionary describing the result
+    """
+    _request = urllib.request.Request(
+        url=f"http://{host}:{port}/jobs",
+        data=json.dumps(job).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+
+    try:
+        with urllib.request.urlopen(_request, timeout=timeout) as _response:
+            return json.load(_response)
+    except urllib.error.HTTPError as _e:
+        return json.load(_e)
@@ -0,0 +1,259 @@
+"""
+Created on October 19 2026.
+
+Split a foreground database into shards written as separate Brightway databases.
+
+Brightway processes and loads a database as a whole. Splitting a large
+foreground database into shards, e.g. by region, lets each shard be processed
+on its own. Exchanges between shards are rewritten to point at the shard that
+holds their input. The foreground database itself keeps the activities without
+a shard and lists its shards in its registry entry.
+
+Shards that are unchanged since the last build are not written again.
+
+@author: rhanes
+"""
+import pandas as pd
+import brightway2 as bw
+from bw2data import mapping
+
+
+def shard_name(database, shard):
+    """Return the name of the Brightway database holding <shard> of <database>."""
+    return f"{database} - {shard}"
+
+
+def _shard_exchange(exchange, shard_of):
+    """Copy <exchange>, pointing its input at the shard that holds it."""
+    # The output is set when the shard is written; copied activities may still
+    # record their source database as the output
+    _exchange = {_k: _v for _k, _v in exchange.items() if _k != "output"}
+    if _exchange.get("input") in shard_of:
+        _exchange["input"] = (shard_of[_exchange["input"]], _exchange["input"][1])
+    return _exchange
+
+
+def assign_shards(custom_db, name, values, by_location=False):
+    """
+    Return the database each activity of a foreground database is moved to.
+
+    Parameters
+    ----------
+    custom_db : dict
+        Database in Brightway dictionary (pre-import) format.
+
+    name : str
+        Name of the foreground database, which keeps activities without a shard.
+
+    values : dict
+        Shard of each created activity, by key; missing values mean no shard.
+
+    by_location : Boolean
+        Whether activities not in <values> go to the shard of their location.
+
+    Returns
+    -------
+    Dictionary of database names, by activity key
+    """
+    _shard_of = {}
+    for _key, _act in custom_db.items():
+        _value = values.get(_key)
+        if _key not in values and by_location:
+            _value = _act.get("location")
+        _shard_of[_key] = name if pd.isna(_value) else shard_name(name, _value)
+    return _shard_of
+
+
+def cross_shard_exchanges(shards):
+    """Return the number of exchanges whose input is in another shard."""
+    return sum(
+        _ex["input"][0] in shards and _ex["input"][0] != _database
+        for _database, _data in shards.items()
+        for _act in _data.values()
+        for _ex in _act["exchanges"]
+    )
+
+
+def split_shards(custom_db, shard_of):
+    """
+    Split a database dictionary into shards.
+
+    Parameters
+    ----------
+    custom_db : dict
+        Database in Brightway dictionary (pre-import) format.
+
+    shard_of : dict
+        Name of the database each activity in <custom_db> is moved to, by key.
+
+    Returns
+    -------
+    Dictionary of shard databases in dictionary format, by database name
+    """
+    _shards = {}
+    for _key, _act in custom_db.items():
+        _database = shard_of[_key]
+        _shards.setdefault(_database, {})[(_database, _key[1])] = dict(
+            _act,
+            database=_database,
+            exchanges=[
+                _shard_exchange(exchange=_ex, shard_of=shard_of)
+                for _ex in _act.get("exchanges", [])
+            ],
+        )
+
+    return _shards
+
+
+def write_shards(session, name, shards, logging):
+    """
+    Write the shards of foreground database <name>, skipping unchanged shards.
+
+    Shards from an earlier build that no longer have any activities are
+    deleted.
+
+    Parameters
+    ----------
+    session : ProjectSession
+        Open session of the Brightway project.
+
+    name : str
+        Name of the foreground database.
+
+    shards : dict
+        Shard databases by name, as returned by split_shards. Activities
+        without a shard are in the database called <name>.
+
+    logging
+        logger object for writing status messages to file
+    """
+    shards = dict(shards)
+    shards.setdefault(name, {})
+
+    # Shards refer to each other, so all keys must be known before processing
+    mapping.add([_key for _data in shards.values() for _key in _data])
+
+    _previous = (
+        set(bw.databases[name].get("shards", []))
+        if name in session.databases
+        else set()
+    )
+
+    _written = []
+    for _database, _data in shards.items():
+        if session.unchanged(name=_database, data=_data):
+            continue
+
+        session.replace_database(
+            name=_database,
+            data=_data,
+            metadata={"shards": sorted(set(shards) - {name})}
+            if _database == name
+            else None,
+        )
+        _written.append(_database)
+
+    # The shard list changes without the base database's contents changing
+    if name not in _written and _previous != set(shards) - {name}:
+        bw.databases[name]["shards"] = sorted(set(shards) - {name})
+        bw.databases.flush()
+
+    for _database in sorted(_previous - set(shards)):
+        session.delete_database(name=_database)
+
+    logging.info(
+        "write_shards: %s has %d shards; wrote %d, %d unchanged, deleted %d",
+        name,
+        len(shards) - 1,
+        len(_written),
+        len(shards) - len(_written),
+        len(_previous - set(shards)),
+    )
+
+
+def is_sharded(session, name, shards):
+    """Return True if foreground <name> is written as shards, now or from before."""
+    return shards is not None or bool(
+        name in session.databases and bw.databases[name].get("shards")
+    )
+
+
+def planned_databases(session, name, custom_db, shards):
+    """
+    Return what write_foreground would write for foreground database <name>.
+
+    Parameters
+    ----------
+    session : ProjectSession
+        Open session of the Brightway project.
+
+    name : str
+        Name of the foreground database.
+
+    custom_db : dict
+        Assembled foreground database in dictionary format.
+
+    shards : dict
+        Shards of <custom_db> as returned by split_shards, or None if the
+        foreground database isn't sharded.
+
+    Returns
+    -------
+    Tuple of the databases <name> is written as, in dictionary format by name;
+    the names of those that would be written, leaving out unchanged shards;
+    and the names of the databases now in the project for <name>, i.e. <name>
+    and its shards
+    """
+    _current = (
+        [name] + list(bw.databases[name].get("shards", []))
+        if name in session.databases
+        else []
+    )
+    _current = [_database for _database in _current if _database in session.databases]
+
+    if not is_sharded(session=session, name=name, shards=shards):
+        return {name: custom_db}, [name], _current
+
+    _databases = dict(shards if shards is not None else {name: custom_db})
+    _databases.setdefault(name, {})
+    _written = [
+        _database
+        for _database, _data in _databases.items()
+        if not session.unchanged(name=_database, data=_data)
+    ]
+    return _databases, _written, _current
+
+
+def write_foreground(session, name, custom_db, shards, logging):
+    """
+    Write foreground database <name>, as shards if it has any now or had before.
+
+    Parameters
+    ----------
+    session : ProjectSession
+        Open session of the Brightway project.
+
+    name : str
+        Name of the foreground database.
+
+    custom_db : dict
+        Assembled foreground database in dictionary format.
+
+    shards : dict
+        Shards of <custom_db> as returned by split_shards, or None if the
+        foreground database isn't sharded.
+
+    logging
+        logger object for writing status messages to file
+    """
+    if is_sharded(session=session, name=name, shards=shards):
+        # Also removes the shards of a foreground database that is no longer
+        # sharded
+        write_shards(
+            session=session,
+            name=name,
+            shards=shards if shards is not None else {name: custom_db},
+            logging=logging,
+        )
+    else:
+        session.replace_database(name=name, data=custom_db)
@@ -0,0 +1,167 @@
+"""
+Created on October 19 2026.
+
+Supply-chain graph of an assembled foreground database.
+
+The technosphere links between foreground activities are indexed as integer
+adjacency arrays (CSR) in both directions, so that supply chains, cycles and
+the activities affected by a change can be found in time linear in the number
+of links.
+
+@author: rhanes
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+
+# Exchange types that link an activity to the activity supplying its input
+LINK_TYPES = ("technosphere", "substitution")
+
+
+class SupplyGraph:
+    """
+    Index of the technosphere links between activities in a database dictionary.
+
+    A link runs from the supplying activity to the consuming activity. Links to
+    activities in other databases are counted but not indexed. Inputs that refer
+    to the foreground database but to no activity in it are kept as dangling
+    inputs.
+    """
+
+    def __init__(self, custom_db):
+        """
+        Build the adjacency index.
+
+        Parameters
+        ----------
+        custom_db : dict
+            Database in Brightway dictionary (pre-import) format.
+        """
+        self.keys = pd.Index(list(custom_db), dtype=object, tupleize_cols=False)
+
+        _links = [
+            (_consumer, _ex.get("input"))
+            for _consumer, _act in enumerate(custom_db.values())
+            for _ex in _act.get("exchanges", [])
+            if _ex.get("type") in LINK_TYPES
+        ]
+        _consumers = np.fromiter((_l[0] for _l in _links), dtype=np.int64)
+        _inputs = pd.Index([_l[1] for _l in _links], dtype=object, tupleize_cols=False)
+        _suppliers = self.keys.get_indexer(_inputs)
+
+        _internal = _suppliers != -1
+        _databases = {_key[0] for _key in self.keys}
+        _dangling = np.flatnonzero(
+            ~_internal
+            & np.fromiter(
+                (
+                    isinstance(_input, tuple) and _input[0] in _databases
+                    for _input in _inputs
+                ),
+                dtype=bool,
+                count=len(_inputs),
+            )
+        )
+
+        self.dangling = [(self.keys[_consumers[_i]], _inputs[_i]) for _i in _dangling]
+        self.external_links = int((~_internal).sum()) - len(_dangling)
+
+        _suppliers, _consumers = _suppliers[_internal], _consumers[_internal]
+        _n = len(self.keys)
+
+        # downstream: supplier row -> consumer columns; upstream: the transpose
+        self.downstream = sparse.csr_matrix(
+            (np.ones(len(_suppliers), dtype=bool), (_suppliers, _consumers)),
+            shape=(_n, _n),
+        )
+        self.upstream = self.downstream.T.tocsr()
+
+        self._self_loops = np.unique(_suppliers[_suppliers == _consumers])
+        self.self_loops = self.keys[self._self_loops].tolist()
+
+    @property
+    def links(self):
+        """Return the number of links between distinct foreground activities."""
+        return self.downstream.nnz - len(self.self_loops)
+
+    def _reach(self, adjacency, keys):
+        """Return a mask of activities reachable from <keys> through <adjacency>."""
+        keys = list(keys)
+        _start = self.keys.get_indexer(
+            pd.Index(keys, dtype=object, tupleize_cols=False)
+        )
+        if (_start == -1).any():
+            raise KeyError(
+                f"{[_k for _k, _i in zip(keys, _start) if _i == -1]} are not in "
+                f"the graph"
+            )
+
+        _visited = np.zeros(len(self.keys), dtype=bool)
+        _visited[_start] = True
+        _frontier = np.unique(_start)
+
+        # Each activity enters the frontier once, so every row is read once
+        while _frontier.size:
+            _next = np.unique(adjacency[_frontier].indices)
+            _frontier = _next[~_visited[_next]]
+            _visited[_frontier] = True
+
+        return _visited
+
+    def supply_chain(self, keys):
+        """
+        Return the foreground activities that <keys> depend on, directly or not.
+
+        Parameters
+        ----------
+        keys : list
+            Activity keys to start from. They are included in the result.
+
+        Returns
+        -------
+        List of activity keys
+        """
+        return self.keys[self._reach(self.upstream, keys)].tolist()
+
+    def affected(self, keys):
+        """
+        Return the foreground activities whose results change if <keys> change.
+
+        Parameters
+        ----------
+        keys : list
+            Keys of changed activities. They are included in the result.
+
+        Returns
+        -------
+        List of activity keys
+        """
+        return self.keys[self._reach(self.downstream, keys)].tolist()
+
+    def cycles(self):
+        """
+        Find groups of activities that supply each other.
+
+        Groups are the strongly connected components with more than one
+        activity, plus activities that supply themselves.
+
+        Returns
+        -------
+        List of lists of activity keys
+        """
+        _n_components, _labels = csgraph.connected_components(
+            self.downstream, directed=True, connection="strong"
+        )
+        _sizes = np.bincount(_labels, minlength=_n_components)
+
+        # Nodes grouped by component in one sort, split at the component sizes
+        _groups = np.split(np.argsort(_labels, kind="stable"), np.cumsum(_sizes)[:-1])
+        _cycles = [
+            self.keys[_groups[_label]].tolist() for _label in np.flatnonzero(_sizes > 1)
+        ]
+        _cycles.extend(
+            [self.keys[_i]] for _i in self._self_loops if _sizes[_labels[_i]] == 1
+        )
+
+        return _cycles
@@ -0,0 +1,286 @@
+"""
+Created on October 19 2026.
+
+Rebuild the foreground database whenever its import file or configs change.
+
+The watcher keeps the Brightway project open, the sheets of the import file
+already read, the background activities already copied and the foreground
+database last written. The import file and both config files are polled for
+changes. When the import file is saved, only the sheets whose cells changed
+are read again, and only the activities that changed are written to the
+project.
+
+@author: rhanes
+"""
+import hashlib
+import os
+import posixpath
+import re
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+
+import brightway2 as bw
+
+from foreground_database import SHEETS, ForegroundDatabase
+from local_project import LocalProject
+
+# Seconds between checks for changed files
+POLL_INTERVAL = 1.0
+
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+def sheet_fingerprints(fpath):
+    """
+    Return a hash of the cells of each sheet of an .xlsx file, by sheet name.
+
+    The sheets' XML is hashed together with the shared strings that it refers
+    to, so a sheet's hash only changes when its own cells do. Selections and
+    other view settings are ignored. This is much faster than reading the
+    sheets into DataFrames.
+
+    Parameters
+    ----------
+    fpath : path
+        Import file.
+
+    Returns
+    -------
+    Dictionary of hashes by sheet name, or None if the file can't be read,
+    e.g. because it is being saved
+    """
+    try:
+        with zipfile.ZipFile(fpath) as _zip:
+            _members = set(_zip.namelist())
+            _workbook = ET.fromstring(_zip.read("xl/workbook.xml"))
+            _targets = {
+                _rel.get("Id"): _rel.get("Target")
+                for _rel in ET.fromstring(_zip.read("xl/_rels/workbook.xml.rels"))
+            }
+            _strings = (
+                re.findall(
+                    rb"<si>.*?</si>|<si/>", _zip.read("xl/sharedStrings.xml"), re.S
+                )
+                if "xl/sharedStrings.xml" in _members
+                else []
+            )
+
+            _fingerprints = {}
+            for _sheet in _workbook.iter(f"{{{_MAIN_NS}}}sheet"):
+                _target = _targets[_sheet.get(f"{{{_REL_NS}}}id")]
+                _xml = _zip.read(
+                    _target.lstrip("/")
+                    if _target.startswith("/")
+                    else posixpath.normpath(posixpath.join("xl", _target))
+                )
+                _xml = re.sub(rb"<sheetViews>.*?</sheetViews>", b"", _xml, flags=re.S)
+
+                _hash = hashlib.sha1(_xml)
+                for _i in re.findall(rb'<c [^>]*t="s"[^>]*>\s*<v>(\d+)</v>', _xml):
+                    _hash.update(_strings[int(_i)])
+                _fingerprints[_sheet.get("name")] = _hash.hexdigest()
+    except (OSError, KeyError, IndexError, zipfile.BadZipFile, ET.ParseError):
+        return None
+
+    return _fingerprints
+
+
+class Watcher:
+    """Keep a foreground database up to date with its import file."""
+
+    def __init__(self, project, args, logging, interval=POLL_INTERVAL):
+        """
+        Set up the watcher for an open project.
+
+        Parameters
+        ----------
+        project : LocalProject
+            Project opened with build=False.
+
+        args : argparse.Namespace
+            Parsed command line arguments, giving the config files.
+
+        logging
+            logger object for writing status messages to file
+
+        interval : float
+            Seconds between checks for changed files.
+        """
+        self.project = project
+        self.logging = logging
+        self.interval = interval
+
+        self.bwconfig = os.path.join(args.data, args.bwconfig)
+        self.caseconfig = os.path.join(args.data, args.caseconfig)
+        self._bwconfig = project.bwconfig
+
+        # Copied background activities, kept between builds
+        self.background_cache = {}
+
+        # Sheets read from the import file and the hashes they were read at
+        self.frames = {}
+        self.fingerprints = {}
+        self.foreground = None
+        self.workbook = None
+
+        # Foreground database last written and its registry content hash
+        self.written = None
+        self.written_hash = None
+
+        self.builds = 0
+
+    def files(self):
+        """Return the paths of the watched files."""
+        return [self.bwconfig, self.caseconfig] + (
+            [self.workbook] if self.workbook else []
+        )
+
+    def _stat(self):
+        _stat = {}
+        for _path in self.files():
+            try:
+                _stat[_path] = (os.stat(_path).st_mtime_ns, os.stat(_path).st_size)
+            except OSError:
+                _stat[_path] = None
+        return _stat
+
+    def build(self):
+        """
+        Rebuild the foreground database if the import file or config changed.
+
+        Returns
+        -------
+        False if the files couldn't be read and should be checked again,
+        True otherwise
+        """
+        # Config files that are being saved are read again next time
+        try:
+            _bwconfig = LocalProject.read_config(self.bwconfig, logging=self.logging)
+            _caseconfig = LocalProject.read_config(
+                self.caseconfig, logging=self.logging
+            )
+        except SystemExit:
+            return False
+
+        if _bwconfig != self._bwconfig:
+            self.logging.warning(
+                "Watcher.build: %s changed; restart to use the new settings",
+                self.bwconfig,
+            )
+
+        if _caseconfig.get("project_parameters") != self.project.proj_params:
+            self.logging.warning(
+                "Watcher.build: project_parameters in %s changed; restart to use "
+                "the new settings",
+                self.caseconfig,
+            )
+
+        _foreground = _caseconfig.get("foreground_db") or {}
+        if not isinstance(_foreground, dict):
+            self.logging.error(
+                msg="Watcher.build: --watch builds one foreground database, not a list"
+            )
+            return True
+
+        _workbook = os.path.join(
+            self.project.file_io["data_directory"],
+            _foreground.get("fg_db_import") or "",
+        )
+        self.workbook = _workbook
+        _fingerprints = sheet_fingerprints(_workbook)
+        if _fingerprints is None:
+            return False
+
+        # Backfilled values come from the config, so it applies to every sheet
+        _changed = [
+            _sheet
+            for _sheet in SHEETS
+            if _foreground != self.foreground
+            or _sheet not in self.frames
+            or _fingerprints.get(_sheet) != self.fingerprints.get(_sheet)
+        ]
+        if not _changed:
+            self.logging.info("Watcher.build: No sheets changed")
+            return True
+
+        _start = time.perf_counter()
+        _name = _foreground.get("name")
+        try:
+            self.frames.update(
+                ForegroundDatabase.read_workbook(
+                    fpath=_workbook, fg_dict=_foreground, sheets=_changed
+                )
+            )
+            self.fingerprints = _fingerprints
+            self.foreground = _foreground
+
+            _fdb = ForegroundDatabase(
+                logging=self.logging,
+                prj_dict=self.project.proj_params,
+                fg_dict=dict(_foreground, checkpoint=False),
+                file_io=self.project.file_io,
+                background_cache=self.background_cache,
+                write=False,
+                session=self.project.session,
+                frames=self.frames,
+            )
+        except (SystemExit, ValueError) as _e:
+            # Errors are logged before ForegroundDatabase exits; keep watching
+            self.logging.error(msg=f"Watcher.build: {_name} was not rebuilt: {_e}")
+            print(f"autoBW: {_name} was not rebuilt; check the log file")
+            return True
+
+        # Only the changed activities are written if the project still holds
+        # the database this watcher wrote last
+        _session = self.project.session
+        if (
+            self.written is not None
+            and _fdb.shards is None
+            and _name in _session.databases
+            and not bw.databases[_name].get("shards")
+            and bw.databases[_name].get("content_hash") == self.written_hash
+        ):
+            _diff = _session.update_database(
+                name=_name, data=_fdb.custom_db, previous=self.written
+            )
+            _summary = ", ".join(f"{len(_v)} {_k}" for _k, _v in _diff.items())
+        else:
+            _fdb.write_foreground_db(name=_name)
+            _summary = f"{len(_fdb.custom_db)} activities written"
+
+        self.written = _fdb.custom_db
+        self.written_hash = bw.databases[_name].get("content_hash")
+        self.builds += 1
+
+        self.logging.info(
+            "Watcher.build: Rebuilt %s after changes to %s in %.3f s (%s)",
+            _name,
+            _changed,
+            time.perf_counter() - _start,
+            _summary,
+        )
+        print(
+            f"autoBW rebuilt {_name} in {time.perf_counter() - _start:.1f} s "
+            f"({_summary})"
+        )
+
+        return True
+
+    def run(self):
+        """Build once, then rebuild on every change until interrupted."""
+        print(f"autoBW watching {', '.join(self.files())}")
+
+        _last = None
+        try:
+            while True:
+                _stat = self._stat()
+                if _stat != _last:
+                    # Files that can't be read yet are checked again next time
+                    _last = _stat if self.build() else None
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.logging.info("Watcher: stopped after %d builds", self.builds)